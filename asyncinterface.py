@@ -0,0 +1,141 @@
+import asyncio
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from errors import *
+from model import *
+from tools import *
+
+
+class AsyncInterface():
+    """
+    Asyncio interface to load, render, merge and export pdf files without blocking the event loop. Pages of loaded
+    PDFs stay in bank until every PDF loaded with them is given to release.
+
+    Attributes
+    ---
+    bank : PDFPageBank
+        PDFPageBank shared by all loaded pdfs.
+    generator : IDGenerator
+        IDGenerator shared by all loaded pdfs.
+    executor : concurrent.futures.Executor
+        Executor blocking work runs in, a thread pool of maxConcurrent threads by default.
+    ownsExecutor : bool
+        True if executor was created by interface and is shut down with it.
+    loadCounts : dict
+        Number of loaded PDFs not released yet with each page, by ID of page.
+    lock : threading.Lock
+        Held while loadCounts is changed, and while pages are reclaimed.
+    maxConcurrent : int
+        Maximum number of jobs in executor at once.
+    semaphores : weakref.WeakKeyDictionary
+        asyncio.Semaphores limiting jobs to maxConcurrent by event loop, created in the loop they are used in, as
+        before Python 3.10 they are bound to the loop current when created.
+
+    """
+    def __init__(self, maxConcurrent=8, executor=None):
+        self.bank = PDFPageBank()
+        self.generator = IDGenerator()
+        self.ownsExecutor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(maxConcurrent)
+        self.loadCounts = {}
+        self.lock = threading.Lock()
+        self.maxConcurrent = maxConcurrent
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    def _getSemaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self.semaphores:
+            self.semaphores[loop] = asyncio.Semaphore(self.maxConcurrent)
+        return(self.semaphores[loop])
+
+    async def _runInExecutor(self, function, *args):
+        async with self._getSemaphore():
+            return(await asyncio.get_running_loop().run_in_executor(self.executor, function, *args))
+
+    def _extractPDF(self, pdfFilePath, attachImages):
+        while True:
+            pdf = File2PDFConverter(pdfFilePath, self.generator, self.bank, attachImages).extractPDF()
+            IDs = set(pdf._getOrderedPages())
+            with self.lock:
+                if all(self.bank.contains(ID) for ID in IDs):  # Loaded again if its pages were released meanwhile
+                    for ID in IDs:
+                        self.loadCounts[ID] = self.loadCounts.get(ID, 0)+1
+                    return(pdf)
+
+    def _prerenderPages(self, pdfFilePath, tier):
+        File2PDFConverter(pdfFilePath, self.generator, None).prerenderPages(tier)
+
+    async def loadPDF(self, pdfFilePath, attachImages=False):
+        """
+        Returns PDF of the given pdf at pdfFilePath with its pages in bank, sharing pages with any identical file
+        already loaded. Pages get no images unless attachImages is true.
+
+        """
+        return(await self._runInExecutor(self._extractPDF, pdfFilePath, attachImages))
+
+    def release(self, pdf):
+        """
+        Releases pdf returned by loadPDF, reclaiming its pages from bank unless a PDF loaded with them is not
+        released yet. Returns int of number of pages reclaimed.
+
+        """
+        unreferencedIDs = []
+        with self.lock:
+            for ID in set(pdf._getOrderedPages()):
+                count = self.loadCounts.get(ID)
+                if count == 1:
+                    del self.loadCounts[ID]
+                    unreferencedIDs.append(ID)
+                elif count is not None:
+                    self.loadCounts[ID] = count-1
+            return(self.bank.reclaimPages(unreferencedIDs))
+
+    async def prerenderPages(self, pdfFilePath, tier='preview'):
+        """
+        Renders every page of pdf at pdfFilePath at resolution tier into rasterCache, in parallel processes.
+
+        """
+        await self._runInExecutor(self._prerenderPages, pdfFilePath, tier)
+
+    async def exportPDF(self, pdf, outputPath):
+        """
+        Writes pdf, as it is when called, to outputPath. Returns int of bytes saved by deduplication.
+
+        Raises
+        ---
+        FilePathNotPDF
+            Raised if outputPath does not end with a pdf extension.
+
+        """
+        converter = PDF2FileConverter(pdf.copyPDF())
+        await self._runInExecutor(converter.extractToFilePath, outputPath)
+        return(converter.bytesSaved)
+
+    async def mergePDFs(self, outputPath, inputPaths):
+        """
+        Loads pdfs at inputPaths concurrently and writes them one after the other to outputPath, releasing them once
+        written. Returns int of bytes saved by deduplication.
+
+        """
+        loads = await asyncio.gather(*[self.loadPDF(inputPath) for inputPath in inputPaths], return_exceptions=True)
+        try:
+            for loaded in loads:
+                if isinstance(loaded, BaseException):
+                    raise(loaded)
+            pdf = PDF(self.bank)
+            for loaded in loads:
+                pdf.appendEntirePDF(loaded)
+            return(await self.exportPDF(pdf, outputPath))
+        finally:
+            for loaded in loads:
+                if isinstance(loaded, PDF):
+                    self.release(loaded)
+
+    def shutdown(self):
+        """
+        Shuts down executor if it was created by interface.
+
+        """
+        if self.ownsExecutor:
+            self.executor.shutdown(wait=True)
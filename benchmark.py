@@ -0,0 +1,375 @@
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2.generic import *
+from model import *
+from tools import *
+from PIL import Image, ImageDraw
+
+
+class ListPageOrder():
+    """
+    Page order backed by a plain list the way PDF was before PageSequence, kept as a baseline to benchmark against.
+
+    Attributes
+    ---
+    orderedPages : list
+        List of ordered PDFPage IDs.
+
+    """
+    def __init__(self, orderedPages):
+        self.orderedPages = list(orderedPages)
+
+    def removePage(self, i):
+        self.orderedPages.pop(i)
+
+    def moveBeforePage(self, i, beforeThisIndex):
+        self.orderedPages = (self.orderedPages[:beforeThisIndex] +
+                             [self.orderedPages[i]] +
+                             self.orderedPages[beforeThisIndex:])
+        if i < beforeThisIndex:
+            self.removePage(i)
+        else:
+            self.removePage(i+1)
+
+    def moveAfterPage(self, i, afterThisIndex):
+        self.orderedPages = (self.orderedPages[:afterThisIndex+1] +
+                             [self.orderedPages[i]] +
+                             self.orderedPages[afterThisIndex+1:])
+        if i >= afterThisIndex:
+            self.removePage(i+1)
+        else:
+            self.removePage(i)
+
+    def copyPDF(self):
+        return(ListPageOrder(self.orderedPages))
+
+
+class SyntheticPageRaster(PageRaster):
+    """
+    PageRaster returning a synthetic letter sized page drawn at a fixed DPI instead of rendering with poppler.
+
+    Attributes
+    ---
+    dpi : int
+        DPI synthetic page is drawn at, whatever tier is requested.
+
+    """
+    def __init__(self, dpi, cache, pageNumber=0):
+        super().__init__('synthetic{}.pdf'.format(dpi), pageNumber, cache)
+        self.dpi = dpi
+
+    # Override
+    def render(self, tier='full'):
+        image = Image.new('RGB', (int(8.5*self.dpi), 11*self.dpi), 'white')
+        draw = ImageDraw.Draw(image)
+        for line in range(self.dpi, 10*self.dpi, self.dpi//4):  # Lines of "text"
+            draw.rectangle((self.dpi, line, int(7.5*self.dpi), line+self.dpi//10), fill='black')
+        return(image)
+
+
+def _timeOperation(function, repeats):
+    """
+    Returns mean microseconds per call of function over repeats calls.
+
+    """
+    return(timeit.timeit(function, number=repeats)/repeats*1e6)
+
+
+def benchmarkPageOrder(pageCounts=(10000, 100000), repeats=200, seed=0):
+    """
+    Times page order operations of PDF against the list baseline.
+
+    Parameters
+    ---
+    pageCounts : tuple <int>
+        Numbers of pages to benchmark at.
+    repeats : int
+        Number of calls timed per operation.
+    seed : int
+        Seed of random indices used, so runs are comparable.
+
+    Returns
+    ---
+    list <dict>
+        Dicts of pageCount, operation, implementation and microseconds per call.
+
+    """
+    results = []
+    for pageCount in pageCounts:
+        IDs = list(range(pageCount))
+        pdf = PDF(PDFPageBank())
+        pdf._setOrderedPages(IDs)
+        implementations = {'list': ListPageOrder(IDs), 'PageSequence': pdf}
+        for name, order in implementations.items():
+            randomGenerator = random.Random(seed)
+            randomIndex = lambda: randomGenerator.randrange(pageCount-1)
+            operations = {
+                'moveBeforePage': lambda: order.moveBeforePage(randomIndex(), randomIndex()),
+                'moveAfterPage': lambda: order.moveAfterPage(randomIndex(), randomIndex()),
+                'copyPDF': lambda: order.copyPDF(),
+                'getID': lambda: order.orderedPages[randomIndex()],
+            }
+            for operation, function in operations.items():
+                results.append({'pageCount': pageCount, 'operation': operation, 'implementation': name,
+                                'microseconds': _timeOperation(function, repeats)})
+    return(results)
+
+
+def benchmarkHighlight(dpis=(200, 300), repeats=10):
+    """
+    Times highlighting a page for move mode at each DPI, computed on every call as the editor did before highlights
+    were cached, and fetched from the cache as PageRaster.getHighlightedImage does after the first call.
+
+    Returns
+    ---
+    list <dict>
+        Dicts of dpi, path ('uncached' or 'cached') and microseconds per call.
+
+    """
+    results = []
+    for dpi in dpis:
+        raster = SyntheticPageRaster(dpi, RasterCache(1024*1024*1024))
+        image = raster.getImage()
+        raster.getHighlightedImage('full', 'move')
+        results.append({'dpi': dpi, 'path': 'uncached',
+                        'microseconds': _timeOperation(lambda: highlightImage(image, 'move'), repeats)})
+        results.append({'dpi': dpi, 'path': 'cached',
+                        'microseconds': _timeOperation(lambda: raster.getHighlightedImage('full', 'move'), repeats)})
+    return(results)
+
+
+def createSyntheticPDF(filePath, pageCount):
+    """
+    Writes a pdf of pageCount letter sized pages to filePath, each with a line of text in a font shared by all
+    pages, so benchmarks do not depend on pdfs that are not in the repository.
+
+    """
+    writer = PyPDF2.PdfFileWriter()
+    font = writer._addObject(DictionaryObject({NameObject('/Type'): NameObject('/Font'),
+                                               NameObject('/Subtype'): NameObject('/Type1'),
+                                               NameObject('/BaseFont'): NameObject('/Helvetica')}))
+    for i in range(pageCount):
+        page = writer.addBlankPage(612, 792)
+        content = DecodedStreamObject()
+        content.setData('BT /F1 24 Tf 72 720 Td (Page {}) Tj ET'.format(i+1).encode())
+        page[NameObject('/Contents')] = writer._addObject(content)
+        page[NameObject('/Resources')] = DictionaryObject(
+            {NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+    with open(filePath, 'wb') as fileStream:
+        writer.write(fileStream)
+
+
+def getPeakRSS():
+    """
+    Returns peak resident memory of process so far in KiB, None where the resource module is not available.
+
+    """
+    try:
+        import resource
+    except(ImportError):
+        return(None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return(peak//1024 if sys.platform == 'darwin' else peak)  # Bytes on macOS, KiB elsewhere
+
+
+def _timeOnce(function):
+    start = time.perf_counter()
+    function()
+    return((time.perf_counter()-start)*1e6)
+
+
+def _benchmarkPageCount(pageCount, repeats, versions, navigations, seed, directory):
+    """
+    Returns list of dicts of pageCount, operation and microseconds per call of every path timed on a synthetic pdf
+    of pageCount pages, and peak resident memory of process in KiB once done.
+
+    """
+    randomGenerator = random.Random(seed)
+    randomIndex = lambda: randomGenerator.randrange(pageCount)
+    filePath = os.path.join(directory, 'synthetic{}.pdf'.format(pageCount))
+    createSyntheticPDF(filePath, pageCount)
+    readerPool.readers.clear()  # Times a cold open rather than a pooled reader
+    bank = PDFPageBank()
+    loaded = []
+    timings = [('extractPDF', _timeOnce(lambda: loaded.append(
+        File2PDFConverter(filePath, IDGenerator(), bank).extractPDF())))]
+    pdf = loaded[0]
+    timings.append(('getPage', _timeOperation(lambda: pdf.getPage(randomIndex()), repeats)))
+    cache = RasterCache(1024*1024*1024)
+    for page in pdf:
+        page.setImage(SyntheticPageRaster(RESOLUTION_TIERS['preview'], cache, page.getID()))
+    visited = randomGenerator.sample(range(pageCount), min(navigations, pageCount))
+    for operation in ('getImageMiss', 'getImageHit'):
+        timings.append((operation, _timeOnce(
+            lambda: [pdf.getPage(i).getImage('preview') for i in visited])/len(visited)))
+    timings.append(('moveBeforePage', _timeOperation(
+        lambda: pdf.moveBeforePage(randomIndex(), randomIndex()), repeats)))
+    timings.append(('moveAfterPage', _timeOperation(
+        lambda: pdf.moveAfterPage(randomIndex(), randomIndex()), repeats)))
+    timings.append(('copyPDF', _timeOperation(lambda: pdf.copyPDF(), repeats)))
+    recorder = PDFHistoryRecorder()
+    recorder.newVersion(pdf)
+    for version in range(versions):
+        pdf.moveBeforePage(randomIndex(), randomIndex())
+        recorder.newVersion(pdf)
+    timings.append(('undo', _timeOnce(lambda: [recorder.previousVersion() for i in range(versions)])/versions))
+    timings.append(('redo', _timeOnce(lambda: [recorder.laterVersion() for i in range(versions)])/versions))
+    outputPath = os.path.join(directory, 'exported{}.pdf'.format(pageCount))
+    timings.append(('export', _timeOnce(lambda: PDF2FileConverter(pdf).extractToFilePath(outputPath))))
+    results = [{'pageCount': pageCount, 'operation': operation, 'microseconds': microseconds}
+               for operation, microseconds in timings]
+    return((results, getPeakRSS()))
+
+
+def benchmarkPaths(pageCounts=(10, 1000, 10000), repeats=100, versions=100, navigations=20, seed=0,
+                   directory=None, isolate=True):
+    """
+    Times the load, navigate, edit, copy, undo and redo, and export paths on synthetic pdfs of each page count.
+    Navigating is timed as getting random pages, and their preview images the first time, rendered from synthetic
+    PageRasters, and again from the cache.
+
+    Parameters
+    ---
+    pageCounts : tuple <int>
+        Numbers of pages of synthetic pdfs.
+    repeats : int
+        Number of calls timed per page order operation. Loading and exporting are timed once per page count.
+    versions : int
+        Length of chain of versions timed undoing and redoing.
+    navigations : int
+        Number of different pages whose images are timed, at most page count.
+    seed : int
+        Seed of random indices used, so runs are comparable.
+    directory : str
+        Directory to write synthetic and exported pdfs to, a temporary directory by default.
+    isolate : bool
+        If true, each page count is benchmarked in a new process, so its peak RSS is its own.
+
+    Returns
+    ---
+    list <dict>
+        Dicts of pageCount, operation, microseconds per call and peakRSS in KiB of process page count was
+        benchmarked in.
+
+    """
+    temporaryDirectory = None
+    if directory is None:
+        temporaryDirectory = tempfile.TemporaryDirectory()
+        directory = temporaryDirectory.name
+    results = []
+    try:
+        for pageCount in pageCounts:
+            arguments = (pageCount, repeats, versions, navigations, seed, directory)
+            if isolate:
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    pageResults, peakRSS = executor.submit(_benchmarkPageCount, *arguments).result()
+            else:
+                pageResults, peakRSS = _benchmarkPageCount(*arguments)
+            for result in pageResults:
+                result['peakRSS'] = peakRSS
+            results.extend(pageResults)
+    finally:
+        if temporaryDirectory is not None:
+            temporaryDirectory.cleanup()
+    return(results)
+
+
+def _getCommit():
+    try:
+        return(subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip())
+    except(OSError, subprocess.CalledProcessError):
+        return(None)
+
+
+def saveResults(results, filePath):
+    """
+    Writes results to filePath as JSON, along with the commit, python version and platform they were measured on.
+
+    """
+    with open(filePath, 'w') as fileStream:
+        json.dump({'commit': _getCommit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, fileStream, indent=1)
+
+
+def compareResults(baselinePath, results):
+    """
+    Returns list of dicts of pageCount, operation, baseline and current microseconds and their ratio, for each
+    operation timed both in results and in JSON result file at baselinePath written by saveResults, followed by
+    baseline and current peak RSS in KiB of each page count measured in both.
+
+    """
+    with open(baselinePath) as baselineStream:
+        baseline = json.load(baselineStream)
+    baselineTimes = {(result['pageCount'], result['operation']): result['microseconds']
+                     for result in baseline['results']}
+    baselineRSS = {result['pageCount']: result['peakRSS'] for result in baseline['results'] if result.get('peakRSS')}
+    comparison = []
+    for result in results:
+        key = (result['pageCount'], result['operation'])
+        if key in baselineTimes:
+            comparison.append({'pageCount': key[0], 'operation': key[1], 'baseline': baselineTimes[key],
+                               'current': result['microseconds'], 'ratio': result['microseconds']/baselineTimes[key]})
+    currentRSS = {result['pageCount']: result['peakRSS'] for result in results if result.get('peakRSS')}
+    for pageCount in currentRSS:
+        if pageCount in baselineRSS:
+            comparison.append({'pageCount': pageCount, 'operation': 'peakRSS (KiB)', 'baseline': baselineRSS[pageCount],
+                               'current': currentRSS[pageCount],
+                               'ratio': currentRSS[pageCount]/baselineRSS[pageCount]})
+    return(comparison)
+
+
+def _createParser():
+    parser = argparse.ArgumentParser(prog='benchmark', description='Benchmark SimplePDF.')
+    parser.add_argument('--output', help='JSON file to save path results to, none are saved by default.')
+    parser.add_argument('--compare', help='JSON file of earlier results to compare path results with.')
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 1000, 10000],
+                        help='Page counts of synthetic pdfs, 10 1000 10000 by default.')
+    parser.add_argument('--micro', action='store_true', help='Also run page order and highlight benchmarks.')
+    return(parser)
+
+
+if __name__ == '__main__':
+    arguments = _createParser().parse_args()
+    results = benchmarkPaths(tuple(arguments.pages))
+    print('{:>10} {:>16} {:>16}'.format('pages', 'operation', 'time (us)'))
+    for result in results:
+        print('{:>10} {:>16} {:>16.2f}'.format(result['pageCount'], result['operation'], result['microseconds']))
+    for pageCount in arguments.pages:
+        peakRSS = next(result['peakRSS'] for result in results if result['pageCount'] == pageCount)
+        print('{:>10} {:>16} {:>16}'.format(pageCount, 'peakRSS (KiB)', peakRSS))
+    if arguments.output is not None:
+        saveResults(results, arguments.output)
+    if arguments.compare is not None:
+        print()
+        print('{:>10} {:>16} {:>16} {:>16} {:>8}'.format('pages', 'operation', 'baseline', 'current',
+                                                          'ratio'))
+        for row in compareResults(arguments.compare, results):
+            print('{:>10} {:>16} {:>16.2f} {:>16.2f} {:>8.2f}'.format(row['pageCount'], row['operation'],
+                                                                     row['baseline'], row['current'], row['ratio']))
+    if arguments.micro:
+        print()
+        print('{:>10} {:>16} {:>14} {:>14}'.format('pages', 'operation', 'list (us)', 'sequence (us)'))
+        results = benchmarkPageOrder()
+        for listResult, sequenceResult in zip(*[[result for result in results if result['implementation'] == name]
+                                               for name in ('list', 'PageSequence')]):
+            print('{:>10} {:>16} {:>14.2f} {:>14.2f}'.format(listResult['pageCount'], listResult['operation'],
+                                                             listResult['microseconds'],
+                                                             sequenceResult['microseconds']))
+        print()
+        print('{:>10} {:>14} {:>14}'.format('dpi', 'uncached (us)', 'cached (us)'))
+        results = benchmarkHighlight()
+        for uncachedResult, cachedResult in zip(results[::2], results[1::2]):
+            print('{:>10} {:>14.2f} {:>14.2f}'.format(uncachedResult['dpi'], uncachedResult['microseconds'],
+                                                      cachedResult['microseconds']))
@@ -0,0 +1,190 @@
+import os
+import sys
+import argparse
+import PyPDF2
+from errors import *
+from model import *
+from tools import *
+
+
+def parsePageSpec(spec, pageCount):
+    """
+    Returns list of 0-indexed page indices in order given by a page specification of 1-indexed pages.
+
+    Parameters
+    ---
+    spec : str
+        Comma separated pages or inclusive ranges, e.g. '1,3-5,8-'. Ranges may leave out their start or end to mean
+        first or last page, and run backwards if start is after end.
+    pageCount : int
+        Number of pages in PDF the specification refers to.
+
+    Raises
+    ---
+    InvalidPageSpec
+        Raised if spec can not be parsed or refers to pages outside 1 to pageCount.
+
+    """
+    indices = []
+    for part in spec.split(','):
+        part = part.strip()
+        try:
+            if '-' in part:
+                start, end = part.split('-')
+                start = int(start) if start.strip() != '' else 1
+                end = int(end) if end.strip() != '' else pageCount
+            else:
+                start = end = int(part)
+        except(ValueError):
+            raise(InvalidPageSpec('Could not parse page specification part \'{}\'.'.format(part)))
+        if not (1 <= start <= pageCount and 1 <= end <= pageCount):
+            raise(InvalidPageSpec('Pages in \'{}\' must be between 1 and {}.'.format(part, pageCount)))
+        step = 1 if start <= end else -1
+        indices.extend(range(start-1, end-1+step, step))
+    return(indices)
+
+
+class CommandLineInterface():
+    """
+    Headless interface to merge, split, reorder and delete pages of pdf files. Pages are never rendered and no GUI
+    libraries are imported.
+
+    Attributes
+    ---
+    bank : PDFPageBank
+        PDFPageBank shared by all loaded pdfs.
+    generator : IDGenerator
+        IDGenerator shared by all loaded pdfs.
+    exports : list <tuple>
+        Tuples of path of every pdf written and number of bytes deduplication saved on it, in order written.
+
+    """
+    def __init__(self):
+        self.bank = PDFPageBank()
+        self.generator = IDGenerator()
+        self.exports = []
+
+    def loadPDF(self, pdfFilePath):
+        """
+        Returns PDF of the given pdf at pdfFilePath, with no images attached to its pages.
+
+        """
+        return(File2PDFConverter(pdfFilePath, self.generator, self.bank, attachImages=False).extractPDF())
+
+    def exportPDF(self, pdf, outputPath):
+        """
+        Writes pdf to outputPath and records it in exports.
+
+        """
+        converter = PDF2FileConverter(pdf)
+        converter.extractToFilePath(outputPath)
+        self.exports.append((outputPath, converter.bytesSaved))
+
+    def merge(self, outputPath, inputPaths):
+        """
+        Writes pdfs at inputPaths one after the other to outputPath.
+
+        """
+        pdf = PDF(self.bank)
+        for inputPath in inputPaths:
+            pdf.appendEntirePDF(self.loadPDF(inputPath))
+        self.exportPDF(pdf, outputPath)
+
+    def split(self, inputPath, outputDirectory, every):
+        """
+        Writes pdf at inputPath to outputDirectory as files of every pages each, named after input with their part
+        number. Returns list of written file paths.
+
+        """
+        pdf = self.loadPDF(inputPath)
+        stem = os.path.splitext(os.path.basename(inputPath))[0]
+        outputPaths = []
+        for part, start in enumerate(range(0, pdf.countPages(), every)):
+            partPDF = pdf.copyPDF()
+            partPDF._setOrderedPages(pdf._getOrderedPages().slice(start, min(start+every, pdf.countPages())))
+            outputPaths.append(os.path.join(outputDirectory, '{}_{}.pdf'.format(stem, part+1)))
+            self.exportPDF(partPDF, outputPaths[-1])
+        return(outputPaths)
+
+    def reorder(self, inputPath, outputPath, spec):
+        """
+        Writes pdf at inputPath to outputPath with pages in order given by spec, which must list every page once.
+
+        """
+        pdf = self.loadPDF(inputPath)
+        pdf.permutePages(parsePageSpec(spec, pdf.countPages()))
+        self.exportPDF(pdf, outputPath)
+
+    def delete(self, inputPath, outputPath, spec):
+        """
+        Writes pdf at inputPath to outputPath without pages given by spec.
+
+        Raises
+        ---
+        InvalidPageSpec
+            Raised if spec can not be parsed, refers to pages outside pdf or gives every page, leaving none to write.
+
+        """
+        pdf = self.loadPDF(inputPath)
+        pdf.removePages(parsePageSpec(spec, pdf.countPages()))
+        if pdf.countPages() == 0:
+            raise(InvalidPageSpec('Pages \'{}\' are every page of pdf, no pages would be left.'.format(spec)))
+        self.exportPDF(pdf, outputPath)
+
+
+def _createParser():
+    parser = argparse.ArgumentParser(prog='SimplePDF', description='Edit pdf files without a GUI.')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Print every pdf written and bytes saved by writing duplicate objects once.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    merge = subparsers.add_parser('merge', help='Merge pdfs in given order.')
+    merge.add_argument('output', help='Path of merged pdf to create.')
+    merge.add_argument('inputs', nargs='+', help='Paths of pdfs to merge.')
+
+    split = subparsers.add_parser('split', help='Split pdf into files of a fixed number of pages.')
+    split.add_argument('input', help='Path of pdf to split.')
+    split.add_argument('outputDirectory', help='Directory to write parts to.')
+    split.add_argument('--every', type=int, default=1, help='Number of pages per part, 1 by default.')
+
+    reorder = subparsers.add_parser('reorder', help='Reorder pages of pdf.')
+    reorder.add_argument('input', help='Path of pdf to reorder.')
+    reorder.add_argument('output', help='Path of reordered pdf to create.')
+    reorder.add_argument('pages', help='New order listing every page once, e.g. \'3,1-2,4-\'.')
+
+    delete = subparsers.add_parser('delete', help='Delete pages of pdf.')
+    delete.add_argument('input', help='Path of pdf to delete pages from.')
+    delete.add_argument('output', help='Path of pdf to create.')
+    delete.add_argument('pages', help='Pages to delete, e.g. \'2,5-7\'.')
+    return(parser)
+
+
+def main(argv=None):
+    """
+    Runs command given by argv, sys.argv by default. Returns exit code, 1 if the command failed.
+
+    """
+    arguments = _createParser().parse_args(argv)
+    interface = CommandLineInterface()
+    try:
+        if arguments.command == 'merge':
+            interface.merge(arguments.output, arguments.inputs)
+        elif arguments.command == 'split':
+            if arguments.every < 1:
+                raise(InvalidPageSpec('Number of pages per part must be at least 1.'))
+            interface.split(arguments.input, arguments.outputDirectory, arguments.every)
+        elif arguments.command == 'reorder':
+            interface.reorder(arguments.input, arguments.output, arguments.pages)
+        elif arguments.command == 'delete':
+            interface.delete(arguments.input, arguments.output, arguments.pages)
+    except(InvalidPageSpec, InvalidPermutation, FilePathNotPDF, OSError, PyPDF2.utils.PdfReadError) as error:
+        print('SimplePDF: {}'.format(error), file=sys.stderr)
+        return(1)
+    if arguments.verbose:
+        for outputPath, bytesSaved in interface.exports:
+            print('Wrote {} ({} bytes saved by deduplication)'.format(outputPath, bytesSaved))
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
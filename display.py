@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt
+
+
+def pilToQImage(image):
+    """
+    Returns QImage copy of PIL image.
+
+    """
+    image = image.convert('RGB')
+    data = image.tobytes('raw', 'RGB')
+    return(QImage(data, image.width, image.height, 3*image.width, QImage.Format_RGB888).copy())
+
+
+class qtPageDisplay(QLabel):
+    """
+    Page display drawing images as QPixmaps scaled by Qt to fit the widget. Each image is converted to a QPixmap once
+    and kept in a small least recently used cache, so flipping back to a page costs only a scale.
+
+    Attributes
+    ---
+    pixmaps : collections.OrderedDict
+        Converted QPixmaps by key, ordered from least to most recently used.
+    cacheSize : int
+        Maximum number of QPixmaps kept.
+    currentPixmap : PyQt5.QtGui.QPixmap
+        Unscaled QPixmap currently displayed, None if nothing is.
+
+    """
+    def __init__(self, width=600, height=775, cacheSize=16):
+        super().__init__()
+        self.pixmaps = OrderedDict()
+        self.cacheSize = cacheSize
+        self.currentPixmap = None
+        self.setMinimumSize(width, height)
+        self.setAlignment(Qt.AlignCenter)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+
+    def getWidget(self):
+        return(self)
+
+    def showPage(self, key, imageFunction):
+        """
+        Displays image identified by key, calling imageFunction for the PIL image only if key is not cached.
+
+        """
+        if key in self.pixmaps:
+            self.pixmaps.move_to_end(key)
+        else:
+            self.pixmaps[key] = QPixmap.fromImage(pilToQImage(imageFunction()))
+            if len(self.pixmaps) > self.cacheSize:
+                self.pixmaps.popitem(last=False)
+        self.currentPixmap = self.pixmaps[key]
+        self._showScaled()
+
+    def _showScaled(self):
+        if self.currentPixmap is not None:
+            self.setPixmap(self.currentPixmap.scaled(self.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    # Override
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._showScaled()
+
+    def closeDisplay(self):
+        self.pixmaps.clear()
+        self.currentPixmap = None
+
+
+class matplotlibPageDisplay():
+    """
+    Page display drawing images with matplotlib's imshow on a FigureCanvasQTAgg, as the editor originally did.
+    Matplotlib is only imported when this display is created.
+
+    Attributes
+    ---
+    figure : matplotlib.figure.Figure
+        Figure images are drawn on.
+    ax : matplotlib.axes.Axes
+        Axes images are drawn on.
+    canvas : FigureCanvasQTAgg
+        Qt widget of figure.
+
+    """
+    def __init__(self, width=6, height=7.75):
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        self.figure, self.ax = plt.subplots(figsize=(width, height))
+        self.ax.tick_params(axis='both', left=False, bottom=False, labelleft=False, labelbottom=False)
+        self.figure.tight_layout(pad=0)
+        self.canvas = FigureCanvasQTAgg(self.figure)
+
+    def getWidget(self):
+        return(self.canvas)
+
+    def showPage(self, key, imageFunction):
+        """
+        Draws image returned by imageFunction, key is not used as nothing is cached.
+
+        """
+        self.ax.clear()
+        self.ax.imshow(imageFunction())
+        self.canvas.draw()
+
+    def closeDisplay(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.figure)
+
+
+# Page displays by name, all taking no arguments and having getWidget, showPage and closeDisplay
+PAGE_DISPLAYS = {'qt': qtPageDisplay, 'matplotlib': matplotlibPageDisplay}
@@ -45,3 +45,34 @@ class NoValidFilePathGiven(Exception):
     """
     pass
 
+
+class InvalidResolutionTier(Exception):
+    """
+    Thrown when given resolution tier is not one of the known tiers.
+
+    """
+    pass
+
+
+class ExportCancelled(Exception):
+    """
+    Thrown when an export is cancelled before it finished.
+
+    """
+    pass
+
+
+class InvalidPermutation(Exception):
+    """
+    Thrown when given page order is not a permutation of the indices of a PDF.
+
+    """
+    pass
+
+
+class InvalidPageSpec(Exception):
+    """
+    Thrown when a page specification can not be parsed or refers to pages that do not exist.
+
+    """
+    pass
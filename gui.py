@@ -1,14 +1,15 @@
 import os
 import re
-import matplotlib.pyplot as plt
 from errors import *
 from model import *
 from tools import *
+from display import *
 from PyQt5.QtWidgets import *
-from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtGui import QFont, QPixmap, QColor
+from PyQt5.QtCore import Qt, QThread, QSize, QTimer, QAbstractListModel, QModelIndex, pyqtSignal
 from PIL import Image, ImageOps
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 
 
 class selectFileGUI(QDialog):
@@ -136,26 +137,454 @@ class createSavePathGUI(selectFileGUI):
             self.close()
 
 
+class loadPDFThread(QThread):
+    """
+    Thread parsing a pdf file and handing over its pages one at a time, so the GUI stays interactive while loading.
+    Pages are not added to any bank or PDF here, that is left to the receiver of pageLoaded on the GUI thread. If an
+    identical file was already loaded into bank, its pages are handed over instead of parsed again.
+
+    Attributes
+    ---
+    pdfFilePath : str
+        File path of pdf to load.
+    generator : IDGenerator
+        IDGenerator to generate IDs of loaded PDFPages with.
+    bank : PDFPageBank
+        PDFPageBank loaded pages will be added to, only read here to find pages of identical files.
+    converter : File2PDFConverter
+        Converter reading file, None until thread runs.
+
+    Signals
+    ---
+    pageLoaded(PDFPage)
+        Emitted for every page parsed, in order.
+    progress(int, int)
+        Emitted with number of pages loaded and total pages after every page parsed.
+    failed(str)
+        Emitted with error message if file could not be read, no pages are handed over after it.
+
+    """
+    pageLoaded = pyqtSignal(object)
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, pdfFilePath, generator, bank):
+        super().__init__()
+        self.pdfFilePath = pdfFilePath
+        self.generator = generator
+        self.bank = bank
+        self.converter = None
+
+    # Override
+    def run(self):
+        try:
+            self.converter = File2PDFConverter(self.pdfFilePath, self.generator, self.bank)
+            total = self.converter.countPages()
+            for i, page in enumerate(self.converter.iterPages()):
+                if self.isInterruptionRequested():
+                    return
+                self.pageLoaded.emit(page)
+                self.progress.emit(i+1, total)
+        except(Exception) as error:
+            self.failed.emit(str(error))
+
+
+class prerenderPDFThread(QThread):
+    """
+    Thread rendering the first pages of a loaded pdf file in parallel processes into their PageRasters, so flipping
+    through them after loading does not wait on a render each. Rendering is only an optimization, so errors stop it
+    silently and pages are rendered when shown instead.
+
+    Attributes
+    ---
+    converter : File2PDFConverter
+        Converter of loaded file.
+    pages : list <PDFPage>
+        First pages of file in order to render.
+    tier : str
+        Resolution tier to render pages at.
+
+    """
+    def __init__(self, converter, pages, tier='preview'):
+        super().__init__()
+        self.converter = converter
+        self.pages = pages
+        self.tier = tier
+
+    # Override
+    def run(self):
+        try:
+            self.converter.prerenderPages(self.tier, pages=self.pages, isCancelled=self.isInterruptionRequested)
+        except(Exception):
+            pass
+
+
+class exportPDFThread(QThread):
+    """
+    Thread exporting a PDF to a pdf file, so the GUI stays responsive and can cancel the export.
+
+    Attributes
+    ---
+    pdf : PDF
+        PDF to export.
+    filePath : str
+        File path of pdf file to create.
+
+    Signals
+    ---
+    progress(int, int)
+        Emitted with number of export steps done and total steps.
+    exported(int)
+        Emitted with number of bytes saved by deduplication once pdf file is written.
+    failed(str)
+        Emitted with error message if pdf file could not be written.
+
+    """
+    progress = pyqtSignal(int, int)
+    exported = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, pdf, filePath):
+        super().__init__()
+        self.pdf = pdf
+        self.filePath = filePath
+
+    # Override
+    def run(self):
+        converter = PDF2FileConverter(self.pdf)
+        try:
+            converter.extractToFilePath(self.filePath, self.progress.emit, self.isInterruptionRequested)
+        except(ExportCancelled):
+            return
+        except(Exception) as error:
+            self.failed.emit(str(error))
+            return
+        self.exported.emit(converter.bytesSaved)
+
+
+class thumbnailListModel(QAbstractListModel):
+    """
+    List model of the pages of a PDF showing thumbnail tier images. Thumbnails are only loaded when a view asks for
+    them, which a QListView only does for items in view, and are rendered on a background thread while a placeholder
+    is shown. Converted QPixmaps are kept in a small least recently used cache.
+
+    Attributes
+    ---
+    pdf : PDF
+        PDF whose pages are listed.
+    pixmaps : collections.OrderedDict
+        Thumbnail QPixmaps by PDFPage ID, ordered from least to most recently used.
+    cacheSize : int
+        Maximum number of QPixmaps kept.
+    pending : collections.OrderedDict
+        Futures of thumbnails being loaded by PDFPage ID, oldest first.
+    maxPending : int
+        Maximum number of thumbnails queued, oldest not yet started are cancelled beyond it.
+    placeholder : PyQt5.QtGui.QPixmap
+        Pixmap shown until thumbnail is loaded.
+
+    Signals
+    ---
+    thumbnailLoaded(ID, int, QImage)
+        Emitted from loading thread with ID of page, row it was requested for and its thumbnail.
+    thumbnailFailed(ID)
+        Emitted from loading thread with ID of page if its thumbnail could not be loaded.
+
+    """
+    thumbnailLoaded = pyqtSignal(object, int, object)
+    thumbnailFailed = pyqtSignal(object)
+
+    def __init__(self, pdf, thumbnailSize=QSize(136, 176), cacheSize=512, maxPending=64):
+        super().__init__()
+        self.pdf = pdf
+        self.pixmaps = OrderedDict()
+        self.cacheSize = cacheSize
+        self.pending = OrderedDict()
+        self.maxPending = maxPending
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.placeholder = QPixmap(thumbnailSize)
+        self.placeholder.fill(QColor('#e0e0e0'))
+        self.thumbnailLoaded.connect(self._handleThumbnailLoaded)
+        self.thumbnailFailed.connect(self._handleThumbnailFailed)
+
+    # Override
+    def rowCount(self, parent=QModelIndex()):
+        return(0 if parent.isValid() else self.pdf.countPages())
+
+    # Override
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return(None)
+        if role == Qt.DisplayRole:
+            return(str(index.row()+1))
+        elif role == Qt.DecorationRole:
+            page = self.pdf.getPage(index.row())
+            if page.getID() in self.pixmaps:
+                self.pixmaps.move_to_end(page.getID())
+                return(self.pixmaps[page.getID()])
+            self._loadThumbnail(page, index.row())
+            return(self.placeholder)
+        return(None)
+
+    def _loadThumbnail(self, page, row):
+        """
+        Queues thumbnail of page to be loaded if it has an image and is not queued yet, cancelling the oldest queued
+        thumbnails that have not started if too many are queued, as they have likely been scrolled past.
+
+        """
+        if page.image is None or page.getID() in self.pending:
+            return
+        self.pending[page.getID()] = self.executor.submit(self._renderThumbnail, page, row)
+        while len(self.pending) > self.maxPending:
+            ID, future = self.pending.popitem(last=False)
+            future.cancel()
+
+    def _renderThumbnail(self, page, row):
+        try:
+            image = pilToQImage(page.getImage('thumbnail'))
+        except(Exception):
+            self.thumbnailFailed.emit(page.getID())
+            return
+        self.thumbnailLoaded.emit(page.getID(), row, image)
+
+    def _handleThumbnailFailed(self, ID):
+        """
+        Stops waiting for thumbnail that could not be loaded, so it is tried again when its row is next painted.
+
+        """
+        self.pending.pop(ID, None)
+
+    def _handleThumbnailLoaded(self, ID, row, image):
+        """
+        Caches loaded thumbnail as a QPixmap and updates row it was requested for. Rows of any other copies of the
+        page pick it up from the cache when next painted.
+
+        """
+        self.pending.pop(ID, None)
+        self.pixmaps[ID] = QPixmap.fromImage(image)
+        if len(self.pixmaps) > self.cacheSize:
+            self.pixmaps.popitem(last=False)
+        if row < self.pdf.countPages():
+            self.dataChanged.emit(self.index(row), self.index(row), [Qt.DecorationRole])
+
+    def setPDF(self, pdf):
+        """
+        Lists pages of pdf instead, keeping cached thumbnails.
+
+        """
+        self.beginResetModel()
+        self.pdf = pdf
+        self.endResetModel()
+
+    def shutdown(self):
+        """
+        Cancels queued thumbnails and stops loading thread.
+
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class rearrangeGUI(QDialog):
+    """
+    GUI showing every page of a PDF as a grid of thumbnails, where several pages can be selected at once to be moved
+    or removed together. The grid is a QListView, which only paints and asks for thumbnails of items in view.
+
+    Attributes
+    ---
+    pdf : PDF
+        PDF being rearranged.
+    onChange : function
+        Called with no arguments after each change to pdf, e.g. to save a new version.
+
+    """
+    def __init__(self, pdf, onChange):
+        super().__init__()
+        self.pdf = pdf
+        self.onChange = onChange
+        self._setUI()
+        self.exec_()
+
+    def _setUI(self):
+        """
+        Sets thumbnail grid, target page selector and buttons in main QDialog.
+
+        """
+        self.setWindowTitle('Rearrange Pages')
+        layout = QGridLayout()
+
+        self.model = thumbnailListModel(self.pdf)
+        self.grid = QListView()
+        self.grid.setViewMode(QListView.IconMode)
+        self.grid.setResizeMode(QListView.Adjust)
+        self.grid.setMovement(QListView.Static)
+        self.grid.setUniformItemSizes(True)
+        self.grid.setLayoutMode(QListView.Batched)
+        self.grid.setIconSize(QSize(136, 176))
+        self.grid.setGridSize(QSize(156, 206))
+        self.grid.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.grid.setModel(self.model)
+        self.grid.setMinimumSize(700, 800)
+        layout.addWidget(self.grid, 0, 0, 1, 5)
+
+        self.targetPage = QSpinBox()
+        self.targetPage.setPrefix('Page ')
+        layout.addWidget(self.targetPage, 1, 2)
+
+        self.moveBeforeButton = QPushButton('Move Selected Before')
+        self.moveBeforeButton.clicked.connect(lambda: self._moveSelected('Before'))
+        layout.addWidget(self.moveBeforeButton, 1, 0)
+
+        self.moveAfterButton = QPushButton('Move Selected After')
+        self.moveAfterButton.clicked.connect(lambda: self._moveSelected('After'))
+        layout.addWidget(self.moveAfterButton, 1, 1)
+
+        self.removeButton = QPushButton('Remove Selected')
+        self.removeButton.clicked.connect(lambda: self._removeSelected())
+        layout.addWidget(self.removeButton, 1, 3)
+
+        self.doneButton = QPushButton('Done')
+        self.doneButton.clicked.connect(lambda: self.close())
+        layout.addWidget(self.doneButton, 1, 4)
+
+        self.setLayout(layout)
+        self._updateUI()
+
+    # Override
+    def done(self, result):
+        self.model.shutdown()  # Called however dialog is closed, including by Escape
+        super().done(result)
+
+    def _getSelectedIndices(self):
+        return(sorted(index.row() for index in self.grid.selectionModel().selectedIndexes()))
+
+    def _updateUI(self):
+        """
+        Reloads grid after pdf changed and limits target page to pages in pdf.
+
+        """
+        self.model.setPDF(self.pdf)
+        self.targetPage.setRange(1, max(1, self.pdf.countPages()))
+
+    def _moveSelected(self, movement):
+        """
+        Moves selected pages as a block before or after target page depending on movement given.
+
+        """
+        selected = self._getSelectedIndices()
+        if len(selected) == 0:
+            return
+        if movement == 'Before':
+            self.pdf.movePagesBefore(selected, self.targetPage.value()-1)
+        elif movement == 'After':
+            self.pdf.movePagesAfter(selected, self.targetPage.value()-1)
+        self.onChange()
+        self._updateUI()
+
+    def _removeSelected(self):
+        """
+        Removes selected pages, as long as at least one page is left.
+
+        """
+        selected = self._getSelectedIndices()
+        if 0 < len(selected) < self.pdf.countPages():
+            self.pdf.removePages(selected)
+            self.onChange()
+            self._updateUI()
+
+
+class statsPanelGUI(QDialog):
+    """
+    Non modal window showing live stats of instrumentation, spans by total time followed by counters, refreshed every
+    refreshMS milliseconds, with a button to save recorded spans as a Chrome trace.
+
+    Attributes
+    ---
+    refreshMS : int
+        Milliseconds between refreshes.
+
+    """
+    def __init__(self, refreshMS=1000):
+        super().__init__()
+        self.refreshMS = refreshMS
+        self._setUI()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._refresh)
+        self.timer.start(self.refreshMS)
+        self._refresh()
+        self.show()
+
+    def _setUI(self):
+        self.setWindowTitle('SimplePDF Stats')
+        layout = QVBoxLayout()
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(['Name', 'Calls', 'Total (ms)', 'Mean (ms)', 'Max (ms)'])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        self.saveTraceButton = QPushButton('Save Chrome Trace')
+        self.saveTraceButton.clicked.connect(lambda: self._handleSaveTrace())
+        layout.addWidget(self.saveTraceButton)
+        self.setLayout(layout)
+        self.resize(600, 400)
+
+    def _refresh(self):
+        """
+        Fills table with current stats of instrumentation.
+
+        """
+        stats = instrumentation.getStats()
+        rows = [[span['name'], span['calls'], '{:.1f}'.format(span['totalMS']), '{:.2f}'.format(span['meanMS']),
+                 '{:.2f}'.format(span['maxMS'])] for span in stats['spans']]
+        rows += [[name, value, '', '', ''] for name, value in sorted(stats['counters'].items())]
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                self.table.setItem(i, j, QTableWidgetItem(str(value)))
+
+    def _handleSaveTrace(self):
+        """
+        Saves recorded spans as a Chrome trace json file chosen by user.
+
+        """
+        filePath, selectedFilter = QFileDialog.getSaveFileName(self, 'Save Chrome Trace', '', 'JSON (*.json)')
+        if filePath != '':
+            instrumentation.exportChromeTrace(filePath)
+
+
 class editFileGUI(QDialog):
     """
     Main GUI used to edit PDF, capable of appending a PFD, removing/moving pages, undo/redo, and saving the edited PDF.
+    Pages are shown with the page display named by displayBackend in PAGE_DISPLAYS, 'qt' by default. Once a file is
+    loaded, its first prerenderCount pages are rendered in the background.
 
     """
-    def __init__(self, pdfFilePath):
+    def __init__(self, pdfFilePath, displayBackend='qt', prerenderCount=32):
         super().__init__()
+        self.displayBackend = displayBackend
+        self.prerenderCount = prerenderCount
 
         # Create single bank and IDgenerator for instance of GUI
         self.bank = PDFPageBank()
         self.generator = IDGenerator()
-        self.recorder = PDFHistoryRecorder()
-        self.pdf = self.loadPDF(pdfFilePath)
+        self.recorder = PDFHistoryRecorder(maxVersions=1000)  # Bounded so pages of old versions can be reclaimed
+        self.pdf = PDF(self.bank)
         self.moveMode = False  # Not initially in moveMode
         self.currentIndex = 0
-        self.pageCount = self.pdf.countPages()
-
-        # Load UI
+        self.pageCount = 0
+        self.loader = None
+        self.loadError = None
+        self.prerenderers = []  # Earlier ones are kept until they stop, as a running QThread must not be deleted
+        self.exporter = None
+        self.closed = False  # Signals of threads queued before closing are ignored once closed
+        self.prefetcher = PagePrefetcher('preview')
+        if rasterCache.diskCache is None:  # Pages shown again in later sessions are read from disk, not rendered
+            rasterCache.diskCache = DiskRasterCache()
+        self.direction = 1  # Direction of last page flip, used to predict pages to prefetch
+        self.statsPanel = None
+
+        # Load UI, then fill in pdf in background showing first page as soon as it is loaded
         self._setUI()
-        self._update()
+        self._startLoadPDF(pdfFilePath)
         self.exec_()
 
     def _setUI(self):
@@ -166,12 +595,9 @@ class editFileGUI(QDialog):
         self.setWindowTitle('SimplePDF')
         layout = QGridLayout()
 
-        # Add main figure
-        self.mainFigure, self.mainAx = plt.subplots(figsize=(6, 7.75))
-        self.mainAx.tick_params(axis='both', left=False, bottom=False, labelleft=False, labelbottom=False)
-        self.mainFigure.tight_layout(pad=0)
-        self.canvas = FigureCanvasQTAgg(self.mainFigure)
-        layout.addWidget(self.canvas, 1, 1, 7, 3)
+        # Add main page display
+        self.pageDisplay = PAGE_DISPLAYS[self.displayBackend]()
+        layout.addWidget(self.pageDisplay.getWidget(), 1, 1, 7, 3)
 
         # Main figure arrows, current index, and select page button
         self.prevPageButton = QPushButton('<')
@@ -227,21 +653,177 @@ class editFileGUI(QDialog):
         self.exportPDFButton.clicked.connect(lambda: self._handleExportPDF())
         layout.addWidget(self.exportPDFButton, 6, 5, 1, 2)
 
+        self.rearrangeButton = QPushButton('Rearrange Pages')
+        self.rearrangeButton.clicked.connect(lambda: self._handleRearrange())
+        layout.addWidget(self.rearrangeButton, 7, 5, 1, 2)
+
+        # Loading progress and cancel
+        self.loadProgressBar = QProgressBar()
+        self.loadProgressBar.setVisible(False)
+        layout.addWidget(self.loadProgressBar, 9, 1, 1, 3)
+
+        self.cancelLoadButton = QPushButton('Cancel Loading')
+        self.cancelLoadButton.clicked.connect(lambda: self._cancelLoadPDF())
+        self.cancelLoadButton.setVisible(False)
+        layout.addWidget(self.cancelLoadButton, 9, 5, 1, 2)
+
+        # Stats of instrumentation, only offered when it is enabled
+        self.statsButton = QPushButton('Show Stats')
+        self.statsButton.clicked.connect(lambda: self._handleShowStats())
+        self.statsButton.setVisible(instrumentation.enabled)
+        layout.addWidget(self.statsButton, 8, 5, 1, 2)
+
         self.setLayout(layout)
 
     # Override
     def closeEvent(self, event):
-        plt.close('all')
+        self.closed = True
+        for thread in [self.loader, self.exporter]+self.prerenderers:
+            if thread is not None:
+                thread.requestInterruption()
+                thread.wait()
+        if self.loader is not None and self.loader.converter is not None:
+            self.loader.converter.releaseSource()
+        self.prefetcher.shutdown()
+        self.pageDisplay.closeDisplay()
         self.close()
 
     def loadPDF(self, pdfFilePath):
         """
-        Returns PDF of the given pdf at pdfFilePath.
+        Returns PDF of the given pdf at pdfFilePath, blocking until all of it is loaded.
 
         """
         converter = File2PDFConverter(pdfFilePath, self.generator, self.bank)
         return(converter.extractPDF())
 
+    def _startLoadPDF(self, pdfFilePath):
+        """
+        Starts loading pdf at pdfFilePath in a loadPDFThread, appending its pages to the end of pdf as they arrive.
+        Editing is disabled until loading finishes, but pages already loaded can be browsed.
+
+        """
+        self.pdfBeforeLoad = self.pdf.copyPDF()
+        self.loadCancelled = False
+        self.loadError = None
+        self.loader = loadPDFThread(pdfFilePath, self.generator, self.bank)
+        self.loader.pageLoaded.connect(self._handlePageLoaded)
+        self.loader.progress.connect(self._handleLoadProgress)
+        self.loader.failed.connect(self._handleLoadFailed)
+        self.loader.finished.connect(self._handleLoadFinished)
+        self._activateLoadingFunction(True)
+        self.loader.start()
+
+    def _handlePageLoaded(self, page):
+        """
+        Adds page loaded by loader to bank, unless it is a page of an identical file already there, and to end of pdf.
+        Shows it if it is the first page, otherwise only updates displayed page count.
+
+        """
+        if self.closed:
+            return
+        if not self.bank.contains(page.getID()):
+            self.bank.addPage(page)
+        self.pdf.addPage(page)
+        if self.pdf.countPages() == 1:
+            self._updateUI()
+        else:
+            self.pageCount = self.pdf.countPages()
+            self.indexDisplay.setText('{}/{}'.format(self.currentIndex+1, self.pageCount))
+
+    def _handleLoadProgress(self, loaded, total):
+        """
+        Updates loading progress bar.
+
+        """
+        self.loadProgressBar.setMaximum(total)
+        self.loadProgressBar.setValue(loaded)
+
+    def _handleLoadFailed(self, message):
+        """
+        Keeps error of loader to show once it has stopped, handling the load as cancelled.
+
+        """
+        self.loadCancelled = True
+        self.loadError = message
+
+    def _cancelLoadPDF(self):
+        """
+        Asks loader to stop, finishing of the load is handled once it has stopped.
+
+        """
+        if self.loader is not None:
+            self.loadCancelled = True
+            self.loader.requestInterruption()
+
+    def _handleLoadFinished(self):
+        """
+        Saves loaded pdf as a single new version and re-enables editing, or discards or keeps a cancelled or failed
+        load. Does nothing once editor is closed.
+
+        """
+        if self.closed:
+            return
+        converter = self.loader.converter
+        loadedIDs = self.pdf._getOrderedPages().slice(self.pdfBeforeLoad.countPages(), self.pdf.countPages())
+        if not self.loadCancelled and converter is not None and len(loadedIDs) == converter.countPages():
+            converter.addSourceToBank(loadedIDs)
+            self._startPrerender(converter, [self.bank.getPage(ID) for ID in loadedIDs[:self.prerenderCount]])
+        elif converter is not None:
+            converter.releaseSource()
+        self.loader = None
+        self._activateLoadingFunction(False)
+        if self.loadCancelled and self.pdfBeforeLoad.countPages() > 0:
+            self.pdf = self.pdfBeforeLoad
+            self.currentIndex = min(self.currentIndex, self.pdf.countPages()-1)
+            self.bank.reclaimPages([ID for ID in loadedIDs if not self.recorder.isReferenced(ID)])
+        if self.loadError is not None:
+            errorBox = QMessageBox()
+            errorBox.setWindowTitle('File Error')
+            errorBox.setText('PDF could not be loaded: {}'.format(self.loadError))
+            errorBox.setIcon(QMessageBox.Warning)
+            errorBox.exec_()
+        if self.pdf.countPages() == 0:
+            self.close()
+        elif self.pdf == self.pdfBeforeLoad:
+            self._updateUI()
+        else:
+            self._update()
+
+    def _startPrerender(self, converter, pages):
+        """
+        Starts rendering pages of file of converter in a prerenderPDFThread, stopping any earlier ones.
+
+        """
+        for prerenderer in self.prerenderers:
+            prerenderer.requestInterruption()
+        prerenderer = prerenderPDFThread(converter, pages, self.prefetcher.tier)
+        prerenderer.finished.connect(self._handlePrerenderFinished)
+        self.prerenderers.append(prerenderer)
+        prerenderer.start()
+
+    def _handlePrerenderFinished(self):
+        """
+        Drops prerenderPDFThreads that have stopped.
+
+        """
+        self.prerenderers = [prerenderer for prerenderer in self.prerenderers if not prerenderer.isFinished()]
+
+    def _activateLoadingFunction(self, boolean):
+        """
+        Shows or hides loading progress and cancel button, disabling or enabling all buttons that change pdf.
+
+        """
+        self.loadProgressBar.setVisible(boolean)
+        self.loadProgressBar.setValue(0)
+        self.cancelLoadButton.setVisible(boolean)
+        self.appendPDFButton.setEnabled(not boolean)
+        self.removePageButton.setEnabled(not boolean)
+        self.movePageButton.setEnabled(not boolean)
+        self.undoButton.setEnabled(not boolean)
+        self.redoButton.setEnabled(not boolean)
+        self.exportPDFButton.setEnabled(not boolean)
+        self.rearrangeButton.setEnabled(not boolean)
+
     def _update(self):
         """
         Saves current version of pdf and updates all UI. Use whenever there is a change to pdf.
@@ -252,25 +834,32 @@ class editFileGUI(QDialog):
 
     def _updateUI(self):
         """
-        Updates pageCount and displayed page count, current index, and main figure to current one of PDF.
+        Updates pageCount and displayed page count, current index, and page display to current one of PDF, then
+        prefetches pages likely to be shown next.
 
         """
-        self.pageCount = self.pdf.countPages()
-        self.indexDisplay.setText('{}/{}'.format(self.currentIndex+1, self.pageCount))
-        self.mainAx.clear()
-        if self.moveMode and (self.currentIndex == self.indexToMove):
-            self.mainAx.imshow(ImageOps.colorize(ImageOps.grayscale(self.pdf.getPage(self.currentIndex).getImage()),
-                                                 black='#000000', white='#add8e6'))
-        else:
-            self.mainAx.imshow(self.pdf.getPage(self.currentIndex).getImage())
-        self.canvas.draw()
+        with instrumentation.span('editFileGUI._updateUI', index=self.currentIndex):
+            self.pageCount = self.pdf.countPages()
+            self.indexDisplay.setText('{}/{}'.format(self.currentIndex+1, self.pageCount))
+            page = self.pdf.getPage(self.currentIndex)
+            with instrumentation.span('editFileGUI.waitForPrefetch'):
+                self.prefetcher.waitFor(page)
+            with instrumentation.span('editFileGUI.showPage', backend=self.displayBackend):
+                if self.moveMode and (self.currentIndex == self.indexToMove):
+                    self.pageDisplay.showPage((page.getID(), 'highlight'),
+                                              lambda: page.getHighlightedImage('preview', 'move'))
+                else:
+                    self.pageDisplay.showPage((page.getID(), 'preview'), lambda: page.getImage('preview'))
+            self.prefetcher.prefetch(self.pdf, self.currentIndex, self.direction,
+                                     self.indexToMove if self.moveMode else None)
 
     def _saveVersion(self):
         """
-        Saves current pdf as new version in recorder.
+        Saves current pdf as new version in recorder, reclaiming pages only in versions it dropped.
 
         """
         self.recorder.newVersion(self.pdf)
+        self.bank.reclaimPages(self.recorder.unreferencedIDs)
 
     def _incrementPageIndex(self, i):
         """
@@ -279,17 +868,17 @@ class editFileGUI(QDialog):
         """
         if 0 <= self.currentIndex+i <= self.pageCount-1:
             self.currentIndex += i
+            self.direction = i
             self._updateUI()
 
     def _handleAppendPDF(self):
         """
-        Adds given PDF to the end of current PDF, doing nothing if there isn't a PDF given.
+        Adds given PDF to the end of current PDF in the background, doing nothing if there isn't a PDF given.
 
         """
         gui = selectFileGUI('Select PDF to Append')
         try:
-            self.pdf.appendEntirePDF(self.loadPDF(gui.getSelectedPDFPath()))
-            self._update()
+            self._startLoadPDF(gui.getSelectedPDFPath())
         except(NoValidFilePathGiven):
             pass
 
@@ -352,10 +941,35 @@ class editFileGUI(QDialog):
         self.undoButton.setEnabled(not boolean)
         self.redoButton.setEnabled(not boolean)
         self.exportPDFButton.setEnabled(not boolean)
+        self.rearrangeButton.setEnabled(not boolean)
         self.placeBeforeButton.setEnabled(boolean)
         self.placeAfterButton.setEnabled(boolean)
         self.cancelButton.setEnabled(boolean)
 
+    def _handleShowStats(self):
+        """
+        Opens stats panel of instrumentation, or raises it if already open.
+
+        """
+        if self.statsPanel is None or not self.statsPanel.isVisible():
+            self.statsPanel = statsPanelGUI()
+        self.statsPanel.raise_()
+
+    def _handleRearrange(self):
+        """
+        Opens thumbnail grid of pdf, saving a version after each change made in it.
+
+        """
+        rearrangeGUI(self.pdf, self._handleRearrangeChange)
+
+    def _handleRearrangeChange(self):
+        """
+        Keeps current index within pdf after a change in thumbnail grid and saves it as a new version.
+
+        """
+        self.currentIndex = min(self.currentIndex, self.pdf.countPages()-1)
+        self._update()
+
     def _handleVersionChange(self, change):
         """
         Moves to previous or later version of PDF depending on change value, and does nothing if there is no version to change
@@ -378,13 +992,52 @@ class editFileGUI(QDialog):
 
     def _handleExportPDF(self):
         """
-        Opens a GUI to create a save file name and creates a file there if given one. Does nothing if not.
+        Opens a GUI to create a save file name and exports to a file there in the background if given one, showing
+        progress with the option to cancel. Does nothing if not given one.
 
         """
         gui = createSavePathGUI()
         try:
-            converter = PDF2FileConverter(self.pdf)
-            converter.extractToFilePath(gui.getSelectedPDFPath())
+            self.exporter = exportPDFThread(self.pdf.copyPDF(), gui.getSelectedPDFPath())
         except(NoValidFilePathGiven):
-            pass
+            return
+        self.exportProgress = QProgressDialog('Exporting PDF...', 'Cancel', 0, self.pdf.countPages()+1, self)
+        self.exportProgress.setWindowTitle('SimplePDF')
+        self.exportProgress.setWindowModality(Qt.WindowModal)
+        self.exportProgress.canceled.connect(self.exporter.requestInterruption)
+        self.exporter.progress.connect(lambda done, total: self.exportProgress.setValue(done))
+        self.exporter.exported.connect(self._handleExported)
+        self.exporter.failed.connect(self._handleExportFailed)
+        self.exporter.finished.connect(self._handleExportFinished)
+        self.exporter.start()
+
+    def _handleExported(self, bytesSaved):
+        """
+        Shows, without blocking, that pdf was exported and how many bytes writing duplicate objects once saved.
+
+        """
+        self.exportMessage = QMessageBox(self)
+        self.exportMessage.setWindowTitle('SimplePDF')
+        self.exportMessage.setText('PDF exported, {} bytes saved by deduplication.'.format(bytesSaved))
+        self.exportMessage.setIcon(QMessageBox.Information)
+        self.exportMessage.open()
+
+    def _handleExportFailed(self, message):
+        """
+        Shows, without blocking, that pdf could not be exported and why.
+
+        """
+        self.exportMessage = QMessageBox(self)
+        self.exportMessage.setWindowTitle('SimplePDF')
+        self.exportMessage.setText('PDF could not be exported: {}'.format(message))
+        self.exportMessage.setIcon(QMessageBox.Warning)
+        self.exportMessage.open()
+
+    def _handleExportFinished(self):
+        """
+        Closes export progress dialog once exporter has stopped.
+
+        """
+        self.exporter = None
+        self.exportProgress.close()
 
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+
+
+class _NullSpan():
+    """
+    Span returned while instrumentation is disabled, doing nothing on enter and exit.
+
+    """
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, excType, excValue, traceback):
+        return(False)
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span():
+    """
+    Span timing the code run inside it, recorded in instrumentation on exit.
+
+    """
+    def __init__(self, instrumentation, name, args):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return(self)
+
+    def __exit__(self, excType, excValue, traceback):
+        self.instrumentation._recordSpan(self.name, self.start, time.perf_counter(), self.args)
+        return(False)
+
+
+class Instrumentation():
+    """
+    Opt-in recorder of timed spans and counters of hot paths, exportable as a Chrome trace. Disabled by default, in
+    which case recording costs only a method call.
+
+    Attributes
+    ---
+    enabled : bool
+        True if spans and counters are recorded.
+    events : collections.deque <dict>
+        Chrome trace events of recorded spans and counters in order they ended.
+    spanStats : dict
+        Lists of number of calls, total seconds and maximum seconds of spans by name.
+    counters : dict
+        Totals of counters by name.
+    maxEvents : int
+        Maximum number of trace events kept, oldest are dropped beyond it. Stats keep counting.
+    startTime : float
+        perf_counter when recording was enabled, trace timestamps are relative to it.
+
+    """
+    def __init__(self, maxEvents=1000000):
+        self.enabled = False
+        self.events = deque(maxlen=maxEvents)
+        self.spanStats = {}
+        self.counters = {}
+        self.maxEvents = maxEvents
+        self.startTime = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.startTime = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.events = deque(maxlen=self.maxEvents)
+            self.spanStats = {}
+            self.counters = {}
+
+    def span(self, name, **args):
+        """
+        Returns context manager recording time spent inside it as span name with args, doing nothing if disabled.
+
+        """
+        if not self.enabled:
+            return(_NULL_SPAN)
+        return(_Span(self, name, args))
+
+    def count(self, name, amount=1):
+        """
+        Adds amount to counter name if enabled.
+
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0)+amount
+            self._addEvent({'name': name, 'ph': 'C', 'ts': self._timestamp(time.perf_counter()),
+                            'pid': os.getpid(), 'tid': threading.get_ident(), 'args': {name: self.counters[name]}})
+
+    def _timestamp(self, perfCounter):
+        return((perfCounter-self.startTime)*1e6)
+
+    def _addEvent(self, event):
+        self.events.append(event)
+
+    def _recordSpan(self, name, start, end, args):
+        with self.lock:
+            stats = self.spanStats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += end-start
+            stats[2] = max(stats[2], end-start)
+            self._addEvent({'name': name, 'ph': 'X', 'ts': self._timestamp(start), 'dur': (end-start)*1e6,
+                            'pid': os.getpid(), 'tid': threading.get_ident(),
+                            'args': {key: str(value) for key, value in args.items()}})
+
+    def getStats(self):
+        """
+        Returns dict of list of dicts of name, calls, total, mean and max milliseconds of spans under 'spans', sorted
+        by total time, and dict of counters under 'counters'.
+
+        """
+        with self.lock:
+            spans = [{'name': name, 'calls': calls, 'totalMS': total*1e3, 'meanMS': total/calls*1e3,
+                      'maxMS': maximum*1e3}
+                     for name, (calls, total, maximum) in self.spanStats.items()]
+            counters = dict(self.counters)
+        return({'spans': sorted(spans, key=lambda span: -span['totalMS']), 'counters': counters})
+
+    def exportChromeTrace(self, filePath):
+        """
+        Writes recorded events to filePath in Chrome trace event JSON format.
+
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(filePath, 'w') as fileStream:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fileStream)
+
+
+def traced(name):
+    """
+    Returns decorator recording every call of the function it decorates as a span name of instrumentation.
+
+    """
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return(function(*args, **kwargs))
+            with instrumentation.span(name):
+                return(function(*args, **kwargs))
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return(wrapper)
+    return(decorator)
+
+
+# Process wide instrumentation. Setting SIMPLEPDF_TRACE to a file path enables it and writes a Chrome trace there on
+# exit.
+instrumentation = Instrumentation()
+if os.environ.get('SIMPLEPDF_TRACE'):
+    instrumentation.enable()
+    atexit.register(instrumentation.exportChromeTrace, os.environ['SIMPLEPDF_TRACE'])
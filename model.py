@@ -1,20 +1,27 @@
+import threading
 from errors import *
+from render import *
+from sequence import *
 
 
 class PDFPage():
     """
-    PDF Page containing both image and PyPDF2 page representation of PDF.
+    PDF Page containing both image and PyPDF2 page representation of PDF. Slotted as there is one per page of every
+    loaded file, weak references to it are allowed.
 
     Attributes
     ---
-    ID : str
-        ID identifying object.
-    image : PIL.PpmImagePlugin.PpmImageFile
-        PpmImageFile of page for graphical display.
+    ID : int
+        ID identifying object, any hashable such as a str also works but only ints are packed in PDF order.
+    image : PageRaster
+        Lazy handle to images of page for graphical display, each resolution tier only rendered once requested
+        through getImage.
     pageObject : PyPDF2.page.PageObject
         PageObject of pypdf2 page for actually making pdf.
 
     """
+    __slots__ = ('ID', 'image', 'pageObject', '__weakref__')
+
     def __init__(self, ID, image, pageObject):
         self.ID = ID
         self.image = image
@@ -27,31 +34,67 @@ class PDFPage():
             return(False)
         else:
             return((obj.getID() == self.getID()) and
-                   (obj.getImage() == self.getImage()) and
+                   (obj.image == self.image) and
                    (obj.getPageObject() == self.getPageObject()))
 
     def getID(self):
         return(self.ID)
 
-    def getImage(self):
+    def getImage(self, tier='full'):
+        """
+        Returns image of page at resolution tier ('thumbnail', 'preview' or 'full'), rendering it if it has not been
+        yet. Images that are not PageRasters are returned as is regardless of tier.
+
+        """
+        if isinstance(self.image, PageRaster):
+            return(self.image.getImage(tier))
         return(self.image)
 
+    def getHighlightedImage(self, tier='preview', style='move'):
+        """
+        Returns image of page at resolution tier highlighted in style, cached by PageRasters. Images that are not
+        PageRasters are highlighted on every call, None if page has no image.
+
+        """
+        if isinstance(self.image, PageRaster):
+            return(self.image.getHighlightedImage(tier, style))
+        elif self.image is None:
+            return(None)
+        return(highlightImage(self.image, style))
+
+    def setImage(self, image):
+        self.image = image
+
     def getPageObject(self):
         return(self.pageObject)
 
 
 class PDFPageBank():
     """
-    Bank of all PDFPages added so far.
+    Bank of all PDFPages added so far, and of the source files they were read from. Safe to share between threads.
 
     Attributes
     ---
     map : dict
         Dictionary of pdfPages with key of PDFPage's ID and value of PDFPage.
+    sources : dict
+        Dictionary of tuples of PyPDF2.PdfFileReader of source file and tuple of IDs of its pages in order, with key
+        of fileIdentity of file.
+    sourceKeys : dict
+        fileIdentity of source file with key of ID of each of its pages, to find the source of a reclaimed page.
+    pendingSources : dict
+        threading.Events of source files being loaded by key of their fileIdentity, reserved with reserveSource and
+        set once source is added or released.
+    lock : threading.Lock
+        Held while bank is changed.
 
     """
     def __init__(self):
         self.map = {}
+        self.sources = {}
+        self.sourceKeys = {}
+        self.pendingSources = {}
+        self.lock = threading.Lock()
 
     def contains(self, ID):
         """
@@ -59,7 +102,7 @@ class PDFPageBank():
         
         Parameters
         ---
-        ID : str
+        ID : int
             ID to check if in.
         
         Returns
@@ -68,7 +111,7 @@ class PDFPageBank():
             True if is in, false otherwise.
         
         """
-        return(ID in self.map.keys())
+        return(ID in self.map)
 
     def addPage(self, pdfPage):
         """
@@ -85,11 +128,27 @@ class PDFPageBank():
             Raised if pdfPage with matching key is already added to bank.
             
         """
-        if not self.contains(pdfPage.getID()):
-            self.map[pdfPage.getID()] = pdfPage
-        else:
-            raise NotUniqueError('PDFPage exists in PDFPageBank already.')
+        self.addPages([pdfPage])
+
+    def addPages(self, pdfPages):
+        """
+        Adds all of pdfPages to bank at once, taking lock only once.
+
+        Raises
+        ---
+        NotUniqueError
+            Raised if any of pdfPages has an ID already in bank or in pdfPages before it, in which case none are
+            added.
 
+        """
+        with self.lock:
+            IDs = set()
+            for pdfPage in pdfPages:
+                if self.contains(pdfPage.getID()) or pdfPage.getID() in IDs:
+                    raise NotUniqueError('PDFPage exists in PDFPageBank already.')
+                IDs.add(pdfPage.getID())
+            for pdfPage in pdfPages:
+                self.map[pdfPage.getID()] = pdfPage
 
     def getPage(self, ID):
         """
@@ -97,7 +156,7 @@ class PDFPageBank():
 
         Parameters
         ---
-        ID : str
+        ID : int
             ID of page to get.
 
         Returns
@@ -111,17 +170,170 @@ class PDFPageBank():
             Raised if no page has a matching ID.
 
         """
-        if self.contains(ID):
-            return(self.map.get(ID))
-        else:
+        page = self.map.get(ID)
+        if page is None:
             raise NotInBankError('No PDFPage with given ID in Bank.')
+        return(page)
 
     def countPages(self):
         """
         Returns int of number of pages in bank.
 
         """
-        return(len(self.map.keys()))
+        return(len(self.map))
+
+    def reclaimPages(self, IDs):
+        """
+        Removes pages with IDs from bank, along with sources of any removed page, so pages, their images and readers
+        of their files can be freed. IDs not in bank are ignored. Returns int of number of pages removed.
+
+        Parameters
+        ---
+        IDs : iterable
+            IDs of pages no longer referenced by any PDF, such as PDFHistoryRecorder.unreferencedIDs.
+
+        """
+        removed = 0
+        with self.lock:
+            for ID in IDs:
+                if self.map.pop(ID, None) is None:
+                    continue
+                removed += 1
+                identity = self.sourceKeys.get(ID)
+                if identity is not None:
+                    for sourceID in self.sources.pop(identity)[1]:
+                        self.sourceKeys.pop(sourceID, None)
+        return(removed)
+
+    def addSource(self, identity, reader, IDs):
+        """
+        Records reader and IDs of pages in order of source file with fileIdentity identity, keeping the first
+        recorded if file was already added.
+
+        Raises
+        ---
+        NotInBankError
+            Raised if any of IDs are not in bank, in which case nothing is recorded.
+
+        """
+        with self.lock:
+            for ID in IDs:
+                if not self.contains(ID):
+                    raise(NotInBankError('No PDFPage with given ID in Bank.'))
+            if identity not in self.sources:
+                self.sources[identity] = (reader, tuple(IDs))
+                for ID in IDs:
+                    self.sourceKeys[ID] = identity
+            reservation = self.pendingSources.pop(identity, None)
+        if reservation is not None:
+            reservation.set()
+
+    def getSource(self, identity):
+        """
+        Returns tuple of reader and tuple of page IDs of source file with fileIdentity identity, None if it was not
+        added.
+
+        """
+        return(self.sources.get(identity))
+
+    def reserveSource(self, identity):
+        """
+        Returns tuple of source of file with fileIdentity identity and None if it was added, otherwise reserves it and
+        returns tuple of None and threading.Event of reservation.
+
+        """
+        while True:
+            with self.lock:
+                source = self.sources.get(identity)
+                if source is not None:
+                    return((source, None))
+                pending = self.pendingSources.get(identity)
+                if pending is None:
+                    reservation = threading.Event()
+                    self.pendingSources[identity] = reservation
+                    return((None, reservation))
+            pending.wait()
+
+    def releaseSource(self, identity, reservation):
+        """
+        Gives up reservation of source of file with fileIdentity identity without adding it, so the next waiting
+        call of reserveSource takes it over. Does nothing if reservation is no longer held.
+
+        """
+        with self.lock:
+            if self.pendingSources.get(identity) is not reservation:
+                return
+            del self.pendingSources[identity]
+        reservation.set()
+
+    def getSourceIdentities(self):
+        """
+        Returns list of fileIdentity of every source file.
+
+        """
+        with self.lock:
+            return(list(self.sources))
+
+
+def _removeIndices(items, indices):
+    """
+    Returns list of items without those at sorted unique indices.
+
+    """
+    indexSet = set(indices)
+    return([item for i, item in enumerate(items) if i not in indexSet])
+
+
+def _insertIndices(items, indices, inserted):
+    """
+    Returns list of items with inserted placed at sorted unique indices of result, inverse of _removeIndices.
+
+    """
+    indexSet = set(indices)
+    total = len(items)+len(indexSet)
+    items = iter(items)
+    inserted = iter(inserted)
+    return([next(inserted) if i in indexSet else next(items) for i in range(total)])
+
+
+def _moveIndices(items, indices, insertAt):
+    """
+    Returns list of items with those at sorted unique indices taken out, keeping their order, and placed as a block
+    starting at index insertAt among the rest.
+
+    """
+    moving = [items[i] for i in indices]
+    staying = _removeIndices(items, indices)
+    return(staying[:insertAt] + moving + staying[insertAt:])
+
+
+def _unmoveIndices(items, indices, insertAt):
+    """
+    Returns list of items with block moved by _moveIndices put back at sorted unique indices, inverse of
+    _moveIndices.
+
+    """
+    end = insertAt+len(indices)
+    return(_insertIndices(items[:insertAt] + items[end:], indices, items[insertAt:end]))
+
+
+def _permute(items, order):
+    """
+    Returns list with item at index k being items[order[k]].
+
+    """
+    return([items[i] for i in order])
+
+
+def _inversePermutation(order):
+    """
+    Returns order undoing permutation order.
+
+    """
+    inverse = [0]*len(order)
+    for k, i in enumerate(order):
+        inverse[i] = k
+    return(inverse)
 
 
 class PDF():
@@ -130,10 +342,16 @@ class PDF():
 
     Attributes
     ---
-    orderedPages : list
-        List of ordered PDFPage IDs representing PDF.
+    orderedPages : PageSequence
+        Persistent sequence of ordered PDFPage IDs representing PDF, replaced rather than changed on every edit so
+        copies of PDF can share it.
     pageBank : PDFPageBank
         PDFPageBank where PDFPages in PDF are located.
+    operations : list
+        Journal of edits made since recording was last started, None if not recording. Each edit is a tuple of
+        ('insert', index, IDs), ('remove', index, IDs), ('move', fromIndex, toIndex), ('removeMany', indices, IDs),
+        ('moveMany', indices, insertAt) or ('permute', order) with IDs a PageSequence, as used by PDFHistoryRecorder
+        to store versions as deltas.
 
     Notes
     ---
@@ -141,8 +359,9 @@ class PDF():
 
     """
     def __init__(self, pageBank):
-        self.orderedPages = []
+        self.orderedPages = PageSequence()
         self.pageBank = pageBank
+        self.operations = None
 
     def __eq__(self, obj):
         if obj is self:
@@ -165,11 +384,40 @@ class PDF():
             raise(StopIteration)
 
     def _setOrderedPages(self, orderedPages):
-        self.orderedPages = orderedPages
+        self.orderedPages = PageSequence(orderedPages)
 
     def _getOrderedPages(self):
         return(self.orderedPages)
 
+    def _startRecording(self):
+        """
+        Starts a new empty journal of operations.
+
+        """
+        self.operations = []
+
+    def _takeOperations(self):
+        """
+        Returns journal of operations since recording started and stops recording, None if was not recording.
+
+        """
+        operations = self.operations
+        self.operations = None
+        return(operations)
+
+    def _recordOperation(self, operation):
+        """
+        Adds operation to journal if recording, merging consecutive inserts into one.
+
+        """
+        if self.operations is None:
+            return
+        if (operation[0] == 'insert' and self.operations and self.operations[-1][0] == 'insert' and
+                self.operations[-1][1]+len(self.operations[-1][2]) == operation[1]):
+            last = self.operations.pop()
+            operation = ('insert', last[1], last[2].append(operation[2]))
+        self.operations.append(operation)
+
     def addPage(self, pdfPage):
         """
         Adds PDFPage Object to end of PDF if is in pageBank.
@@ -186,7 +434,8 @@ class PDF():
 
         """
         if self.pageBank.contains(pdfPage.getID()):
-            self.orderedPages.append(pdfPage.getID())
+            self._recordOperation(('insert', len(self.orderedPages), PageSequence((pdfPage.getID(),))))
+            self.orderedPages = self.orderedPages.append((pdfPage.getID(),))
         else:
             raise(NotInBankError("PDFPage not in pagebank."))
 
@@ -202,33 +451,40 @@ class PDF():
         Removes page at index i from PDF. 
 
         """
-        self.orderedPages.pop(i)
+        if i < 0:
+            i += len(self.orderedPages)
+        ID = self.orderedPages[i]
+        self.orderedPages = self.orderedPages.delete(i)
+        self._recordOperation(('remove', i, PageSequence((ID,))))
+
+    def _movePage(self, i, toIndex):
+        """
+        Moves page at index i so that it ends up at index toIndex.
+
+        """
+        self.orderedPages = self.orderedPages.move(i, toIndex)
+        if i != toIndex:
+            self._recordOperation(('move', i, toIndex))
 
     def moveBeforePage(self, i, beforeThisIndex):
         """
         Moves page at index i in front of page at beforeThisIndex.
 
         """
-        self.orderedPages = (self.orderedPages[:beforeThisIndex] + 
-                             [self.orderedPages[i]] +  # Page to reinsert
-                             self.orderedPages[beforeThisIndex:])  # Slice including beforeThisIndex
-        if i < beforeThisIndex:  # Just removes item at old index since that is same original
-            self.removePage(i)
-        else:  # Removes item at old index+1, since old item would have been shifted by one if >= original i
-            self.removePage(i+1)
+        if i < beforeThisIndex:  # Pages between shift back by one once page at i is taken out
+            self._movePage(i, beforeThisIndex-1)
+        else:
+            self._movePage(i, beforeThisIndex)
 
     def moveAfterPage(self, i, afterThisIndex):
         """
         Moves page at index i after page at afterThisIndex.
 
         """
-        self.orderedPages = (self.orderedPages[:afterThisIndex+1] +  # Slice including afterThisIndex
-                             [self.orderedPages[i]] +  # Page to reinsert
-                             self.orderedPages[afterThisIndex+1:])
-        if i >= afterThisIndex:  # Removes item at old index+1, since old item would have been shifted by one if moving page is > afterThisIndex
-            self.removePage(i+1)
-        else:  # Just removes item at old index since that is same original
-            self.removePage(i)
+        if i <= afterThisIndex:  # Pages between shift back by one once page at i is taken out
+            self._movePage(i, afterThisIndex)
+        else:
+            self._movePage(i, afterThisIndex+1)
 
     def countPages(self):
         """
@@ -237,6 +493,132 @@ class PDF():
         """
         return(len(self.orderedPages))
 
+    def _normalizeIndices(self, indices):
+        """
+        Returns sorted tuple of unique indices with negative indices counted from end.
+
+        Raises
+        ---
+        IndexError
+            Raised if any index is out of range.
+
+        """
+        count = self.countPages()
+        normalized = set()
+        for i in indices:
+            if not -count <= i < count:
+                raise(IndexError('Page index out of range.'))
+            normalized.add(i % count)
+        return(tuple(sorted(normalized)))
+
+    def removePages(self, indices):
+        """
+        Removes pages at all indices from PDF in a single pass.
+
+        Raises
+        ---
+        IndexError
+            Raised if any index is out of range, in which case nothing is removed.
+
+        """
+        indices = self._normalizeIndices(indices)
+        if len(indices) == 0:
+            return
+        orderedPages = list(self.orderedPages)
+        removedIDs = PageSequence(orderedPages[i] for i in indices)
+        self.orderedPages = PageSequence(_removeIndices(orderedPages, indices))
+        self._recordOperation(('removeMany', indices, removedIDs))
+
+    def permutePages(self, order):
+        """
+        Reorders PDF so that page at index k becomes page previously at index order[k], in a single pass.
+
+        Raises
+        ---
+        InvalidPermutation
+            Raised if order does not contain every index of PDF exactly once.
+
+        """
+        order = tuple(order)
+        if sorted(order) != list(range(self.countPages())):
+            raise(InvalidPermutation('Order must contain every page index exactly once.'))
+        if order == tuple(range(self.countPages())):
+            return
+        self.orderedPages = PageSequence(_permute(list(self.orderedPages), order))
+        self._recordOperation(('permute', order))
+
+    def _movePagesTo(self, indices, insertAt):
+        """
+        Moves pages at sorted unique indices, keeping their order, so they start at insertAt among pages not being
+        moved. Only indices and insertAt are recorded, not the resulting order.
+
+        """
+        if all(i == insertAt+k for k, i in enumerate(indices)):  # Block already in place
+            return
+        self.orderedPages = PageSequence(_moveIndices(list(self.orderedPages), indices, insertAt))
+        self._recordOperation(('moveMany', indices, insertAt))
+
+    def movePagesBefore(self, indices, beforeThisIndex):
+        """
+        Moves pages at indices as a block, keeping their order, in front of page at beforeThisIndex. If the page at
+        beforeThisIndex is itself moved, block goes in front of the next page that is not.
+
+        Raises
+        ---
+        IndexError
+            Raised if any index or beforeThisIndex is out of range, in which case nothing is moved.
+
+        """
+        beforeThisIndex = self._normalizeIndices((beforeThisIndex,))[0]
+        indices = self._normalizeIndices(indices)
+        movingSet = set(indices)
+        self._movePagesTo(indices, sum(1 for i in range(beforeThisIndex) if i not in movingSet))
+
+    def movePagesAfter(self, indices, afterThisIndex):
+        """
+        Moves pages at indices as a block, keeping their order, after page at afterThisIndex. If the page at
+        afterThisIndex is itself moved, block goes after the previous page that is not.
+
+        Raises
+        ---
+        IndexError
+            Raised if any index or afterThisIndex is out of range, in which case nothing is moved.
+
+        """
+        afterThisIndex = self._normalizeIndices((afterThisIndex,))[0]
+        indices = self._normalizeIndices(indices)
+        movingSet = set(indices)
+        self._movePagesTo(indices, sum(1 for i in range(afterThisIndex+1) if i not in movingSet))
+
+    def reversePages(self):
+        """
+        Reverses order of all pages in PDF.
+
+        """
+        self.permutePages(range(self.countPages()-1, -1, -1))
+
+    def interleavePDF(self, pdf):
+        """
+        Interleaves pages of pdf with pages of self, alternating starting with first page of self. Pages left over
+        from the longer of the two are added at the end.
+
+        Raises
+        ---
+        NotInBankError
+            Raised if any pages in pdf are not in the same bank as this pdf, in which case nothing is changed.
+
+        """
+        count = self.countPages()
+        otherCount = pdf.countPages()
+        self.appendEntirePDF(pdf)
+        order = []
+        for i in range(max(count, otherCount)):
+            if i < count:
+                order.append(i)
+            if i < otherCount:
+                order.append(count+i)
+        self.permutePages(order)
+
     def appendEntirePDF(self, pdf):
         """
         Appends all pages in pdf to the end of self.
@@ -244,15 +626,20 @@ class PDF():
         Raises
         ---
         NotInBankError
-            Raised if any pages in pdf are not in the same bank as this pdf.
+            Raised if any pages in pdf are not in the same bank as this pdf, in which case nothing is appended.
 
         """
-        for page in pdf:
-            self.addPage(page)
+        IDs = pdf._getOrderedPages()
+        if pdf.pageBank is not self.pageBank:  # Pages of a PDF in the same bank were already checked when added
+            for ID in IDs:
+                if not self.pageBank.contains(ID):
+                    raise(NotInBankError("PDFPage not in pagebank."))
+        self._recordOperation(('insert', len(self.orderedPages), IDs))
+        self.orderedPages = self.orderedPages.append(IDs)
 
     def copyPDF(self):
         """
-        Returns different object but copy of PDF.
+        Returns different object but copy of PDF in O(1), sharing its orderedPages. Copy is not recording operations.
 
         Returns
         ---
@@ -261,43 +648,246 @@ class PDF():
 
         """
         pdf = PDF(self.pageBank)
-        pdf._setOrderedPages(self._getOrderedPages().copy())
+        pdf._setOrderedPages(self._getOrderedPages())
         return(pdf)
 
 
 class PDFHistoryRecorder():
     """
-    Object that contains a ordered history of versions of a PDf object.
-    
+    Object that contains a ordered history of versions of a PDf object. Versions are stored as deltas of the
+    operations that lead from the previous version, replayed from a full snapshot taken every snapshotInterval
+    versions, so memory grows with number of edits rather than size of PDF.
+
     Attributes
     ---
     currentVersion : int
         Current version of PDF that is selected currently by object using PDFHistoryRecorder.
-    versions : list <PDF>
-        Ordered versions of PDF.
+    deltas : list
+        Operations leading to each version from the one before, None for versions stored as a snapshot.
+    snapshots : dict
+        PageSequences of ordered PDFPage IDs by version, for versions stored as a snapshot. Snapshots share structure
+        with the PDFs they were taken of, so they cost next to nothing.
+    snapshotInterval : int
+        Maximum number of versions between snapshots.
+    maxVersions : int
+        Maximum number of versions kept, oldest versions are dropped beyond it. None to keep all.
+    droppedVersions : int
+        Number of versions dropped by last newVersion, either later versions it erased or oldest versions beyond
+        maxVersions.
+    references : dict
+        Number of times each PDFPage ID occurs in stored snapshots and in IDs recorded by stored deltas. Every ID in
+        a version occurs in a snapshot or delta it is built from, so IDs here are exactly those of all versions.
+    unreferencedIDs : list
+        IDs of pages no longer in any version after last newVersion, as they were only in versions it dropped.
+    currentPages : PageSequence
+        Ordered PDFPage IDs of current version.
+    pageBank : PDFPageBank
+        PDFPageBank of recorded PDFs, used to create returned PDFs.
+    trackedPDF : PDF
+        Last PDF given to or returned by recorder, whose operations journal starts at trackedVersion.
+    trackedVersion : int
+        Version trackedPDF was at when its journal was started.
+
+    Notes
+    ---
+    Versions are only stored as deltas when newVersion is given the PDF last passed to or returned by the recorder,
+    any other PDF is stored as a snapshot.
 
     """
-    def __init__(self):
+    def __init__(self, snapshotInterval=32, maxVersions=None):
         self.currentVersion = -1   # First pdf starts at 0 index
-        self.versions = []
+        self.deltas = []
+        self.snapshots = {}
+        self.snapshotInterval = snapshotInterval
+        self.maxVersions = maxVersions
+        self.droppedVersions = 0
+        self.references = {}
+        self.unreferencedIDs = []
+        self.currentPages = PageSequence()
+        self.pageBank = None
+        self.trackedPDF = None
+        self.trackedVersion = None
+
+    @staticmethod
+    def _applyOperations(orderedPages, operations):
+        """
+        Returns PageSequence of orderedPages with operations applied in order.
+
+        """
+        for operation in operations:
+            if operation[0] == 'insert':
+                orderedPages = orderedPages.insert(operation[1], operation[2])
+            elif operation[0] == 'remove':
+                orderedPages = orderedPages.delete(operation[1], len(operation[2]))
+            elif operation[0] == 'move':
+                orderedPages = orderedPages.move(operation[1], operation[2])
+            elif operation[0] == 'removeMany':
+                orderedPages = PageSequence(_removeIndices(list(orderedPages), operation[1]))
+            elif operation[0] == 'moveMany':
+                orderedPages = PageSequence(_moveIndices(list(orderedPages), operation[1], operation[2]))
+            elif operation[0] == 'permute':
+                orderedPages = PageSequence(_permute(list(orderedPages), operation[1]))
+        return(orderedPages)
+
+    @staticmethod
+    def _applyInverseOperations(orderedPages, operations):
+        """
+        Returns PageSequence of orderedPages with operations that were applied to it undone.
+
+        """
+        for operation in reversed(operations):
+            if operation[0] == 'insert':
+                orderedPages = orderedPages.delete(operation[1], len(operation[2]))
+            elif operation[0] == 'remove':
+                orderedPages = orderedPages.insert(operation[1], operation[2])
+            elif operation[0] == 'move':
+                orderedPages = orderedPages.move(operation[2], operation[1])
+            elif operation[0] == 'removeMany':
+                orderedPages = PageSequence(_insertIndices(list(orderedPages), operation[1], operation[2]))
+            elif operation[0] == 'moveMany':
+                orderedPages = PageSequence(_unmoveIndices(list(orderedPages), operation[1], operation[2]))
+            elif operation[0] == 'permute':
+                orderedPages = PageSequence(_permute(list(orderedPages), _inversePermutation(operation[1])))
+        return(orderedPages)
+
+    def _buildVersion(self, version):
+        """
+        Returns PageSequence of ordered PDFPage IDs of version, replayed from nearest snapshot at or before it.
+
+        """
+        snapshotVersion = version
+        while self.deltas[snapshotVersion] is not None:
+            snapshotVersion -= 1
+        orderedPages = self.snapshots[snapshotVersion]
+        for i in range(snapshotVersion+1, version+1):
+            orderedPages = self._applyOperations(orderedPages, self.deltas[i])
+        return(orderedPages)
+
+    def _trackedCopy(self):
+        """
+        Returns PDF of current version that is recording its operations, to be tracked by recorder.
+
+        """
+        pdf = PDF(self.pageBank)
+        pdf._setOrderedPages(self.currentPages)
+        pdf._startRecording()
+        self.trackedPDF = pdf
+        self.trackedVersion = self.currentVersion
+        return(pdf)
 
     def _getVersions(self):
-        return(self.versions)
+        versions = []
+        for i in range(len(self.deltas)):
+            pdf = PDF(self.pageBank)
+            pdf._setOrderedPages(self._buildVersion(i))
+            versions.append(pdf)
+        return(versions)
 
     def _getCurrentVersion(self):
         return(self.currentVersion)
 
+    def _recordedIDs(self, version):
+        """
+        Returns iterable of PDFPage IDs stored for version, all IDs of its snapshot or IDs recorded by its delta.
+
+        """
+        if self.deltas[version] is None:
+            return(self.snapshots[version])
+        return([ID for operation in self.deltas[version] if operation[0] in ('insert', 'remove', 'removeMany')
+                for ID in operation[2]])
+
+    def _addReferences(self, version):
+        for ID in self._recordedIDs(version):
+            self.references[ID] = self.references.get(ID, 0)+1
+
+    def _removeReferences(self, version):
+        """
+        Removes references of IDs stored for version, adding IDs left without any reference to unreferencedIDs.
+
+        """
+        for ID in self._recordedIDs(version):
+            count = self.references[ID]-1
+            if count == 0:
+                del self.references[ID]
+                self.unreferencedIDs.append(ID)
+            else:
+                self.references[ID] = count
+
+    def _dropOldestVersions(self, count):
+        """
+        Drops oldest versions, at least count of them and up to the first version stored as a snapshot after them so
+        it becomes the oldest version as is. Only if there is no such snapshot is the new oldest version built and
+        stored as a snapshot. Returns int of number of versions dropped.
+
+        """
+        laterSnapshots = [version for version in self.snapshots if version >= count]
+        if laterSnapshots:
+            count = min(laterSnapshots)
+        else:
+            self._removeReferences(count)
+            self.snapshots[count] = self._buildVersion(count)
+            self.deltas[count] = None
+            self._addReferences(count)
+        for version in range(count):
+            self._removeReferences(version)
+        self.deltas = self.deltas[count:]
+        self.snapshots = {version-count: pages for version, pages in self.snapshots.items() if version >= count}
+        self.currentVersion -= count
+        self.trackedVersion -= count
+        return(count)
+
+    def getReferencedIDs(self):
+        """
+        Returns set of IDs of every page in any version.
+
+        """
+        return(set(self.references))
+
+    def isReferenced(self, ID):
+        """
+        Returns true if page ID is in any version.
+
+        """
+        return(ID in self.references)
+
     def _setCurrentVersion(self, i):
         self.currentVersion = i
+        self.currentPages = self._buildVersion(i)
 
+    @traced('PDFHistoryRecorder.newVersion')
     def newVersion(self, pdf):
         """
-        Erase all later versions and add pdf to versions.
+        Erase all later versions and add pdf to versions, dropping oldest versions if there are more than maxVersions.
 
         """
+        operations = pdf._takeOperations()
+        isDelta = ((pdf is self.trackedPDF) and (self.trackedVersion == self.currentVersion) and
+                   (operations is not None))
+        self.droppedVersions = len(self.deltas)-self.currentVersion-1
+        self.unreferencedIDs = []
         self.currentVersion += 1
-        self.versions = self.versions[:self.currentVersion]
-        self.versions.append(pdf.copyPDF())
+        for version in range(self.currentVersion, len(self.deltas)):
+            self._removeReferences(version)
+        del self.deltas[self.currentVersion:]
+        for version in [version for version in self.snapshots if version >= self.currentVersion]:
+            del self.snapshots[version]
+        self.pageBank = pdf.pageBank
+        if isDelta and (self.currentVersion % self.snapshotInterval != 0):
+            self.currentPages = self._applyOperations(self.currentPages, operations)
+            self.deltas.append(operations)
+            instrumentation.count('PDFHistoryRecorder.deltas')
+        else:
+            instrumentation.count('PDFHistoryRecorder.snapshots')
+            self.currentPages = pdf._getOrderedPages()
+            self.snapshots[self.currentVersion] = self.currentPages
+            self.deltas.append(None)
+        self._addReferences(self.currentVersion)
+        pdf._startRecording()
+        self.trackedPDF = pdf
+        self.trackedVersion = self.currentVersion
+        if self.maxVersions is not None and len(self.deltas) > self.maxVersions:
+            self.droppedVersions += self._dropOldestVersions(len(self.deltas)-self.maxVersions)
+        self.unreferencedIDs = [ID for ID in dict.fromkeys(self.unreferencedIDs) if ID not in self.references]
 
     def previousVersion(self):
         """
@@ -310,8 +900,12 @@ class PDFHistoryRecorder():
 
         """
         if self.currentVersion > 0:
+            if self.deltas[self.currentVersion] is not None:
+                self.currentPages = self._applyInverseOperations(self.currentPages, self.deltas[self.currentVersion])
+            else:
+                self.currentPages = self._buildVersion(self.currentVersion-1)
             self.currentVersion -= 1
-            return(self.versions[self.currentVersion].copyPDF())
+            return(self._trackedCopy())
         else:
             raise(NoPrevVersions('No previous versions to rollback to.'))
 
@@ -325,9 +919,12 @@ class PDFHistoryRecorder():
             Thrown if there are no future versions (i.e. current index greater than or equal to length of versions).
 
         """
-        if self.currentVersion < len(self.versions)-1:
+        if self.currentVersion < len(self.deltas)-1:
             self.currentVersion += 1
-            return(self.versions[self.currentVersion].copyPDF())
+            if self.deltas[self.currentVersion] is not None:
+                self.currentPages = self._applyOperations(self.currentPages, self.deltas[self.currentVersion])
+            else:
+                self.currentPages = self.snapshots[self.currentVersion]
+            return(self._trackedCopy())
         else:
             raise(NoLaterVersions('No later versions to rollforward to.'))
-
@@ -0,0 +1,703 @@
+import os
+import time
+import queue
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from errors import *
+from instrument import *
+
+
+# DPI each resolution tier of a page is rendered at. Preview fits the editor's 6x7.75 inch canvas at screen
+# resolution, full matches pdf2image's default DPI.
+RESOLUTION_TIERS = {'thumbnail': 16, 'preview': 100, 'full': 200}
+
+# Black and white colours grayscale page images are colorized with for each highlight style
+HIGHLIGHT_STYLES = {'move': ('#000000', '#add8e6')}
+
+
+class RasterCache():
+    """
+    Least recently used cache of rendered page images bounded by a memory budget in bytes.
+
+    Attributes
+    ---
+    maxBytes : int
+        Memory budget of cache, least recently used images are evicted once exceeded.
+    currentBytes : int
+        Estimated bytes held by images currently in cache.
+    entries : collections.OrderedDict
+        Cached images by key, ordered from least to most recently used.
+    hits : int
+        Number of requests for a key found in cache.
+    misses : int
+        Number of requests for a key not found in cache.
+    evictions : int
+        Number of images evicted to stay within maxBytes.
+    diskCache : DiskRasterCache
+        Persistent cache behind this one that PageRasters check before rendering, None if there is none.
+
+    """
+    def __init__(self, maxBytes, diskCache=None):
+        self.diskCache = diskCache
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def imageBytes(image):
+        """
+        Returns estimated bytes held by image, objects that are not images count as 0.
+
+        """
+        try:
+            return(image.width*image.height*len(image.getbands()))
+        except(AttributeError):
+            return(0)
+
+    def contains(self, key):
+        """
+        Returns true if image with key is in cache, without counting as a use.
+
+        """
+        with self.lock:
+            return(key in self.entries)
+
+    def get(self, key):
+        """
+        Returns image with key and marks it most recently used, None if not in cache.
+
+        """
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return(self.entries[key][0])
+            else:
+                self.misses += 1
+                return(None)
+
+    def put(self, key, image):
+        """
+        Adds image to cache as most recently used, evicting least recently used images until within maxBytes.
+
+        """
+        size = self.imageBytes(image)
+        with self.lock:
+            if key in self.entries:
+                self.currentBytes -= self.entries.pop(key)[1]
+            self.entries[key] = (image, size)
+            self.currentBytes += size
+            self._evict()
+
+    def setMaxBytes(self, maxBytes):
+        """
+        Changes memory budget, evicting images if the new budget is already exceeded.
+
+        """
+        with self.lock:
+            self.maxBytes = maxBytes
+            self._evict()
+
+    def clear(self):
+        """
+        Removes all images from cache and resets counters.
+
+        """
+        with self.lock:
+            self.entries.clear()
+            self.currentBytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def averageImageBytes(self):
+        """
+        Returns mean estimated bytes of images currently in cache, 0 if empty.
+
+        """
+        with self.lock:
+            return(self.currentBytes//len(self.entries) if self.entries else 0)
+
+    def getStats(self):
+        """
+        Returns dict of hits, misses, evictions, number of entries and bytes currently held.
+
+        """
+        with self.lock:
+            return({'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'bytes': self.currentBytes})
+
+    def _evict(self):
+        # Always keeps most recently added image even if alone it is over budget
+        while self.currentBytes > self.maxBytes and len(self.entries) > 1:
+            key, (image, size) = self.entries.popitem(last=False)
+            self.currentBytes -= size
+            self.evictions += 1
+
+
+# Content hashes of files by (real path, size, modification time), so each version of a file is only hashed once.
+# Least recently used hashes are forgotten beyond FILE_HASHES_LIMIT, as every version of every file adds one.
+_fileHashes = OrderedDict()
+_fileHashesLock = threading.Lock()
+FILE_HASHES_LIMIT = 4096
+
+
+def fileIdentity(filePath):
+    """
+    Returns tuple of real path, size, modification time and inode of file at filePath, which changes whenever the
+    file is replaced or written to.
+
+    """
+    stat = os.stat(filePath)
+    return((os.path.realpath(filePath), stat.st_size, stat.st_mtime_ns, stat.st_ino))
+
+
+def fileContentHash(filePath, identity=None):
+    """
+    Returns hex sha256 digest of contents of file at filePath, remembered until the file's size or modification
+    time changes. Files of any size are read in blocks, so memory use stays flat. If identity is given and file no
+    longer has that fileIdentity, returns None.
+
+    """
+    key = fileIdentity(filePath)
+    if identity is not None and key != identity:
+        return(None)
+    fileHash = _getFileHash(key)
+    if fileHash is not None:
+        return(fileHash)
+    digest = hashlib.sha256()
+    with open(filePath, 'rb') as fileStream:
+        for block in iter(lambda: fileStream.read(1024*1024), b''):
+            digest.update(block)
+    with _fileHashesLock:
+        _fileHashes[key] = digest.hexdigest()
+        _fileHashes.move_to_end(key)
+        while len(_fileHashes) > FILE_HASHES_LIMIT:
+            _fileHashes.popitem(last=False)
+    return(digest.hexdigest())
+
+
+def _getFileHash(key):
+    # Returns remembered hash of fileIdentity key marking it most recently used, None if not remembered
+    with _fileHashesLock:
+        if key in _fileHashes:
+            _fileHashes.move_to_end(key)
+            return(_fileHashes[key])
+    return(None)
+
+
+def knownFileContentHash(filePath):
+    """
+    Returns fileContentHash of file at filePath if it was already computed for its current fileIdentity, None
+    otherwise, without reading file.
+
+    """
+    return(_getFileHash(fileIdentity(filePath)))
+
+
+class DiskRasterCache():
+    """
+    Persistent cache of rendered page images stored as png files, keyed by content hash of the pdf file, page index
+    and DPI, and shared safely by several processes.
+
+    Attributes
+    ---
+    directory : str
+        Directory images are stored in, created when first needed.
+    maxBytes : int
+        Size budget of directory in bytes.
+    evictInterval : int
+        Number of puts between checks of directory size.
+    partGracePeriod : float
+        Seconds after which a temporary file is considered abandoned, long enough that no write still in progress
+        in any process sharing directory is deleted.
+    putsSinceEvict : int
+        Number of puts since directory size was last checked.
+    pending : queue.Queue
+        Writes and hashes waiting for writer thread, tuples of file path, fileIdentity, page number, DPI and image,
+        with page number, DPI and image None for hashes. Holds at most maxPending, later ones are dropped.
+    writer : threading.Thread
+        Daemon thread doing pending work, started on first use.
+
+    """
+    def __init__(self, directory=None, maxBytes=1024*1024*1024, evictInterval=32, maxPending=64,
+                 partGracePeriod=3600):
+        if directory is None:
+            cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            directory = os.path.join(cacheHome, 'simplepdf', 'rasters')
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.evictInterval = evictInterval
+        self.partGracePeriod = partGracePeriod
+        self.putsSinceEvict = evictInterval  # Checks size on first put
+        self.pending = queue.Queue(maxPending)
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def _getPath(self, fileHash, pageNumber, dpi):
+        return(os.path.join(self.directory, '{}_{}_{}.png'.format(fileHash, pageNumber, dpi)))
+
+    def get(self, fileHash, pageNumber, dpi):
+        """
+        Returns stored image of page at dpi and marks it most recently used, None if not stored or unreadable.
+
+        """
+        from PIL import Image
+        path = self._getPath(fileHash, pageNumber, dpi)
+        try:
+            with Image.open(path) as image:
+                image.load()
+            os.utime(path)
+        except(OSError, SyntaxError, ValueError):  # Missing, evicted meanwhile or corrupt
+            return(None)
+        return(image)
+
+    def put(self, fileHash, pageNumber, dpi, image):
+        """
+        Stores image of page at dpi, checking size of directory every evictInterval puts. Failures to write are
+        ignored as the image can always be rendered again.
+
+        """
+        path = self._getPath(fileHash, pageNumber, dpi)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fileDescriptor, tempPath = tempfile.mkstemp(suffix='.part', dir=self.directory)
+            try:
+                with os.fdopen(fileDescriptor, 'wb') as fileStream:
+                    image.save(fileStream, format='PNG', compress_level=1)
+                os.replace(tempPath, path)
+            except(BaseException):
+                os.remove(tempPath)
+                raise
+        except(OSError, ValueError):
+            return
+        with self.lock:
+            self.putsSinceEvict += 1
+            if self.putsSinceEvict < self.evictInterval:
+                return
+            self.putsSinceEvict = 0
+        self.evict()
+
+    def getForFile(self, filePath, pageNumber, dpi):
+        """
+        Returns stored image of page of pdf file at filePath at dpi, None if not stored or if file was not hashed yet,
+        in which case it is hashed in the background.
+
+        """
+        fileHash = knownFileContentHash(filePath)
+        if fileHash is None:
+            self._addPending((filePath, fileIdentity(filePath), None, None, None))
+            return(None)
+        return(self.get(fileHash, pageNumber, dpi))
+
+    def putForFile(self, filePath, pageNumber, dpi, image):
+        """
+        Queues image of page of pdf file at filePath at dpi to be stored by writer thread and returns immediately.
+        Image is not stored if file changes before it is written.
+
+        """
+        self._addPending((filePath, fileIdentity(filePath), pageNumber, dpi, image))
+
+    def _addPending(self, work):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write, name='DiskRasterCache', daemon=True)
+                self.writer.start()
+        try:
+            self.pending.put_nowait(work)
+        except(queue.Full):  # Writer is behind, a cache can always skip an image
+            pass
+
+    def _write(self):
+        while True:
+            filePath, identity, pageNumber, dpi, image = self.pending.get()
+            try:
+                fileHash = fileContentHash(filePath, identity)
+                if fileHash is not None and image is not None:
+                    self.put(fileHash, pageNumber, dpi, image)
+            except(OSError):  # File removed meanwhile
+                pass
+            finally:
+                self.pending.task_done()
+
+    def flush(self):
+        """
+        Blocks until all queued work of writer thread is done.
+
+        """
+        self.pending.join()
+
+    def evict(self):
+        """
+        Deletes abandoned temporary files, then least recently used images until directory is within maxBytes.
+
+        """
+        entries = []
+        abandonedBefore = time.time_ns()-int(self.partGracePeriod*1e9)
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    try:
+                        if entry.name.endswith('.png'):
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                        elif entry.name.endswith('.part') and entry.stat().st_mtime_ns < abandonedBefore:
+                            os.remove(entry.path)
+                    except(OSError):  # Removed meanwhile by another process
+                        pass
+        except(OSError):
+            return
+        totalBytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except(OSError):  # Already removed by another process
+                pass
+            totalBytes -= size
+
+    def getBytes(self):
+        """
+        Returns total bytes of images stored in directory.
+
+        """
+        try:
+            with os.scandir(self.directory) as scan:
+                return(sum(entry.stat().st_size for entry in scan if entry.name.endswith('.png')))
+        except(OSError):
+            return(0)
+
+
+def convert_from_path(*args, **kwargs):
+    """
+    Calls pdf2image's convert_from_path, importing pdf2image on first use so code paths that never rasterize, such as
+    the command line interface, do not pay for importing it.
+
+    """
+    from pdf2image import convert_from_path as pdf2imageConvertFromPath
+    return(pdf2imageConvertFromPath(*args, **kwargs))
+
+
+def highlightImage(image, style='move'):
+    """
+    Returns copy of image in grayscale colorized with colours of highlight style.
+
+    Raises
+    ---
+    KeyError
+        Raised if style is not a key of HIGHLIGHT_STYLES.
+
+    """
+    from PIL import ImageOps
+    black, white = HIGHLIGHT_STYLES[style]
+    return(ImageOps.colorize(ImageOps.grayscale(image), black=black, white=white))
+
+
+# Process wide cache shared by all PageRasters. Memory only unless a diskCache is given to it, as the GUI does, so
+# importers that never show pages, such as tests, the command line interface and services, write nothing to disk.
+rasterCache = RasterCache(512*1024*1024)
+
+
+class PageRaster():
+    """
+    Lazy handle to the images of a single page of a pdf file, rendered when requested and kept in cache for each
+    resolution tier in RESOLUTION_TIERS.
+
+    Attributes
+    ---
+    filePath : str
+        File path of pdf file containing page.
+    pageNumber : int
+        Index of page in pdf file, starting at 0.
+    cache : RasterCache
+        Cache rendered image is stored in, process wide rasterCache by default.
+    identity : tuple
+        fileIdentity of file when raster was created, or when first needed if not given, None until known.
+
+    """
+    def __init__(self, filePath, pageNumber, cache=None, identity=None):
+        self.filePath = filePath
+        self.pageNumber = pageNumber
+        self.cache = cache if cache is not None else rasterCache
+        self.identity = identity
+
+    def __eq__(self, obj):
+        if obj is self:
+            return(True)
+        elif not isinstance(obj, PageRaster):
+            return(False)
+        else:
+            return((obj.filePath == self.filePath) and
+                   (obj.pageNumber == self.pageNumber) and
+                   (obj.getIdentity() == self.getIdentity()))
+
+    @staticmethod
+    def getDPI(tier):
+        """
+        Returns DPI of resolution tier.
+
+        Raises
+        ---
+        InvalidResolutionTier
+            Raised if tier is not a key of RESOLUTION_TIERS.
+
+        """
+        if tier in RESOLUTION_TIERS:
+            return(RESOLUTION_TIERS[tier])
+        else:
+            raise(InvalidResolutionTier('Resolution tier must be one of {}.'.format(list(RESOLUTION_TIERS))))
+
+    def getIdentity(self):
+        """
+        Returns identity, None if file does not exist.
+
+        """
+        if self.identity is None:
+            try:
+                self.identity = fileIdentity(self.filePath)
+            except(OSError):
+                return(None)
+        return(self.identity)
+
+    def getCacheKey(self, tier='full'):
+        """
+        Returns key identifying page image of resolution tier in cache.
+
+        """
+        return((self.filePath, self.getIdentity(), self.pageNumber, tier))
+
+    def isRendered(self, tier='full'):
+        """
+        Returns true if page image of resolution tier is currently in cache.
+
+        """
+        return(self.cache.contains(self.getCacheKey(tier)))
+
+    def render(self, tier='full'):
+        """
+        Renders and returns image of page at resolution tier from pdf file, without storing it.
+
+        """
+        return(convert_from_path(self.filePath, dpi=self.getDPI(tier),
+                                 first_page=self.pageNumber+1, last_page=self.pageNumber+1)[0])
+
+    def getImage(self, tier='full'):
+        """
+        Returns image of page at resolution tier from cache, loading it from disk cache or rendering it and caching it
+        first if not there.
+
+        Raises
+        ---
+        InvalidResolutionTier
+            Raised if tier is not a key of RESOLUTION_TIERS.
+
+        """
+        self.getDPI(tier)  # Validates tier before it is used as part of a cache key
+        image = self.cache.get(self.getCacheKey(tier))
+        if image is None:
+            instrumentation.count('rasterCache.misses')
+            if self.cache.diskCache is not None:
+                image = self.cache.diskCache.getForFile(self.filePath, self.pageNumber, self.getDPI(tier))
+            if image is None:
+                with instrumentation.span('PageRaster.render', page=self.pageNumber, tier=tier):
+                    image = self.render(tier)
+                self.storeImage(image, tier, memory=False)
+            self.cache.put(self.getCacheKey(tier), image)
+        return(image)
+
+    def storeImage(self, image, tier='full', memory=True):
+        """
+        Stores image rendered elsewhere as image of page at resolution tier, in disk cache in the background and if
+        memory is true in cache.
+
+        """
+        if self.cache.diskCache is not None:
+            self.cache.diskCache.putForFile(self.filePath, self.pageNumber, self.getDPI(tier), image)
+        if memory:
+            self.cache.put(self.getCacheKey(tier), image)
+
+    def getHighlightedImage(self, tier='preview', style='move'):
+        """
+        Returns image of page at resolution tier highlighted in style. Highlighted images are a derived tier cached
+        like any other, so only the first request after a render pays for the highlight.
+
+        """
+        key = self.getCacheKey(tier)+('highlight', style)
+        image = self.cache.get(key)
+        if image is None:
+            image = highlightImage(self.getImage(tier), style)
+            self.cache.put(key, image)
+        return(image)
+
+
+def _renderPageRange(filePath, firstPage, lastPage, dpi):
+    # Module level so it can be sent to worker processes, pages are indexed from 0 like PageRaster
+    return(convert_from_path(filePath, dpi=dpi, first_page=firstPage+1, last_page=lastPage+1, thread_count=1))
+
+
+class ParallelPageRenderer():
+    """
+    Renders ranges of pages of a pdf file on a process pool, each worker running its own poppler invocation on a
+    chunk of the range. Results are streamed back in page order.
+
+    Attributes
+    ---
+    workers : int
+        Number of worker processes, number of cpus by default.
+    chunkSize : int
+        Number of consecutive pages rendered by a single poppler invocation.
+
+    """
+    def __init__(self, workers=None, chunkSize=8):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.chunkSize = chunkSize
+
+    def _createExecutor(self):
+        return(ProcessPoolExecutor(max_workers=self.workers))
+
+    def getChunks(self, firstPage, lastPage):
+        """
+        Returns list of (first, last) page index tuples splitting pages firstPage to lastPage inclusive into chunks.
+
+        """
+        return([(first, min(first+self.chunkSize-1, lastPage))
+                for first in range(firstPage, lastPage+1, self.chunkSize)])
+
+    def renderPages(self, filePath, firstPage, lastPage, tier='full'):
+        """
+        Generator rendering pages firstPage to lastPage inclusive of file at filePath at resolution tier, yielding
+        (pageNumber, image) tuples in page order. At most twice as many chunks as workers are in flight at once, so
+        rendered pages are not held any longer than it takes for them to be consumed.
+
+        Raises
+        ---
+        InvalidResolutionTier
+            Raised if tier is not a key of RESOLUTION_TIERS.
+
+        """
+        dpi = PageRaster.getDPI(tier)
+        chunks = deque(self.getChunks(firstPage, lastPage))
+        inFlight = deque()
+        executor = self._createExecutor()
+        try:
+            while chunks or inFlight:
+                while chunks and len(inFlight) < 2*self.workers:  # Keeps workers busy while earlier chunks are consumed
+                    first, last = chunks.popleft()
+                    inFlight.append((first, executor.submit(_renderPageRange, filePath, first, last, dpi)))
+                first, future = inFlight.popleft()
+                for i, image in enumerate(future.result()):
+                    yield((first+i, image))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class PagePrefetcher():
+    """
+    Renders pages likely to be viewed next into their cache on a background thread, so flipping to them does not
+    wait on a render. Pages are predicted from the direction of navigation and, while moving a page, the page being
+    moved. Work for pages no longer predicted is cancelled if it has not started.
+
+    Attributes
+    ---
+    tier : str
+        Resolution tier to render pages at.
+    depth : int
+        Number of pages ahead in direction of navigation to prefetch.
+    executor : concurrent.futures.ThreadPoolExecutor
+        Executor rendering pages.
+    pending : dict
+        Futures of scheduled renders by cache key of page image.
+
+    """
+    def __init__(self, tier='preview', depth=3, workers=1):
+        self.tier = tier
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def predictIndices(self, currentIndex, direction, pageCount, indexToMove=None):
+        """
+        Returns list of page indices to prefetch, most likely next first: depth pages ahead in direction, the page
+        being moved if any, then the page just behind.
+
+        """
+        direction = 1 if direction >= 0 else -1
+        indices = [currentIndex+direction*k for k in range(1, self.depth+1)]
+        if indexToMove is not None:
+            indices.append(indexToMove)
+        indices.append(currentIndex-direction)
+        predicted = []
+        for i in indices:
+            if 0 <= i < pageCount and i != currentIndex and i not in predicted:
+                predicted.append(i)
+        return(predicted)
+
+    def _budgetedCount(self, cache, count):
+        """
+        Returns how many of count pages can be prefetched while using at most half of cache's memory budget.
+
+        """
+        imageBytes = cache.averageImageBytes()
+        if imageBytes == 0:
+            return(count)
+        return(min(count, cache.maxBytes//(2*imageBytes)))
+
+    def prefetch(self, pdf, currentIndex, direction, indexToMove=None):
+        """
+        Schedules renders of predicted pages of pdf not already cached, cancelling scheduled renders of pages that
+        are no longer predicted.
+
+        """
+        rasters = []
+        for i in self.predictIndices(currentIndex, direction, pdf.countPages(), indexToMove):
+            raster = pdf.getPage(i).image
+            if isinstance(raster, PageRaster):
+                rasters.append(raster)
+        if rasters:
+            rasters = rasters[:self._budgetedCount(rasters[0].cache, len(rasters))]
+        wanted = {raster.getCacheKey(self.tier): raster for raster in rasters}
+        with self.lock:
+            for key in list(self.pending):
+                if key not in wanted and self.pending[key].cancel():
+                    del self.pending[key]
+            for key, raster in wanted.items():
+                if key not in self.pending and not raster.isRendered(self.tier):
+                    self.pending[key] = self.executor.submit(self._render, key, raster)
+
+    def _render(self, key, raster):
+        try:
+            raster.getImage(self.tier)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def waitFor(self, page):
+        """
+        Waits for a scheduled render of page to finish if there is one, so page is not rendered twice at once.
+
+        """
+        if isinstance(page.image, PageRaster):
+            key = page.image.getCacheKey(self.tier)
+            with self.lock:
+                future = self.pending.get(key)
+                if future is not None and future.cancel():  # Not started, quicker for caller to render it now
+                    del self.pending[key]
+                    future = None
+            if future is not None:
+                future.exception()  # Waits without raising, a failed render is retried by caller
+
+    def shutdown(self):
+        """
+        Cancels scheduled renders and stops executor.
+
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
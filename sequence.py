@@ -0,0 +1,254 @@
+from array import array
+
+
+class _RopeNode():
+    """
+    Immutable node of a PageSequence rope. Leaves hold a packed array or tuple of items, branches hold two children.
+
+    Attributes
+    ---
+    left : _RopeNode
+        Left child, None for leaves.
+    right : _RopeNode
+        Right child, None for leaves.
+    items : array.array or tuple
+        Items of leaf, None for branches.
+    size : int
+        Number of items under node.
+    height : int
+        Height of node, 0 for leaves.
+
+    """
+    __slots__ = ('left', 'right', 'items', 'size', 'height')
+
+    def __init__(self, left=None, right=None, items=None):
+        self.left = left
+        self.right = right
+        self.items = items
+        if items is not None:
+            self.size = len(items)
+            self.height = 0
+        else:
+            self.size = left.size+right.size
+            self.height = max(left.height, right.height)+1
+
+    def isLeaf(self):
+        return(self.items is not None)
+
+
+# Maximum number of items stored in a single leaf
+LEAF_SIZE = 64
+
+
+def _pack(items):
+    """
+    Returns items as an array of unsigned ints if they all fit in one, so leaves of int page IDs take 4 bytes per
+    item, and as a tuple otherwise.
+
+    """
+    if isinstance(items, array):
+        return(items)
+    try:
+        return(array('I', items))
+    except(TypeError, OverflowError):
+        return(tuple(items))
+
+
+def _concatenate(left, right):
+    if type(left) is type(right):
+        return(left+right)
+    return(_pack(list(left)+list(right)))
+
+
+def _leaf(items):
+    return(_RopeNode(items=_pack(items)) if len(items) > 0 else None)
+
+
+def _balance(left, right):
+    """
+    Returns branch of left and right, rotated so child heights differ by at most one given they differ by at most two.
+
+    """
+    if left.height > right.height+1:
+        if left.left.height >= left.right.height:
+            return(_RopeNode(left.left, _RopeNode(left.right, right)))
+        else:
+            return(_RopeNode(_RopeNode(left.left, left.right.left), _RopeNode(left.right.right, right)))
+    elif right.height > left.height+1:
+        if right.right.height >= right.left.height:
+            return(_RopeNode(_RopeNode(left, right.left), right.right))
+        else:
+            return(_RopeNode(_RopeNode(left, right.left.left), _RopeNode(right.left.right, right.right)))
+    else:
+        return(_RopeNode(left, right))
+
+
+def _join(left, right):
+    """
+    Returns balanced rope of items of left followed by items of right, sharing all untouched nodes. A leaf joined
+    to a taller rope is merged into its neighbouring leaf when they fit together, so single item edits do not leave
+    behind a trail of tiny leaves.
+
+    """
+    if left is None:
+        return(right)
+    elif right is None:
+        return(left)
+    elif left.isLeaf() and right.isLeaf():
+        if left.size+right.size <= LEAF_SIZE:
+            return(_RopeNode(items=_concatenate(left.items, right.items)))
+        return(_RopeNode(left, right))
+    elif left.height > right.height+1 or right.isLeaf():
+        return(_balance(left.left, _join(left.right, right)))
+    elif right.height > left.height+1 or left.isLeaf():
+        return(_balance(_join(left, right.left), right.right))
+    else:
+        return(_RopeNode(left, right))
+
+
+def _split(node, k):
+    """
+    Returns tuple of ropes of first k items of node and of the rest.
+
+    """
+    if node is None:
+        return((None, None))
+    elif node.isLeaf():
+        return((_leaf(node.items[:k]), _leaf(node.items[k:])))
+    elif k <= node.left.size:
+        left, right = _split(node.left, k)
+        return((left, _join(right, node.right)))
+    else:
+        left, right = _split(node.right, k-node.left.size)
+        return((_join(node.left, left), right))
+
+
+def _build(leaves):
+    """
+    Returns balanced rope of list of leaves in order.
+
+    """
+    while len(leaves) > 1:
+        leaves = [_RopeNode(leaves[i], leaves[i+1]) if i+1 < len(leaves) else leaves[i]
+                  for i in range(0, len(leaves), 2)]
+    return(leaves[0] if leaves else None)
+
+
+class PageSequence():
+    """
+    Immutable sequence backed by a persistent balanced rope of leaves of at most LEAF_SIZE items, packed into arrays
+    when items are ints such as the page IDs of IDGenerator. Editing returns a new PageSequence in O(log n) that shares
+    all untouched structure with the original, so copies are free.
+
+    Attributes
+    ---
+    root : _RopeNode
+        Root of rope, None if sequence is empty.
+
+    """
+    __slots__ = ('root',)
+
+    def __init__(self, items=()):
+        if isinstance(items, PageSequence):
+            self.root = items.root
+        else:
+            items = _pack(items if isinstance(items, (list, tuple, array)) else list(items))
+            self.root = _build([_RopeNode(items=items[i:i+LEAF_SIZE]) for i in range(0, len(items), LEAF_SIZE)])
+
+    @staticmethod
+    def _fromRoot(root):
+        sequence = PageSequence()
+        sequence.root = root
+        return(sequence)
+
+    def __len__(self):
+        return(self.root.size if self.root is not None else 0)
+
+    def __iter__(self):
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if node.isLeaf():
+                yield from node.items
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return(list(self)[i])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise(IndexError('PageSequence index out of range.'))
+        node = self.root
+        while not node.isLeaf():
+            if i < node.left.size:
+                node = node.left
+            else:
+                i -= node.left.size
+                node = node.right
+        return(node.items[i])
+
+    def __eq__(self, obj):
+        if obj is self or (isinstance(obj, PageSequence) and obj.root is self.root):
+            return(True)
+        try:
+            if len(obj) != len(self):
+                return(False)
+        except(TypeError):
+            return(False)
+        return(all(a == b for a, b in zip(self, obj)))
+
+    def __repr__(self):
+        return('PageSequence({})'.format(list(self)))
+
+    def _normalizeIndex(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise(IndexError('PageSequence index out of range.'))
+        return(i)
+
+    def insert(self, i, items):
+        """
+        Returns new PageSequence with items inserted before index i.
+
+        """
+        inserted = items.root if isinstance(items, PageSequence) else PageSequence(items).root
+        left, right = _split(self.root, i)
+        return(PageSequence._fromRoot(_join(_join(left, inserted), right)))
+
+    def append(self, items):
+        """
+        Returns new PageSequence with items added to the end.
+
+        """
+        return(self.insert(len(self), items))
+
+    def delete(self, i, count=1):
+        """
+        Returns new PageSequence without count items starting at index i.
+
+        """
+        i = self._normalizeIndex(i)
+        left, rest = _split(self.root, i)
+        removed, right = _split(rest, count)
+        return(PageSequence._fromRoot(_join(left, right)))
+
+    def slice(self, start, stop):
+        """
+        Returns new PageSequence of items from index start up to but excluding index stop.
+
+        """
+        left, rest = _split(self.root, stop)
+        removed, middle = _split(left, start)
+        return(PageSequence._fromRoot(middle))
+
+    def move(self, i, toIndex):
+        """
+        Returns new PageSequence with item at index i taken out and reinserted so it ends up at index toIndex.
+
+        """
+        item = self[i]
+        return(self.delete(i).insert(toIndex, (item,)))
@@ -1,7 +1,21 @@
+import os
+import sys
+import json
+import hashlib
+import mmap
+import asyncio
+import random
+import tempfile
 import unittest
+import subprocess
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 from errors import *
 from model import *
 from tools import *
+from cli import *
+from asyncinterface import *
 
 
 class testIDGenerator(unittest.TestCase):
@@ -14,6 +28,57 @@ class testIDGenerator(unittest.TestCase):
         thirdCode = generator.generateID()
         self.assertTrue(thirdCode != firstCode)
         self.assertTrue(thirdCode != secondCode)
+        self.assertTrue(isinstance(firstCode, int))
+
+
+class testInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+
+    def testDisabledRecordsNothing(self):
+        with self.instrumentation.span('span'):
+            pass
+        self.instrumentation.count('counter')
+        self.assertEqual(self.instrumentation.getStats(), {'spans': [], 'counters': {}})
+        self.assertEqual(list(self.instrumentation.events), [])
+
+    def testSpansAndCounters(self):
+        self.instrumentation.enable()
+        for i in range(3):
+            with self.instrumentation.span('span', index=i):
+                pass
+        self.instrumentation.count('counter', 2)
+        self.instrumentation.count('counter')
+        stats = self.instrumentation.getStats()
+        self.assertEqual([(span['name'], span['calls']) for span in stats['spans']], [('span', 3)])
+        self.assertEqual(stats['counters'], {'counter': 3})
+        with tempfile.TemporaryDirectory() as directory:
+            filePath = os.path.join(directory, 'trace.json')
+            self.instrumentation.exportChromeTrace(filePath)
+            with open(filePath) as fileStream:
+                events = json.load(fileStream)['traceEvents']
+        self.assertEqual([event['ph'] for event in events], ['X', 'X', 'X', 'C', 'C'])
+        self.assertEqual(events[1]['args'], {'index': '1'})
+
+    def testMaxEvents(self):
+        self.instrumentation = Instrumentation(maxEvents=2)
+        self.instrumentation.enable()
+        for i in range(5):
+            with self.instrumentation.span('span', index=i):
+                pass
+        self.assertEqual([event['args'] for event in self.instrumentation.events], [{'index': '3'}, {'index': '4'}])
+        self.assertEqual(self.instrumentation.getStats()['spans'][0]['calls'], 5)
+
+    def testTracedNewVersion(self):
+        instrumentation.enable()
+        try:
+            PDFHistoryRecorder().newVersion(PDF(PDFPageBank()))
+            names = [span['name'] for span in instrumentation.getStats()['spans']]
+            self.assertTrue('PDFHistoryRecorder.newVersion' in names)
+        finally:
+            instrumentation.disable()
+            instrumentation.clear()
 
 
 class testPDFPage(unittest.TestCase):
@@ -33,6 +98,925 @@ class testPDFPage(unittest.TestCase):
         self.assertTrue(self.page1 == PDFPage(self.page1.getID(), None, None))
 
 
+class fakeImage():
+    """
+    Stand in for a PIL image with only what RasterCache needs to size it.
+
+    """
+    def __init__(self, name, width=10, height=10):
+        self.name = name
+        self.width = width
+        self.height = height
+
+    def __eq__(self, obj):
+        return(isinstance(obj, fakeImage) and obj.name == self.name)
+
+    def getbands(self):
+        return(('R', 'G', 'B'))
+
+
+class countingPageRaster(PageRaster):
+    """
+    PageRaster that counts renders and returns a fake image instead of calling poppler.
+
+    """
+    def __init__(self, filePath, pageNumber, cache=None):
+        super().__init__(filePath, pageNumber, cache if cache is not None else RasterCache(10**6))
+        self.renderCount = 0
+
+    # Override
+    def render(self, tier='full'):
+        self.renderCount += 1
+        size = self.getDPI(tier)
+        return(fakeImage('image{}'.format(self.pageNumber), size, size))
+
+
+class testRasterCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = RasterCache(600)  # Fits two 10x10 RGB fakeImages
+        self.thumbnailBytes = 3*RESOLUTION_TIERS['thumbnail']**2
+
+    def testProcessCacheIsMemoryOnly(self):
+        self.assertTrue(rasterCache.diskCache is None)
+
+    def testGetPut(self):
+        self.assertTrue(self.cache.get('a') is None)
+        self.cache.put('a', fakeImage('a'))
+        self.assertEqual(self.cache.get('a'), fakeImage('a'))
+        self.assertEqual(self.cache.getStats()['hits'], 1)
+        self.assertEqual(self.cache.getStats()['misses'], 1)
+        self.assertEqual(self.cache.getStats()['bytes'], 300)
+
+    def testEvictsLeastRecentlyUsed(self):
+        self.cache.put('a', fakeImage('a'))
+        self.cache.put('b', fakeImage('b'))
+        self.cache.get('a')
+        self.cache.put('c', fakeImage('c'))
+        self.assertTrue(self.cache.contains('a'))
+        self.assertFalse(self.cache.contains('b'))
+        self.assertTrue(self.cache.contains('c'))
+        self.assertEqual(self.cache.getStats()['evictions'], 1)
+        self.assertEqual(self.cache.getStats()['bytes'], 600)
+
+    def testSetMaxBytes(self):
+        self.cache.put('a', fakeImage('a'))
+        self.cache.put('b', fakeImage('b'))
+        self.cache.setMaxBytes(300)
+        self.assertFalse(self.cache.contains('a'))
+        self.assertTrue(self.cache.contains('b'))
+
+    def testRerenderAfterEviction(self):
+        self.cache.setMaxBytes(2*self.thumbnailBytes)
+        raster1 = countingPageRaster('file.pdf', 0, self.cache)
+        raster2 = countingPageRaster('file.pdf', 1, self.cache)
+        raster3 = countingPageRaster('file.pdf', 2, self.cache)
+        raster1.getImage('thumbnail')
+        raster2.getImage('thumbnail')
+        raster3.getImage('thumbnail')
+        self.assertFalse(raster1.isRendered('thumbnail'))
+        self.assertEqual(raster1.getImage('thumbnail'), fakeImage('image0'))
+        self.assertEqual(raster1.renderCount, 2)
+
+
+class testDiskRasterCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.diskCache = DiskRasterCache(self.directory.name, maxBytes=10**6, evictInterval=1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testGetPut(self):
+        self.assertTrue(self.diskCache.get('hash', 0, 16) is None)
+        self.diskCache.put('hash', 0, 16, Image.new('RGB', (4, 4), 'red'))
+        image = self.diskCache.get('hash', 0, 16)
+        self.assertEqual(image.size, (4, 4))
+        self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+        self.assertTrue(self.diskCache.get('hash', 0, 100) is None)
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.endswith('.part')], [])
+
+    def testCorruptFileIsMiss(self):
+        with open(os.path.join(self.directory.name, 'hash_0_16.png'), 'wb') as fileStream:
+            fileStream.write(b'not a png')
+        self.assertTrue(self.diskCache.get('hash', 0, 16) is None)
+
+    def testEvictsLeastRecentlyUsed(self):
+        for pageNumber in range(3):
+            self.diskCache.put('hash', pageNumber, 16, Image.new('RGB', (4, 4)))
+            path = self.diskCache._getPath('hash', pageNumber, 16)
+            os.utime(path, ns=(pageNumber*10**9, pageNumber*10**9))
+        self.diskCache.get('hash', 0, 16)  # Refreshes page 0 so page 1 is least recently used
+        self.diskCache.maxBytes = self.diskCache.getBytes()-1
+        self.diskCache.evict()
+        self.assertTrue(self.diskCache.get('hash', 1, 16) is None)
+        self.assertTrue(self.diskCache.get('hash', 0, 16) is not None)
+        self.assertTrue(self.diskCache.get('hash', 2, 16) is not None)
+
+    def testEvictsAbandonedPartFiles(self):
+        oldPath = os.path.join(self.directory.name, 'old.part')
+        newPath = os.path.join(self.directory.name, 'new.part')
+        for path in (oldPath, newPath):
+            with open(path, 'wb') as fileStream:
+                fileStream.write(b'partial')
+        os.utime(oldPath, ns=(0, 0))
+        self.diskCache.evict()
+        self.assertFalse(os.path.exists(oldPath))
+        self.assertTrue(os.path.exists(newPath))
+
+    def testPageRasterUsesDiskCache(self):
+        pdfPath = os.path.join(self.directory.name, 'file.pdf')
+        with open(pdfPath, 'wb') as fileStream:
+            fileStream.write(b'first')
+        raster = countingPageRaster(pdfPath, 0, RasterCache(10**6, self.diskCache))
+        raster.render = lambda tier='full': Image.new('RGB', (4, 4), 'white')
+        raster.getImage('thumbnail')
+        self.diskCache.flush()
+        raster.cache.clear()
+        raster.render = lambda tier='full': self.fail('Should have been read from disk cache.')
+        self.assertEqual(raster.getImage('thumbnail').size, (4, 4))
+        self.assertTrue(raster.isRendered('thumbnail'))
+
+    def testUnhashedFileIsMissAndHashedInBackground(self):
+        pdfPath = os.path.join(self.directory.name, 'file.pdf')
+        with open(pdfPath, 'wb') as fileStream:
+            fileStream.write(b'unhashed')
+        fileHash = hashlib.sha256(b'unhashed').hexdigest()
+        self.diskCache.put(fileHash, 0, 16, Image.new('RGB', (4, 4)))
+        self.assertTrue(self.diskCache.getForFile(pdfPath, 0, 16) is None)
+        self.diskCache.flush()
+        self.assertEqual(self.diskCache.getForFile(pdfPath, 0, 16).size, (4, 4))
+
+    def testPutForFileSkipsChangedFile(self):
+        pdfPath = os.path.join(self.directory.name, 'file.pdf')
+        with open(pdfPath, 'wb') as fileStream:
+            fileStream.write(b'first')
+        with mock.patch('render.fileContentHash', return_value=None):  # As if file changed after it was queued
+            self.diskCache.putForFile(pdfPath, 0, 16, Image.new('RGB', (4, 4)))
+            self.diskCache.flush()
+        self.assertEqual(self.diskCache.getBytes(), 0)
+
+    def testFileContentHash(self):
+        pdfPath = os.path.join(self.directory.name, 'file.pdf')
+        with open(pdfPath, 'wb') as fileStream:
+            fileStream.write(b'first')
+        firstHash = fileContentHash(pdfPath)
+        self.assertEqual(fileContentHash(pdfPath), firstHash)
+        with open(pdfPath, 'wb') as fileStream:
+            fileStream.write(b'second version')
+        self.assertNotEqual(fileContentHash(pdfPath), firstHash)
+
+    def testFileContentHashOfLargeFile(self):
+        firstPath = os.path.join(self.directory.name, 'first.pdf')
+        secondPath = os.path.join(self.directory.name, 'second.pdf')
+        for filePath in (firstPath, secondPath):
+            with open(filePath, 'wb') as fileStream:
+                fileStream.write(b'\0'*(3*1024*1024+1))
+        os.utime(secondPath, ns=(0, 0))
+        self.assertEqual(fileContentHash(firstPath), fileContentHash(secondPath))
+        self.assertTrue(fileContentHash(firstPath, ('other', 0, 0)) is None)
+
+    def testFileHashesBounded(self):
+        with mock.patch('render.FILE_HASHES_LIMIT', 2):
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(self.directory.name, '{}.pdf'.format(i)))
+                with open(paths[-1], 'wb') as fileStream:
+                    fileStream.write(str(i).encode())
+                fileContentHash(paths[-1])
+            self.assertTrue(knownFileContentHash(paths[0]) is None)
+            self.assertEqual(knownFileContentHash(paths[2]), hashlib.sha256(b'2').hexdigest())
+
+
+class testPageRaster(unittest.TestCase):
+
+    def testNotRenderedUntilRequested(self):
+        raster = countingPageRaster('file.pdf', 0)
+        self.assertFalse(raster.isRendered())
+        self.assertEqual(raster.renderCount, 0)
+        self.assertEqual(raster.getImage(), fakeImage('image0'))
+        self.assertTrue(raster.isRendered())
+        raster.getImage()
+        self.assertEqual(raster.renderCount, 1)
+
+    def testPDFPageGetImage(self):
+        raster = countingPageRaster('file.pdf', 2)
+        page = PDFPage('key1', raster, None)
+        self.assertEqual(raster.renderCount, 0)
+        self.assertEqual(page.getImage(), fakeImage('image2'))
+
+    def testTiersCachedSeparately(self):
+        raster = countingPageRaster('file.pdf', 0)
+        preview = raster.getImage('preview')
+        self.assertEqual(preview.width, RESOLUTION_TIERS['preview'])
+        self.assertTrue(raster.isRendered('preview'))
+        self.assertFalse(raster.isRendered('thumbnail'))
+        self.assertFalse(raster.isRendered('full'))
+        thumbnail = raster.getImage('thumbnail')
+        self.assertEqual(thumbnail.width, RESOLUTION_TIERS['thumbnail'])
+        raster.getImage('preview')
+        self.assertEqual(raster.renderCount, 2)
+
+    def testInvalidTier(self):
+        raster = countingPageRaster('file.pdf', 0)
+        try:
+            raster.getImage('huge')
+            self.fail('Should have raised exception as tier does not exist.')
+        except(InvalidResolutionTier):
+            pass
+        self.assertEqual(raster.renderCount, 0)
+
+    def testHighlightedImageCached(self):
+        raster = countingPageRaster('file.pdf', 0)
+        raster.render = lambda tier='full': Image.new('RGB', (4, 4), 'white')
+        highlighted = raster.getHighlightedImage('preview', 'move')
+        self.assertEqual(highlighted.getpixel((0, 0)), (0xad, 0xd8, 0xe6))
+        self.assertTrue(raster.getHighlightedImage('preview', 'move') is highlighted)
+        self.assertTrue(PDFPage('key1', raster, None).getHighlightedImage('preview', 'move') is highlighted)
+        self.assertTrue(PDFPage('key1', None, None).getHighlightedImage() is None)
+
+    def testEq(self):
+        self.assertTrue(PageRaster('file.pdf', 0) == PageRaster('file.pdf', 0))
+        self.assertFalse(PageRaster('file.pdf', 0) == PageRaster('file.pdf', 1))
+        self.assertFalse(PageRaster('file.pdf', 0) == None)
+
+    def testOverwrittenFileNotServedFromCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filePath = os.path.join(directory, 'file.pdf')
+            rendered = []
+            def convert(filePath, dpi, first_page, last_page):
+                with open(filePath, 'rb') as fileStream:
+                    rendered.append(fakeImage(fileStream.read().decode()))
+                return([rendered[-1]])
+            with mock.patch('render.convert_from_path', convert):
+                with open(filePath, 'wb') as fileStream:
+                    fileStream.write(b'old')
+                self.assertEqual(PageRaster(filePath, 0).getImage('thumbnail'), fakeImage('old'))
+                with open(filePath, 'wb') as fileStream:
+                    fileStream.write(b'new!')
+                self.assertEqual(PageRaster(filePath, 0).getImage('thumbnail'), fakeImage('new!'))
+            self.assertEqual(len(rendered), 2)
+        rasterCache.clear()
+
+
+class threadPageRenderer(ParallelPageRenderer):
+    """
+    ParallelPageRenderer using threads so convert_from_path can be patched in tests.
+
+    """
+    # Override
+    def _createExecutor(self):
+        return(ThreadPoolExecutor(max_workers=self.workers))
+
+
+def fakeConvertFromPath(filePath, dpi, first_page, last_page, thread_count):
+    return([fakeImage('image{}'.format(i-1), dpi, dpi) for i in range(first_page, last_page+1)])
+
+
+class testParallelPageRenderer(unittest.TestCase):
+
+    def testGetChunks(self):
+        renderer = ParallelPageRenderer(workers=2, chunkSize=3)
+        self.assertEqual(renderer.getChunks(0, 7), [(0, 2), (3, 5), (6, 7)])
+        self.assertEqual(renderer.getChunks(4, 4), [(4, 4)])
+
+    def testRenderPagesInOrder(self):
+        renderer = threadPageRenderer(workers=3, chunkSize=2)
+        with mock.patch('render.convert_from_path', fakeConvertFromPath):
+            rendered = list(renderer.renderPages('file.pdf', 0, 10, 'thumbnail'))
+        self.assertEqual([pageNumber for pageNumber, image in rendered], list(range(11)))
+        for pageNumber, image in rendered:
+            self.assertEqual(image, fakeImage('image{}'.format(pageNumber)))
+            self.assertEqual(image.width, RESOLUTION_TIERS['thumbnail'])
+
+
+class testPagePrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.prefetcher = PagePrefetcher('thumbnail', depth=2)
+        self.cache = RasterCache(10**6)
+        self.bank = PDFPageBank()
+        self.pdf = PDF(self.bank)
+        for i in range(6):
+            page = PDFPage('key{}'.format(i), countingPageRaster('file.pdf', i, self.cache), None)
+            self.bank.addPage(page)
+            self.pdf.addPage(page)
+
+    def tearDown(self):
+        self.prefetcher.shutdown()
+
+    def testPredictIndices(self):
+        self.assertEqual(self.prefetcher.predictIndices(2, 1, 6), [3, 4, 1])
+        self.assertEqual(self.prefetcher.predictIndices(2, -1, 6), [1, 0, 3])
+        self.assertEqual(self.prefetcher.predictIndices(5, 1, 6), [4])
+        self.assertEqual(self.prefetcher.predictIndices(1, 1, 6, indexToMove=5), [2, 3, 5, 0])
+
+    def testPrefetch(self):
+        self.prefetcher.prefetch(self.pdf, 0, 1)
+        self.prefetcher.executor.shutdown(wait=True)
+        self.assertEqual([page.image.isRendered('thumbnail') for page in self.pdf],
+                         [False, True, True, False, False, False])
+        self.assertEqual(self.prefetcher.pending, {})
+
+    def testPrefetchWithinBudget(self):
+        self.cache.setMaxBytes(4*3*RESOLUTION_TIERS['thumbnail']**2)
+        self.pdf.getPage(0).getImage('thumbnail')
+        self.prefetcher.prefetch(self.pdf, 2, 1, indexToMove=0)
+        self.prefetcher.executor.shutdown(wait=True)
+        self.assertEqual([page.image.isRendered('thumbnail') for page in self.pdf],
+                         [True, False, False, True, True, False])
+
+
+class testConcurrentLoading(unittest.TestCase):
+
+    def testGenerateIDsFromThreads(self):
+        generator = IDGenerator()
+        def generate(i):
+            if i % 2 == 0:
+                return([generator.generateID() for j in range(2000)])
+            return(list(generator.reserveBlock(2000)))
+        with ThreadPoolExecutor(16) as executor:
+            IDs = [ID for IDs in executor.map(generate, range(32)) for ID in IDs]
+        self.assertEqual(sorted(IDs), list(range(32*2000)))
+
+    def testAddSamePageFromThreads(self):
+        bank = PDFPageBank()
+        page = PDFPage(0, None, None)
+        def add(i):
+            try:
+                bank.addPage(page)
+                return(True)
+            except(NotUniqueError):
+                return(False)
+        with ThreadPoolExecutor(16) as executor:
+            self.assertEqual(sum(executor.map(add, range(200))), 1)
+
+    def testParallelConvertersShareBank(self):
+        bank = PDFPageBank()
+        generator = IDGenerator()
+        with tempfile.TemporaryDirectory() as directory:
+            filePaths = []
+            for i in range(8):
+                filePaths.append(os.path.join(directory, 'copy{}.pdf'.format(i)))
+                with open('test_pdfs/test3.pdf', 'rb') as source, open(filePaths[-1], 'wb') as copy:
+                    copy.write(source.read()+'\n%{}\n'.format(i).encode())
+            def load(i):
+                return(File2PDFConverter(filePaths[i % 8], generator, bank, attachImages=False).extractPDF())
+            with ThreadPoolExecutor(16) as executor:
+                pdfs = list(executor.map(load, range(64)))
+        for pdf in pdfs:
+            self.assertEqual([page.getID() for page in pdf], list(pdf._getOrderedPages()))
+        self.assertEqual(len({page.getID() for pdf in pdfs for page in pdf}), bank.countPages())
+        self.assertEqual(bank.countPages(), 8*12)
+
+
+    def testReservedSourceWaits(self):
+        bank = PDFPageBank()
+        bank.addPage(PDFPage(0, None, None))
+        source, reservation = bank.reserveSource('identity')
+        self.assertTrue(source is None)
+        with ThreadPoolExecutor(4) as executor:
+            waiting = [executor.submit(bank.reserveSource, 'identity') for i in range(4)]
+            self.assertFalse(any(future.done() for future in waiting))
+            bank.addSource('identity', 'reader', [0])
+            self.assertEqual([future.result() for future in waiting], [(('reader', (0,)), None)]*4)
+
+    def testReleasedSourceTakenOver(self):
+        bank = PDFPageBank()
+        source, reservation = bank.reserveSource('identity')
+        with ThreadPoolExecutor(1) as executor:
+            waiting = executor.submit(bank.reserveSource, 'identity')
+            bank.releaseSource('identity', reservation)
+            source, reservation = waiting.result()
+        self.assertTrue(source is None)
+        self.assertTrue(bank.pendingSources['identity'] is reservation)
+
+    def testFailedLoadReleasesSource(self):
+        bank = PDFPageBank()
+        with tempfile.TemporaryDirectory() as directory:
+            filePath = os.path.join(directory, 'broken.pdf')
+            with open(filePath, 'wb') as fileStream:
+                fileStream.write(b'not a pdf')
+            with self.assertRaises(Exception):
+                File2PDFConverter(filePath, IDGenerator(), bank)
+        self.assertEqual(bank.pendingSources, {})
+
+
+class testFile2PDFConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = PDFPageBank()
+        self.generator = IDGenerator()
+
+    def testExtractPDF(self):
+        pdf = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        self.assertEqual(pdf.countPages(), 4)
+        self.assertEqual(self.bank.countPages(), 4)
+        for page in pdf:
+            self.assertFalse(page.image.isRendered())
+
+    def testExtractPDFWithoutImages(self):
+        converter = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank, attachImages=False)
+        pdf = converter.extractPDF()
+        for page in pdf:
+            self.assertTrue(page.getImage() is None)
+            self.assertTrue(page.getPageObject() is not None)
+        pdf.moveAfterPage(0, 2)
+        converter.attachImagesTo(pdf)
+        self.assertEqual([page.image.pageNumber for page in pdf], [1, 2, 0, 3])
+
+    def testAttachImagesToDoesNotRender(self):
+        converter = File2PDFConverter('test_pdfs/test2.pdf', self.generator, self.bank)
+        pdf = converter.extractPDF()
+        rasters = [page.image for page in pdf]
+        renders = mock.Mock(side_effect=fakeConvertFromPath)
+        with mock.patch('render.convert_from_path', renders):
+            converter.attachImagesTo(pdf)
+        self.assertEqual(renders.call_count, 0)
+        self.assertEqual([page.image for page in pdf], rasters)
+
+    def testIdenticalFileSharesPages(self):
+        first = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        converter = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank)
+        second = converter.extractPDF()
+        self.assertEqual(self.bank.countPages(), 4)
+        self.assertEqual(first, second)
+        self.assertTrue(converter.reader is self.bank.getSource(converter.identity)[0])
+        first.appendEntirePDF(second)
+        self.assertEqual(first.countPages(), 8)
+        self.assertTrue(first.getPage(0) is first.getPage(4))
+
+    def testCopyOfFileSharesPages(self):
+        first = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        with tempfile.TemporaryDirectory() as directory:
+            copyPath = os.path.join(directory, 'copy.pdf')
+            with open('test_pdfs/test1.pdf', 'rb') as source, open(copyPath, 'wb') as copy:
+                copy.write(source.read())
+            second = File2PDFConverter(copyPath, self.generator, self.bank).extractPDF()
+        self.assertEqual(self.bank.countPages(), 4)
+        self.assertEqual(first, second)
+
+    def testFilesOfOtherSizesNotHashed(self):
+        File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        with mock.patch('tools.fileContentHash') as contentHash:
+            File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+            File2PDFConverter('test_pdfs/test2.pdf', self.generator, self.bank).extractPDF()
+        self.assertEqual(contentHash.call_count, 0)
+
+    def testSharedPagesGetImages(self):
+        File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank, attachImages=False).extractPDF()
+        pdf = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        self.assertEqual([page.image.pageNumber for page in pdf], [0, 1, 2, 3])
+
+    def testReaderPool(self):
+        first = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank)
+        second = File2PDFConverter('test_pdfs/test1.pdf', self.generator, PDFPageBank())
+        self.assertTrue(first.reader is second.reader)
+        self.assertTrue(isinstance(first.reader.stream, mmap.mmap))
+        with tempfile.TemporaryDirectory() as directory:
+            copyPath = os.path.join(directory, 'copy.pdf')
+            with open('test_pdfs/test1.pdf', 'rb') as source, open(copyPath, 'wb') as copy:
+                copy.write(source.read())
+            reader = readerPool.getReader(copyPath)
+            os.utime(copyPath, ns=(0, 0))
+            self.assertFalse(readerPool.getReader(copyPath) is reader)
+
+    def testPrerenderPages(self):
+        converter = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank)
+        pdf = converter.extractPDF()
+        with mock.patch('render.convert_from_path', fakeConvertFromPath):
+            converter.prerenderPages('thumbnail', threadPageRenderer(workers=2, chunkSize=3))
+        for page in pdf:
+            self.assertTrue(page.image.isRendered('thumbnail'))
+            self.assertFalse(page.image.isRendered('preview'))
+        rasterCache.clear()
+
+    def testPrerenderPagesIntoTheirCache(self):
+        cache = RasterCache(1024*1024)
+        pages = [PDFPage(i, PageRaster('test_pdfs/test3.pdf', i, cache), None) for i in range(5)]
+        converter = File2PDFConverter('test_pdfs/test3.pdf', self.generator, None)
+        with mock.patch('render.convert_from_path', side_effect=fakeConvertFromPath) as convert:
+            converter.prerenderPages('preview', threadPageRenderer(workers=1, chunkSize=3), pages)
+        self.assertEqual(sorted(call.kwargs['last_page'] for call in convert.call_args_list), [3, 5])
+        for page in pages:
+            self.assertTrue(page.image.isRendered('preview'))
+            self.assertFalse(rasterCache.contains(page.image.getCacheKey('preview')))
+
+    def testPrerenderPagesCancelled(self):
+        cache = RasterCache(1024*1024)
+        pages = [PDFPage(i, PageRaster('test_pdfs/test3.pdf', i, cache), None) for i in range(12)]
+        converter = File2PDFConverter('test_pdfs/test3.pdf', self.generator, None)
+        with mock.patch('render.convert_from_path', fakeConvertFromPath):
+            converter.prerenderPages('preview', threadPageRenderer(workers=1, chunkSize=2), pages,
+                                     lambda: pages[1].image.isRendered('preview'))
+        self.assertEqual([page.image.isRendered('preview') for page in pages], [True, True]+[False]*10)
+
+
+class testPDF2FileConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = PDFPageBank()
+        self.generator = IDGenerator()
+        self.pdf = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        self.pdf.appendEntirePDF(File2PDFConverter('test_pdfs/test2.pdf', self.generator, self.bank).extractPDF())
+        self.directory = tempfile.TemporaryDirectory()
+        self.filePath = os.path.join(self.directory.name, 'out.pdf')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testExtractToFilePath(self):
+        progress = []
+        PDF2FileConverter(self.pdf).extractToFilePath(self.filePath, lambda done, total: progress.append((done, total)))
+        self.assertEqual(PyPDF2.PdfFileReader(self.filePath).getNumPages(), 8)
+        self.assertEqual(progress, [(i, 9) for i in range(1, 10)])
+        self.assertEqual(os.listdir(self.directory.name), ['out.pdf'])
+
+    def testExtractToFilePathNotPDF(self):
+        try:
+            PDF2FileConverter(self.pdf).extractToFilePath(os.path.join(self.directory.name, 'out.txt'))
+            self.fail('Should have raised exception as path is not a pdf.')
+        except(FilePathNotPDF):
+            pass
+
+    def testCancelDuringPages(self):
+        progress = []
+        try:
+            PDF2FileConverter(self.pdf).extractToFilePath(self.filePath, lambda done, total: progress.append(done),
+                                                          lambda: len(progress) >= 3)
+            self.fail('Should have raised exception as export was cancelled.')
+        except(ExportCancelled):
+            pass
+        self.assertEqual(progress, [1, 2, 3])
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def testCancelDuringWrite(self):
+        progress = []
+        try:
+            PDF2FileConverter(self.pdf).extractToFilePath(self.filePath, lambda done, total: progress.append(done),
+                                                          lambda: len(progress) >= 8)
+            self.fail('Should have raised exception as export was cancelled.')
+        except(ExportCancelled):
+            pass
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def testKeepsExistingFileOnCancel(self):
+        with open(self.filePath, 'wb') as fileStream:
+            fileStream.write(b'old')
+        try:
+            PDF2FileConverter(self.pdf).extractToFilePath(self.filePath, None, lambda: True)
+        except(ExportCancelled):
+            pass
+        with open(self.filePath, 'rb') as fileStream:
+            self.assertEqual(fileStream.read(), b'old')
+
+    @unittest.skipIf(os.name != 'posix', 'Permission bits are only kept on posix.')
+    def testFileModes(self):
+        umask = os.umask(0o027)
+        try:
+            PDF2FileConverter(self.pdf).extractToFilePath(self.filePath)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(self.filePath).st_mode & 0o777, 0o640)
+        os.chmod(self.filePath, 0o604)
+        PDF2FileConverter(self.pdf).extractToFilePath(self.filePath)
+        self.assertEqual(os.stat(self.filePath).st_mode & 0o777, 0o604)
+
+    def testReadsThroughPrivateReaders(self):
+        sharedReader = readerPool.getReader('test_pdfs/test1.pdf')
+        cached = set(sharedReader.resolvedObjects)
+        privateReaders = []
+        openPrivateReader = readerPool.openPrivateReader
+        def recordPrivateReader(reader):
+            privateReaders.append(openPrivateReader(reader))
+            return(privateReaders[-1])
+        with mock.patch.object(readerPool, 'openPrivateReader', recordPrivateReader):
+            PDF2FileConverter(self.pdf).extractToFilePath(self.filePath)
+        self.assertEqual(set(sharedReader.resolvedObjects), cached)
+        self.assertEqual(len(privateReaders), 2)
+        self.assertEqual([reader.resolvedObjects for reader in privateReaders], [{}, {}])
+
+    def testChangedSourceReadThroughSharedReader(self):
+        copyPath = os.path.join(self.directory.name, 'copy.pdf')
+        with open('test_pdfs/test1.pdf', 'rb') as source, open(copyPath, 'wb') as copy:
+            copy.write(source.read())
+        pdf = File2PDFConverter(copyPath, self.generator, PDFPageBank()).extractPDF()
+        os.utime(copyPath, ns=(0, 0))
+        self.assertEqual(readerPool.openPrivateReader(pdf.getPage(0).getPageObject().pdf), None)
+        PDF2FileConverter(pdf).extractToFilePath(self.filePath)
+        self.assertEqual(PyPDF2.PdfFileReader(self.filePath).getNumPages(), 4)
+
+    def testParallelExportsIdentical(self):
+        filePaths = [os.path.join(self.directory.name, '{}.pdf'.format(i)) for i in range(8)]
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda filePath: PDF2FileConverter(self.pdf).extractToFilePath(filePath), filePaths))
+        contents = set()
+        for filePath in filePaths:
+            with open(filePath, 'rb') as fileStream:
+                contents.add(fileStream.read())
+        self.assertEqual(len(contents), 1)
+
+    def testSourcePagesUnchanged(self):
+        def references(pageObject):
+            return({key: (value.pdf, value.idnum) for key, value in pageObject.items()
+                    if isinstance(value, PyPDF2.generic.IndirectObject)})
+        before = [references(page.getPageObject()) for page in self.pdf]
+        contents = []
+        for i in range(2):
+            PDF2FileConverter(self.pdf).extractToFilePath(self.filePath)
+            with open(self.filePath, 'rb') as fileStream:
+                contents.append(fileStream.read())
+        self.assertEqual([references(page.getPageObject()) for page in self.pdf], before)
+        self.assertEqual(contents[0], contents[1])
+
+    def testPageWrittenTwice(self):
+        self.pdf.appendEntirePDF(self.pdf.copyPDF())
+        PDF2FileConverter(self.pdf).extractToFilePath(self.filePath)
+        reader = PyPDF2.PdfFileReader(self.filePath, strict=True)
+        self.assertEqual(reader.getNumPages(), 16)
+        self.assertEqual(reader.getPage(1).extractText(), reader.getPage(9).extractText())
+
+    def testAnnotationsNotMerged(self):
+        writer = PyPDF2.PdfFileWriter()
+        for i in range(2):
+            page = writer.addBlankPage(100, 100)
+            annotations = PyPDF2.generic.ArrayObject()
+            for annotation in ({'/Type': '/Annot', '/Subtype': '/Text'}, {'/Subtype': '/Widget', '/FT': '/Btn'}):
+                annotation = PyPDF2.generic.DictionaryObject(
+                    {PyPDF2.generic.NameObject(key): PyPDF2.generic.NameObject(value)
+                     for key, value in annotation.items()})
+                annotation[PyPDF2.generic.NameObject('/Rect')] = PyPDF2.generic.ArrayObject(
+                    [PyPDF2.generic.NumberObject(0)]*4)
+                annotations.append(writer._addObject(annotation))
+            page[PyPDF2.generic.NameObject('/Annots')] = annotations
+        sourcePath = os.path.join(self.directory.name, 'annotated.pdf')
+        with open(sourcePath, 'wb') as fileStream:
+            writer.write(fileStream)
+        pdf = File2PDFConverter(sourcePath, self.generator, self.bank).extractPDF()
+        PDF2FileConverter(pdf).extractToFilePath(self.filePath)
+        reader = PyPDF2.PdfFileReader(self.filePath)
+        numbers = [annotation.idnum for i in range(2) for annotation in reader.getPage(i)['/Annots']]
+        self.assertEqual(len(set(numbers)), 4)
+
+    def testPlainWriterForOtherPyPDF2Versions(self):
+        sharedReader = readerPool.getReader('test_pdfs/test1.pdf')
+        cached = set(sharedReader.resolvedObjects)
+        parents = [page.getPageObject()['/Parent'] for page in self.pdf]
+        with mock.patch('tools.INCREMENTAL_WRITER_SUPPORTED', False):
+            converter = PDF2FileConverter(self.pdf)
+            converter.extractToFilePath(self.filePath)
+        self.assertTrue(isinstance(converter.writer, PlainPDFWriter))
+        self.assertEqual(converter.bytesSaved, 0)
+        self.assertEqual(PyPDF2.PdfFileReader(self.filePath).getNumPages(), 8)
+        self.assertEqual(set(sharedReader.resolvedObjects), cached)
+        self.assertEqual([page.getPageObject()['/Parent'] for page in self.pdf], parents)
+
+    def testDeduplicatesIdenticalSources(self):
+        copyPath = os.path.join(self.directory.name, 'copy.pdf')
+        with open('test_pdfs/test1.pdf', 'rb') as source, open(copyPath, 'wb') as copy:
+            copy.write(source.read()+b'\n%Different bytes, same objects\n')
+        pdf = File2PDFConverter('test_pdfs/test1.pdf', self.generator, self.bank).extractPDF()
+        pdf.appendEntirePDF(File2PDFConverter(copyPath, self.generator, self.bank).extractPDF())
+        plainPath = os.path.join(self.directory.name, 'plain.pdf')
+        PDF2FileConverter(pdf, deduplicate=False).extractToFilePath(plainPath)
+        converter = PDF2FileConverter(pdf)
+        converter.extractToFilePath(self.filePath)
+        self.assertTrue(converter.bytesSaved > 0)
+        self.assertTrue(os.path.getsize(self.filePath) < os.path.getsize(plainPath))
+        reader = PyPDF2.PdfFileReader(self.filePath)
+        self.assertEqual(reader.getNumPages(), 8)
+        self.assertEqual(reader.getPage(0).extractText(), reader.getPage(4).extractText())
+        self.assertEqual(reader.getPage(0)['/Resources']['/Font'].raw_get('/F1').idnum,
+                         reader.getPage(4)['/Resources']['/Font'].raw_get('/F1').idnum)
+
+
+class testAsyncInterface(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testConcurrentMerges(self):
+        async def merges():
+            interface = AsyncInterface(maxConcurrent=4)
+            ticks = []
+            async def ticker():
+                while True:
+                    ticks.append(None)
+                    await asyncio.sleep(0)
+            tickerTask = asyncio.ensure_future(ticker())
+            outputPaths = [os.path.join(self.directory.name, 'merged{}.pdf'.format(i)) for i in range(6)]
+            await asyncio.gather(*[interface.mergePDFs(outputPath, ['test_pdfs/test1.pdf', 'test_pdfs/test2.pdf',
+                                                                    'test_pdfs/test1.pdf'])
+                                   for outputPath in outputPaths])
+            tickerTask.cancel()
+            interface.shutdown()
+            return(interface, outputPaths, ticks)
+        interface, outputPaths, ticks = asyncio.run(merges())
+        for outputPath in outputPaths:
+            self.assertEqual(PyPDF2.PdfFileReader(outputPath).getNumPages(), 12)
+        self.assertEqual(interface.bank.countPages(), 0)
+        self.assertTrue(len(ticks) > len(outputPaths))
+
+    def testMergesOfDistinctFilesReclaimed(self):
+        inputPaths = []
+        for i in range(6):
+            inputPaths.append(os.path.join(self.directory.name, 'input{}.pdf'.format(i)))
+            with open('test_pdfs/test{}.pdf'.format(i%3+1), 'rb') as source, open(inputPaths[-1], 'wb') as copy:
+                copy.write(source.read()+'\n%Upload {}\n'.format(i).encode())
+        interface = AsyncInterface(maxConcurrent=4)
+        async def merges():
+            await asyncio.gather(*[interface.mergePDFs(os.path.join(self.directory.name, 'merged{}.pdf'.format(i)),
+                                                       inputPaths[i:i+2]) for i in range(0, 6, 2)])
+        try:
+            asyncio.run(merges())
+        finally:
+            interface.shutdown()
+        self.assertEqual(interface.bank.countPages(), 0)
+        self.assertEqual(interface.bank.sources, {})
+        self.assertEqual(interface.bank.sourceKeys, {})
+        self.assertEqual(interface.loadCounts, {})
+
+    def testReleaseKeepsPagesOfOtherLoads(self):
+        interface = AsyncInterface()
+        async def loads():
+            return(await asyncio.gather(interface.loadPDF('test_pdfs/test2.pdf'),
+                                        interface.loadPDF('test_pdfs/test2.pdf')))
+        try:
+            first, second = asyncio.run(loads())
+        finally:
+            interface.shutdown()
+        self.assertEqual(interface.release(first), 0)
+        self.assertEqual(second.getPage(3).getID(), first.getPage(3).getID())
+        self.assertEqual(interface.release(second), 4)
+        self.assertEqual(interface.bank.countPages(), 0)
+
+    def testExportNotPDF(self):
+        async def export():
+            interface = AsyncInterface()
+            pdf = await interface.loadPDF('test_pdfs/test2.pdf')
+            try:
+                await interface.exportPDF(pdf, os.path.join(self.directory.name, 'out.txt'))
+            finally:
+                interface.shutdown()
+        self.assertRaises(FilePathNotPDF, asyncio.run, export())
+
+    def testCreatedOutsideLoop(self):
+        interface = AsyncInterface(maxConcurrent=2)
+        try:
+            for run in range(2):
+                self.assertEqual(asyncio.run(interface.loadPDF('test_pdfs/test2.pdf')).countPages(), 4)
+        finally:
+            interface.shutdown()
+
+    def testInterfacesParseFileOnce(self):
+        copyPath = os.path.join(self.directory.name, 'copy.pdf')
+        with open('test_pdfs/test3.pdf', 'rb') as source, open(copyPath, 'wb') as copy:
+            copy.write(source.read())
+        interfaces = [AsyncInterface(maxConcurrent=2) for i in range(3)]
+        async def loads():
+            return(await asyncio.gather(*[interface.loadPDF(copyPath) for interface in interfaces for i in range(2)]))
+        try:
+            with mock.patch.object(PyPDF2, 'PdfFileReader', wraps=PyPDF2.PdfFileReader) as readerClass:
+                pdfs = asyncio.run(loads())
+        finally:
+            for interface in interfaces:
+                interface.shutdown()
+        self.assertEqual(readerClass.call_count, 1)
+        self.assertEqual(len({id(pdf.getPage(0).getPageObject()) for pdf in pdfs}), 1)
+
+
+class testPageSequence(unittest.TestCase):
+
+    def testConstructor(self):
+        self.assertEqual(len(PageSequence()), 0)
+        self.assertEqual(PageSequence(range(200)), list(range(200)))
+        self.assertEqual(PageSequence(range(200))[150], 150)
+        self.assertEqual(PageSequence(range(200))[-1], 199)
+
+    def testEditsDoNotChangeOriginal(self):
+        sequence = PageSequence(range(10))
+        sequence.insert(3, ['a']).delete(0).move(0, 5)
+        self.assertEqual(sequence, list(range(10)))
+
+    def testEditsMatchList(self):
+        randomGenerator = random.Random(0)
+        expected = list(range(500))
+        sequence = PageSequence(expected)
+        for step in range(2000):
+            action = randomGenerator.choice(['insert', 'delete', 'move', 'slice'])
+            i = randomGenerator.randrange(len(expected))
+            if action == 'insert':
+                items = [randomGenerator.random() for item in range(randomGenerator.choice([1, 3, 100]))]
+                expected[i:i] = items
+                sequence = sequence.insert(i, items)
+            elif action == 'delete':
+                count = randomGenerator.randint(1, min(3, len(expected)-i))
+                del expected[i:i+count]
+                sequence = sequence.delete(i, count)
+            elif action == 'move':
+                j = randomGenerator.randrange(len(expected))
+                expected.insert(j, expected.pop(i))
+                sequence = sequence.move(i, j)
+            else:
+                j = randomGenerator.randint(i, len(expected))
+                self.assertEqual(sequence.slice(i, j), expected[i:j])
+        self.assertEqual(sequence, expected)
+        self.assertEqual(sequence[len(expected)//2], expected[len(expected)//2])
+
+    def testIntsPacked(self):
+        sequence = PageSequence(range(200))
+        self.assertEqual(sequence.root.left.left.items.typecode, 'I')
+        mixed = sequence.insert(100, ['a'])
+        self.assertEqual(mixed[100], 'a')
+        self.assertEqual(mixed.delete(100), list(range(200)))
+
+    def testIndexError(self):
+        try:
+            PageSequence(range(3))[3]
+            self.fail('Should have raised exception as index is out of range.')
+        except(IndexError):
+            pass
+
+
+class testCommandLineInterface(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def outputPath(self, name):
+        return(os.path.join(self.directory.name, name))
+
+    def readPageCount(self, filePath):
+        return(PyPDF2.PdfFileReader(filePath).getNumPages())
+
+    def testParsePageSpec(self):
+        self.assertEqual(parsePageSpec('1,3-5', 6), [0, 2, 3, 4])
+        self.assertEqual(parsePageSpec('5-,-2', 6), [4, 5, 0, 1])
+        self.assertEqual(parsePageSpec('3-1', 6), [2, 1, 0])
+        for spec in ['0', '7', 'a', '1-2-3', '']:
+            try:
+                parsePageSpec(spec, 6)
+                self.fail('Should have raised exception for spec \'{}\'.'.format(spec))
+            except(InvalidPageSpec):
+                pass
+
+    def testMerge(self):
+        self.assertEqual(main(['merge', self.outputPath('out.pdf'), 'test_pdfs/test1.pdf', 'test_pdfs/test3.pdf']), 0)
+        self.assertEqual(self.readPageCount(self.outputPath('out.pdf')), 16)
+
+    def testSplit(self):
+        self.assertEqual(main(['split', 'test_pdfs/test3.pdf', self.directory.name, '--every', '5']), 0)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['test3_1.pdf', 'test3_2.pdf', 'test3_3.pdf'])
+        self.assertEqual(self.readPageCount(self.outputPath('test3_3.pdf')), 2)
+
+    def testReorderAndDelete(self):
+        self.assertEqual(main(['reorder', 'test_pdfs/test1.pdf', self.outputPath('out.pdf'), '4-1']), 0)
+        self.assertEqual(self.readPageCount(self.outputPath('out.pdf')), 4)
+        self.assertEqual(main(['delete', 'test_pdfs/test1.pdf', self.outputPath('out.pdf'), '2-3']), 0)
+        self.assertEqual(self.readPageCount(self.outputPath('out.pdf')), 2)
+        with mock.patch('sys.stderr'):
+            self.assertEqual(main(['reorder', 'test_pdfs/test1.pdf', self.outputPath('bad.pdf'), '1-3']), 1)
+        self.assertFalse(os.path.exists(self.outputPath('bad.pdf')))
+
+    def testDeleteEveryPage(self):
+        with mock.patch('sys.stderr') as stderr:
+            self.assertEqual(main(['delete', 'test_pdfs/test2.pdf', self.outputPath('out.pdf'), '1-4']), 1)
+        self.assertTrue(stderr.write.called)
+        self.assertFalse(os.path.exists(self.outputPath('out.pdf')))
+
+    def testMalformedInput(self):
+        inputPath = self.outputPath('malformed.pdf')
+        with open(inputPath, 'wb') as fileStream:
+            fileStream.write(b'%PDF-1.4\ngarbage')
+        with mock.patch('sys.stderr') as stderr:
+            self.assertEqual(main(['merge', self.outputPath('out.pdf'), 'test_pdfs/test1.pdf', inputPath]), 1)
+        printed = ''.join(call.args[0] for call in stderr.write.call_args_list)
+        self.assertTrue(printed.startswith('SimplePDF: '))
+        self.assertFalse(os.path.exists(self.outputPath('out.pdf')))
+
+    def testVerboseReportsBytesSaved(self):
+        with mock.patch('sys.stdout') as stdout:
+            self.assertEqual(main(['-v', 'merge', self.outputPath('out.pdf'), 'test_pdfs/test1.pdf',
+                                   'test_pdfs/test2.pdf']), 0)
+        printed = ''.join(call.args[0] for call in stdout.write.call_args_list)
+        self.assertTrue(printed.startswith('Wrote {} ('.format(self.outputPath('out.pdf'))))
+        self.assertTrue('bytes saved by deduplication' in printed)
+
+    def testDoesNotImportGUIOrRasterize(self):
+        output = subprocess.run([sys.executable, '-c', 'import sys, cli; cli.main(sys.argv[1:]); '
+                                 'print(sorted(m for m in ("PyQt5", "matplotlib", "pdf2image") if m in sys.modules))',
+                                 'merge', self.outputPath('out.pdf'), 'test_pdfs/test1.pdf'],
+                                capture_output=True, text=True)
+        self.assertEqual(output.stdout.strip(), '[]')
+
+
 class testPDFPageBank(unittest.TestCase):
 
     def setUp(self):
@@ -71,6 +1055,19 @@ class testPDFPageBank(unittest.TestCase):
         self.bank.addPage(self.page2)
         self.assertEqual(self.bank.countPages(), 2)
 
+    def testReclaimPages(self):
+        self.bank.addPage(self.page1)
+        self.bank.addPage(self.page2)
+        self.bank.addSource('hash', None, ['key1', 'key2'])
+        self.assertEqual(self.bank.reclaimPages(['key1', 'key3']), 1)
+        self.assertFalse(self.bank.contains('key1'))
+        self.assertTrue(self.bank.getPage('key2') is self.page2)
+        self.assertTrue(self.bank.getSource('hash') is None)
+        page3 = PDFPage('key3', None, None)
+        self.bank.addPage(page3)
+        self.assertEqual(self.bank.countPages(), 2)
+        self.assertTrue(self.bank.getPage('key3') is page3)
+
 
 class testPDF(unittest.TestCase):
 
@@ -270,6 +1267,70 @@ class testPDF(unittest.TestCase):
         self.pdf.moveAfterPage(3, 0)
         self.assertEqual(self.pdf._getOrderedPages(), ['key1', 'key4', 'key2', 'key3'])
 
+    def testRemovePages(self):
+        self.MoveTestSetUp()
+        self.pdf.removePages([3, 0, -3])
+        self.assertEqual(self.pdf._getOrderedPages(), ['key3'])
+        try:
+            self.pdf.removePages([0, 5])
+            self.fail('Should have raised exception as index 5 is out of range.')
+        except(IndexError):
+            pass
+        self.assertEqual(self.pdf._getOrderedPages(), ['key3'])
+
+    def testPermutePages(self):
+        self.MoveTestSetUp()
+        self.pdf.permutePages([2, 0, 3, 1])
+        self.assertEqual(self.pdf._getOrderedPages(), ['key3', 'key1', 'key4', 'key2'])
+        try:
+            self.pdf.permutePages([0, 0, 1, 2])
+            self.fail('Should have raised exception as order is not a permutation.')
+        except(InvalidPermutation):
+            pass
+
+    def testMovePagesBefore(self):
+        self.MoveTestSetUp()
+        self.pdf.movePagesBefore([3, 1], 0)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key2', 'key4', 'key1', 'key3'])
+        self.setUp()
+        self.MoveTestSetUp()
+        self.pdf.movePagesBefore(range(0, 2), 3)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key3', 'key1', 'key2', 'key4'])
+        self.setUp()
+        self.MoveTestSetUp()
+        self.pdf.movePagesBefore([0, 2], 2)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key2', 'key1', 'key3', 'key4'])
+
+    def testMovePagesAfter(self):
+        self.MoveTestSetUp()
+        self.pdf.movePagesAfter([0, 1], 3)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key3', 'key4', 'key1', 'key2'])
+        self.setUp()
+        self.MoveTestSetUp()
+        self.pdf.movePagesAfter([3], 0)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key1', 'key4', 'key2', 'key3'])
+
+    def testMovePagesToInvalidIndex(self):
+        self.MoveTestSetUp()
+        with self.assertRaises(IndexError):
+            self.pdf.movePagesBefore([0, 1], 4)
+        with self.assertRaises(IndexError):
+            self.pdf.movePagesAfter([0, 1], -5)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key1', 'key2', 'key3', 'key4'])
+
+    def testReversePages(self):
+        self.MoveTestSetUp()
+        self.pdf.reversePages()
+        self.assertEqual(self.pdf._getOrderedPages(), ['key4', 'key3', 'key2', 'key1'])
+
+    def testInterleavePDF(self):
+        self.MoveTestSetUp()
+        pdf2 = PDF(self.bank)
+        pdf2.addPage(self.page1)
+        pdf2.addPage(self.page2)
+        self.pdf.interleavePDF(pdf2)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key1', 'key1', 'key2', 'key2', 'key3', 'key4'])
+
     def testEq(self):
         self.pdf.addPage(self.page1)
         self.pdf.addPage(self.page2)
@@ -288,6 +1349,8 @@ class testPDF(unittest.TestCase):
         pdf2 = self.pdf.copyPDF()
         self.assertEqual(pdf2, self.pdf)
         self.assertFalse(pdf2 is self.pdf)
+        pdf2.removePage(0)
+        self.assertEqual(self.pdf._getOrderedPages(), ['key1', 'key2'])
 
 
 class testPDFHistoryRecorder(unittest.TestCase):
@@ -367,6 +1430,137 @@ class testPDFHistoryRecorder(unittest.TestCase):
         except(NoPrevVersions):
             pass
 
+    def testStoresDeltas(self):
+        self.historyRecorder.newVersion(self.pdf)
+        self.pdf.addPage(self.page1)
+        self.pdf.addPage(self.page2)
+        self.historyRecorder.newVersion(self.pdf)
+        self.pdf.moveAfterPage(0, 1)
+        self.historyRecorder.newVersion(self.pdf)
+        self.assertTrue(self.historyRecorder.deltas[0] is None)
+        self.assertEqual(self.historyRecorder.deltas[1], [('insert', 0, ('key1', 'key2'))])
+        self.assertEqual(self.historyRecorder.deltas[2], [('move', 0, 1)])
+        self.assertEqual(self.historyRecorder.previousVersion()._getOrderedPages(), ['key1', 'key2'])
+        self.assertEqual(self.historyRecorder.laterVersion()._getOrderedPages(), ['key2', 'key1'])
+
+    def testBatchOperationIsOneVersion(self):
+        self.pdf.addPage(self.page1)
+        self.pdf.addPage(self.page2)
+        self.pdf.addPage(self.page3)
+        self.historyRecorder.newVersion(self.pdf)
+        self.pdf.reversePages()
+        self.pdf.removePages([0, 2])
+        self.historyRecorder.newVersion(self.pdf)
+        self.assertEqual(self.historyRecorder.deltas[1], [('permute', (2, 1, 0)), ('removeMany', (0, 2), ('key3', 'key1'))])
+        self.assertEqual(self.historyRecorder.previousVersion()._getOrderedPages(), ['key1', 'key2', 'key3'])
+
+    def testBlockMoveStoredAsIndices(self):
+        for page in (self.page1, self.page2, self.page3, self.page4):
+            self.pdf.addPage(page)
+        self.historyRecorder.newVersion(self.pdf)
+        self.pdf.movePagesAfter([0, 2], 3)
+        self.historyRecorder.newVersion(self.pdf)
+        self.assertEqual(self.historyRecorder.deltas[1], [('moveMany', (0, 2), 2)])
+        self.assertEqual(self.historyRecorder.previousVersion()._getOrderedPages(), ['key1', 'key2', 'key3', 'key4'])
+        self.assertEqual(self.historyRecorder.laterVersion()._getOrderedPages(), ['key2', 'key4', 'key1', 'key3'])
+
+    def testOtherPDFStoredAsSnapshot(self):
+        self.historyRecorder.newVersion(self.pdf)
+        self.pdf2.addPage(self.page1)
+        self.historyRecorder.newVersion(self.pdf2)
+        self.assertTrue(self.historyRecorder.deltas[1] is None)
+        self.assertEqual(self.historyRecorder.snapshots[1], ('key1',))
+
+    def testRandomEditsMatchFullCopies(self):
+        randomGenerator = random.Random(0)
+        historyRecorder = PDFHistoryRecorder(snapshotInterval=5)
+        pages = [self.page1, self.page2, self.page3, self.page4]
+        expected = []
+        pdf = self.pdf
+        historyRecorder.newVersion(pdf)
+        expected.append(list(pdf._getOrderedPages()))
+        for step in range(300):
+            action = randomGenerator.choice(['add', 'remove', 'before', 'after', 'removeMany', 'blockBefore',
+                                             'interleave', 'undo', 'redo'])
+            count = pdf.countPages()
+            if action == 'add' or count < 2:
+                pdf.addPage(randomGenerator.choice(pages))
+            elif action == 'removeMany':
+                pdf.removePages(randomGenerator.sample(range(count), randomGenerator.randint(1, count-1)))
+            elif action == 'blockBefore':
+                pdf.movePagesBefore(randomGenerator.sample(range(count), randomGenerator.randint(1, count)),
+                                    randomGenerator.randrange(count))
+            elif action == 'interleave' and count < 50:
+                pdf.interleavePDF(pdf.copyPDF())
+            elif action == 'remove':
+                pdf.removePage(randomGenerator.randrange(count))
+            elif action == 'before':
+                pdf.moveBeforePage(randomGenerator.randrange(count), randomGenerator.randrange(count))
+            elif action == 'after':
+                pdf.moveAfterPage(randomGenerator.randrange(count), randomGenerator.randrange(count))
+            if action == 'undo':
+                try:
+                    pdf = historyRecorder.previousVersion()
+                    self.assertEqual(pdf._getOrderedPages(), expected[historyRecorder._getCurrentVersion()])
+                except(NoPrevVersions):
+                    pass
+            elif action == 'redo':
+                try:
+                    pdf = historyRecorder.laterVersion()
+                    self.assertEqual(pdf._getOrderedPages(), expected[historyRecorder._getCurrentVersion()])
+                except(NoLaterVersions):
+                    pass
+            else:
+                historyRecorder.newVersion(pdf)
+                del expected[historyRecorder._getCurrentVersion():]
+                expected.append(list(pdf._getOrderedPages()))
+        self.assertEqual([version._getOrderedPages() for version in historyRecorder._getVersions()], expected)
+        self.assertEqual(historyRecorder.getReferencedIDs(), {ID for version in expected for ID in version})
+
+    def testReferencedIDs(self):
+        self.pdf.addPage(self.page1)
+        self.historyRecorder.newVersion(self.pdf)
+        self.pdf.addPage(self.page2)
+        self.historyRecorder.newVersion(self.pdf)
+        self.assertEqual(self.historyRecorder.getReferencedIDs(), {'key1', 'key2'})
+        pdf = self.historyRecorder.previousVersion()
+        pdf.addPage(self.page3)
+        self.historyRecorder.newVersion(pdf)
+        self.assertEqual(self.historyRecorder.droppedVersions, 1)
+        self.assertEqual(self.historyRecorder.getReferencedIDs(), {'key1', 'key3'})
+        self.assertEqual(self.historyRecorder.unreferencedIDs, ['key2'])
+        self.assertEqual(self.bank.reclaimPages(self.historyRecorder.unreferencedIDs), 1)
+
+    def testMaxVersions(self):
+        historyRecorder = PDFHistoryRecorder(snapshotInterval=3, maxVersions=4)
+        expected = []
+        for page in [self.page1, self.page2, self.page3, self.page4, self.page1, self.page2]:
+            self.pdf.addPage(page)
+            historyRecorder.newVersion(self.pdf)
+            expected.append(list(self.pdf._getOrderedPages()))
+            if len(expected) == 5:  # Dropped back to snapshot of version 3
+                self.assertEqual(historyRecorder.droppedVersions, 3)
+                self.assertEqual(historyRecorder.unreferencedIDs, [])
+        self.assertEqual(historyRecorder._getCurrentVersion(), 2)
+        self.assertEqual([version._getOrderedPages() for version in historyRecorder._getVersions()], expected[3:])
+        self.assertEqual(historyRecorder.previousVersion()._getOrderedPages(), expected[4])
+
+    def testMaxVersionsWithoutLaterSnapshot(self):
+        historyRecorder = PDFHistoryRecorder(snapshotInterval=32, maxVersions=2)
+        self.pdf.addPage(self.page1)
+        historyRecorder.newVersion(self.pdf)
+        self.pdf.addPage(self.page2)
+        historyRecorder.newVersion(self.pdf)
+        self.pdf.removePage(0)
+        historyRecorder.newVersion(self.pdf)
+        self.assertEqual(historyRecorder.unreferencedIDs, [])
+        self.pdf.removePage(0)
+        historyRecorder.newVersion(self.pdf)
+        self.assertEqual(historyRecorder.droppedVersions, 1)
+        self.assertEqual(historyRecorder.unreferencedIDs, ['key1'])
+        self.assertEqual(historyRecorder.getReferencedIDs(), {'key2'})
+        self.assertEqual([version._getOrderedPages() for version in historyRecorder._getVersions()], [['key2'], []])
+
     def testLaterVersion(self):
         self.addVersionsToRecorder()
         self.historyRecorder._setCurrentVersion(0)
@@ -1,102 +1,755 @@
+import os
+import io
 import re
+import mmap
+import weakref
+import hashlib
+import threading
 import PyPDF2
 from errors import *
 from model import *
-from pdf2image import convert_from_path
 
 class IDGenerator():
     """
-    Creates a unique str id to current IDGenerator object's knowledge.
+    Creates a unique int id to current IDGenerator object's knowledge. Ids are small consecutive ints, so sequences
+    of them pack into arrays. Safe to share between threads, loaders can reserve a block of ids at once with
+    reserveBlock so they only take lock once.
 
     Attributes
     ---
     nextID : int
         Next identifier the generator will output
+    lock : threading.Lock
+        Held while nextID is read and updated.
     """
     def __init__(self):
         self.nextID = 0
+        self.lock = threading.Lock()
 
     def generateID(self):
         """
-        Returns a string of unique int id and updates nextID to new unique ID.
+        Returns a unique int id and updates nextID to new unique ID.
 
         """
-        stringCode = str(self.nextID)
-        self.nextID += 1
-        return(stringCode)
+        with self.lock:
+            code = self.nextID
+            self.nextID += 1
+        return(code)
+
+    def reserveBlock(self, count):
+        """
+        Returns range of count unique consecutive int ids, none of which will be generated again.
+
+        """
+        with self.lock:
+            start = self.nextID
+            self.nextID += count
+        return(range(start, start+count))
+
+
+class ReaderPool():
+    """
+    Pool of PyPDF2.PdfFileReaders of memory mapped pdf files, so converters of the same unchanged file share one
+    reader. Readers are held weakly and dropped once no page of theirs is left.
+
+    Attributes
+    ---
+    readers : weakref.WeakValueDictionary
+        PdfFileReaders by tuple of real path, size and modification time of their file.
+    keys : weakref.WeakKeyDictionary
+        Keys in readers by PdfFileReader.
+    readLocks : weakref.WeakKeyDictionary
+        threading.Locks held while objects are read through a shared reader, by PdfFileReader.
+    openLocks : dict
+        threading.Locks held while a file is opened and parsed, by key of file in readers, so a file is parsed once
+        while different files are parsed at the same time.
+
+    """
+    def __init__(self):
+        self.readers = weakref.WeakValueDictionary()
+        self.keys = weakref.WeakKeyDictionary()
+        self.readLocks = weakref.WeakKeyDictionary()
+        self.openLocks = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _openMapped(filePath, key=None):
+        with open(filePath, 'rb') as fileStream:
+            if key is not None:
+                stat = os.fstat(fileStream.fileno())
+                if (key[1], key[2]) != (stat.st_size, stat.st_mtime_ns):
+                    return(None)
+            try:
+                return(mmap.mmap(fileStream.fileno(), 0, access=mmap.ACCESS_READ))
+            except(ValueError):  # Empty files can not be mapped
+                return(io.BytesIO(fileStream.read()))
+
+    def getReader(self, filePath):
+        """
+        Returns reader of pdf file at filePath, opening and mapping it if it is not in pool or changed since.
+
+        """
+        stat = os.stat(filePath)
+        key = (os.path.realpath(filePath), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            reader = self.readers.get(key)
+            if reader is not None:
+                return(reader)
+            openLock = self.openLocks.setdefault(key, threading.Lock())
+        with openLock:
+            with self.lock:
+                reader = self.readers.get(key)
+            if reader is not None:
+                return(reader)
+            try:
+                reader = PyPDF2.PdfFileReader(self._openMapped(filePath))
+                reader.getNumPages()  # Parses page tree before reader is shared, so getPage never reads the file
+            finally:
+                with self.lock:
+                    if reader is not None:
+                        self.readers[key] = reader
+                        self.keys[reader] = key
+                    self.openLocks.pop(key, None)
+            return(reader)
+
+    def openPrivateReader(self, reader):
+        """
+        Returns new PdfFileReader of file of pooled reader, not shared with anyone, or None if reader is not pooled
+        or its file was changed or removed since it was opened.
+
+        """
+        with self.lock:
+            key = self.keys.get(reader)
+        if key is None:
+            return(None)
+        try:
+            stream = self._openMapped(key[0], key)
+        except(OSError):
+            return(None)
+        if stream is None:
+            return(None)
+        return(PyPDF2.PdfFileReader(stream))
+
+    def getReadLock(self, reader):
+        """
+        Returns threading.Lock to hold while reading objects through shared reader.
+
+        """
+        with self.lock:
+            return(self.readLocks.setdefault(reader, threading.Lock()))
+
+
+# Process wide pool shared by all File2PDFConverters
+readerPool = ReaderPool()
 
 
 class File2PDFConverter():
     """
-    Object that extracts a vaild pdf file into a PDF object.
+    Object that extracts a vaild pdf file into a PDF object, reusing the reader and PDFPages of a file with identical
+    contents already extracted into pdfBank.
 
     Attributes
     ---
+    filePath : str
+        File path of pdf file to extract.
+    identity : tuple
+        fileIdentity of file, identifying it in pdfBank's sources.
     reader : PyPDF2.PDFFileReader
         Object to read in actual pdf file and extract PyPDF2.pageObjects to put into
-        actual pdf file later.
-    images : list <PIL.PpmImagePlugin.PpmImageFile>
-        PpmImageFile of page for graphical display in same order as pages in reader.
+        actual pdf file later. Shared through readerPool with other converters of the same file.
+    sourceIDs : tuple <int>
+        IDs of pages of file already in pdfBank in order, None if file was not extracted into pdfBank yet.
+    reservation : threading.Event
+        Reservation of file's source in pdfBank, held from opening a file not yet extracted until addSourceToBank or
+        releaseSource so other converters of it wait for its pages instead of reading it again. None if not held.
     generator : IDGenerator
         IDGenerator for application to generate unique IDs for created PDFPages.
     pdfBank : PDFPageBank
         PDFPageBank to store PDFPages for, for all PDFs.
+    attachImages : bool
+        If false, PDFPages are created from reader alone with no image, for uses that never display pages. Images
+        can be attached later with attachImagesTo.
 
     """
-    def __init__(self, filePath, idGenerator, pdfBank):
-        self.reader = PyPDF2.PdfFileReader(filePath)
-        self.images = convert_from_path(filePath)
+    def __init__(self, filePath, idGenerator, pdfBank, attachImages=True):
+        self.filePath = filePath
         self.generator = idGenerator
         self.bank = pdfBank
+        self.attachImages = attachImages
+        self.reservation = None
+        with instrumentation.span('File2PDFConverter.open', file=filePath):
+            self.identity = fileIdentity(filePath)
+            source = self._findSource() if pdfBank is not None else None
+            if source is not None:
+                self.reader, self.sourceIDs = source
+                instrumentation.count('File2PDFConverter.sharedSources')
+            else:
+                try:
+                    self.reader = readerPool.getReader(filePath)
+                except(Exception):
+                    self.releaseSource()
+                    raise
+                self.sourceIDs = None
+        if self.reservation is not None:  # Lets waiting converters go on if this one is dropped without finishing
+            weakref.finalize(self, pdfBank.releaseSource, self.identity, self.reservation)
+
+    def _findSource(self):
+        """
+        Returns source of file in pdfBank, recorded under its own identity or under that of a file of the same size
+        and content hash, None if there is none, in which case file's source is left reserved.
+
+        """
+        source, self.reservation = self.bank.reserveSource(self.identity)
+        if source is not None:
+            return(source)
+        source = self._findIdenticalSource()
+        if source is not None:
+            self.releaseSource()
+        return(source)
+
+    def _findIdenticalSource(self):
+        """
+        Returns source of another file in pdfBank of the same size and content hash as file, None if there is none.
+
+        """
+        contentHash = None
+        for identity in self.bank.getSourceIdentities():
+            if identity[1] != self.identity[1]:
+                continue
+            if contentHash is None:
+                contentHash = fileContentHash(self.filePath, self.identity)
+                if contentHash is None:  # File changed since it was opened
+                    return(None)
+            try:
+                if fileContentHash(identity[0], identity) == contentHash:
+                    return(self.bank.getSource(identity))
+            except(OSError):  # Source file was removed since
+                pass
+        return(None)
 
     def extractPDF(self):
         """
-        Extracts and returns PDF object of given filePath
+        Extracts and returns PDF object of given filePath. Pages are not rendered here, each PDFPage gets a
+        PageRaster that renders its image the first time it is requested, or no image if attachImages is false.
 
         Returns
         ---
         PDF
              PDF containing ordered pages in same form as PDF from filePath
         """
-        pdf = PDF(self.bank)
-        for i in range(self.reader.getNumPages()):
-            page = PDFPage(self.generator.generateID(),
-                           self.images[i],
-                           self.reader.getPage(i))
-            self.bank.addPage(page)
-            pdf.addPage(page)
+        with instrumentation.span('File2PDFConverter.extractPDF', file=self.filePath):
+            try:
+                pages = list(self.iterPages())
+                if self.sourceIDs is None:
+                    self.bank.addPages(pages)
+            except(Exception):
+                self.releaseSource()
+                raise
+            pdf = PDF(self.bank)
+            pdf._setOrderedPages(PageSequence([page.getID() for page in pages]))
+            self.addSourceToBank(pdf._getOrderedPages())
+        instrumentation.count('File2PDFConverter.pages', pdf.countPages())
         return(pdf)
 
+    def countPages(self):
+        """
+        Returns int of number of pages in file.
 
-class PDF2FileConverter():
+        """
+        return(self.reader.getNumPages())
+
+    def iterPages(self):
+        """
+        Generator yielding a PDFPage for each page of file in order, without adding them to pdfBank. Pages already in
+        pdfBank are yielded instead of new ones.
+
+        """
+        if self.sourceIDs is not None:
+            for i, ID in enumerate(self.sourceIDs):
+                page = self.bank.getPage(ID)
+                if self.attachImages and page.image is None:
+                    with self.bank.lock:
+                        if page.image is None:
+                            page.setImage(PageRaster(self.filePath, i, identity=self.identity))
+                yield(page)
+            return
+        for i, ID in enumerate(self.generator.reserveBlock(self.countPages())):
+            raster = PageRaster(self.filePath, i, identity=self.identity) if self.attachImages else None
+            yield(PDFPage(ID, raster, self.reader.getPage(i)))
+
+    def addSourceToBank(self, IDs):
+        """
+        Records IDs, of pages yielded by iterPages and added to pdfBank, as pages of file in pdfBank so later
+        converters of an identical file share them. Does nothing if file was already recorded.
+
+        """
+        if self.sourceIDs is None:
+            self.bank.addSource(self.identity, self.reader, IDs)
+            self.sourceIDs = tuple(IDs)
+            self.reservation = None
+
+    def releaseSource(self):
+        """
+        Gives up reservation of file's source in pdfBank without recording it, for loads that stop before all pages
+        were added. Does nothing if not held.
+
+        """
+        if self.reservation is not None:
+            self.bank.releaseSource(self.identity, self.reservation)
+            self.reservation = None
+
+    def attachImagesTo(self, pdf):
+        """
+        Gives every page in pdf that was read from this converter's file and has no image a PageRaster of it, so
+        PDFs loaded without images can be displayed later.
+
+        """
+        pageNumbers = {id(self.reader.getPage(i)): i for i in range(self.countPages())}
+        for page in pdf:
+            if page.image is None and id(page.getPageObject()) in pageNumbers:
+                with pdf.pageBank.lock:
+                    if page.image is None:
+                        page.setImage(PageRaster(self.filePath, pageNumbers[id(page.getPageObject())],
+                                                 identity=self.identity))
+
+    def prerenderPages(self, tier='preview', renderer=None, pages=None, isCancelled=None):
+        """
+        Renders pages of file at resolution tier in parallel and stores them as images of their PageRasters, in the
+        disk cache and the cache of each PageRaster, so later getImage calls on the extracted PDFPages are cache hits.
+
+        Parameters
+        ---
+        tier : str
+            Resolution tier to render pages at.
+        renderer : ParallelPageRenderer
+            Renderer to use, one with a worker per cpu by default.
+        pages : list <PDFPage>
+            First pages of file in order, to render and store in their own PageRasters. Pages without a PageRaster
+            are skipped. If None, every page of file is rendered and stored in rasterCache.
+        isCancelled : function
+            Function with no arguments returning true once rendering should stop, checked between pages.
+
+        """
+        if renderer is None:
+            renderer = ParallelPageRenderer()
+        if isCancelled is None:
+            isCancelled = lambda: False
+        if pages is None:
+            rasters = [PageRaster(self.filePath, i, identity=self.identity) for i in range(self.countPages())]
+        else:
+            rasters = [page.image if isinstance(page.image, PageRaster) else None for page in pages]
+        while rasters and (rasters[-1] is None or rasters[-1].isRendered(tier)):  # Renders no further than needed
+            rasters.pop()
+        if not rasters:
+            return
+        with instrumentation.span('File2PDFConverter.prerenderPages', file=self.filePath, tier=tier):
+            images = renderer.renderPages(self.filePath, 0, len(rasters)-1, tier)
+            try:
+                for pageNumber, image in images:
+                    if isCancelled():
+                        return
+                    if rasters[pageNumber] is not None:
+                        rasters[pageNumber].storeImage(image, tier)
+            finally:
+                images.close()  # Stops workers if cancelled
+
+
+class CancellableStream():
     """
-    Object that converts a PDF object into an actual pdf file.
+    Write only wrapper of a binary stream that raises ExportCancelled on the next write once isCancelled returns true.
 
     Attributes
     ---
+    stream : io.BufferedWriter
+        Stream being wrapped.
+    isCancelled : function
+        Function with no arguments returning true once writing should stop.
+
+    """
+    def __init__(self, stream, isCancelled):
+        self.stream = stream
+        self.isCancelled = isCancelled
+
+    def write(self, data):
+        if self.isCancelled():
+            raise(ExportCancelled('Export was cancelled.'))
+        return(self.stream.write(data))
+
+    def tell(self):
+        return(self.stream.tell())
+
+
+# IncrementalPDFWriter copies objects through internals of PyPDF2 1.26, such as the raw data of streams and the
+# references of pages, so other versions of PyPDF2 are written with PlainPDFWriter instead.
+INCREMENTAL_WRITER_SUPPORTED = PyPDF2.__version__.startswith('1.26.')
+
+
+class IncrementalPDFWriter():
+    """
+    Writer of a pdf file that writes each page, with every object it references not written yet, as soon as it is
+    given, optionally writing identical objects only once.
+
+    Attributes
+    ---
+    stream : CancellableStream
+        Stream pdf file is written to.
+    deduplicate : bool
+        If true, identical objects are written once.
+    bytesSaved : int
+        Number of bytes fewer written than without deduplication so far.
+    pageObjects : list <PyPDF2.pdf.PageObject>
+        Pages to write, in order.
+    pageNumbers : list <int>
+        Object numbers of pages in output, in order.
+    offsets : list <int>
+        Offsets in stream of objects by object number minus one, None until written.
+    written : dict
+        Object numbers in output of source objects written, and of pages, by tuple of id of their reader, generation
+        and object number.
+    inProgress : dict
+        Object numbers of source objects being copied by their key in written, None until one is needed because
+        an object they reference refers back to them.
+    digests : dict
+        Object numbers of objects that can be merged by sha256 digest of their bytes.
+    readers : dict
+        Tuples of reader to read objects through and lock to hold while reading or None, by id of reader of
+        references.
+    sources : dict
+        Ids of source readers by id of their private readers, so objects read through either have the same key.
+
+    """
+    def __init__(self, stream, pageObjects, deduplicate=True):
+        self.stream = stream
+        self.deduplicate = deduplicate
+        self.bytesSaved = 0
+        self.pageObjects = pageObjects
+        self.offsets = []
+        self.written = {}
+        self.inProgress = {}
+        self.digests = {}
+        self.readers = {}
+        self.sources = {}
+        self.rootNumber = self._reserveNumber()
+        self.pagesNumber = self._reserveNumber()
+        self.pageNumbers = [self._reserveNumber() for pageObject in pageObjects]
+        for pageObject, number in zip(pageObjects, self.pageNumbers):
+            if pageObject.indirectRef is not None:  # References to a page written twice point at its first copy
+                self.written.setdefault(self._getKey(pageObject.indirectRef), number)
+        self.stream.write(b'%PDF-1.3\n')
+
+    def _getKey(self, reference):
+        return((self.sources.get(id(reference.pdf), id(reference.pdf)), reference.generation, reference.idnum))
+
+    def _getReader(self, reference):
+        """
+        Returns tuple of reader to read object of reference through and lock to hold while reading or None.
+
+        """
+        if id(reference.pdf) not in self.readers:
+            privateReader = readerPool.openPrivateReader(reference.pdf)
+            if privateReader is None:
+                self.readers[id(reference.pdf)] = (reference.pdf, readerPool.getReadLock(reference.pdf))
+            else:
+                self.readers[id(reference.pdf)] = (privateReader, None)
+                self.readers[id(privateReader)] = (privateReader, None)
+                self.sources[id(privateReader)] = id(reference.pdf)
+        return(self.readers[id(reference.pdf)])
+
+    def _getObject(self, reference):
+        reader, lock = self._getReader(reference)
+        if lock is None:
+            return(reader.getObject(reference))
+        with lock:
+            return(reader.getObject(reference))
+
+    def _release(self, reference):
+        """
+        Drops object of reference from cache of its private reader once it is written.
+
+        """
+        reader, lock = self._getReader(reference)
+        if lock is None:
+            reader.resolvedObjects.pop((reference.generation, reference.idnum), None)
+
+    def _reserveNumber(self):
+        self.offsets.append(None)
+        return(len(self.offsets))
+
+    def _writeObject(self, number, data):
+        self.offsets[number-1] = self.stream.tell()
+        self.stream.write('{} 0 obj\n'.format(number).encode())
+        self.stream.write(data)
+        self.stream.write(b'\nendobj\n')
+
+    @staticmethod
+    def _serialize(obj):
+        buffer = io.BytesIO()
+        obj.writeToStream(buffer, None)
+        return(buffer.getvalue())
+
+    @staticmethod
+    def _isMergeable(obj):
+        if isinstance(obj, PyPDF2.generic.StreamObject):
+            return(True)
+        elif isinstance(obj, PyPDF2.generic.DictionaryObject):
+            if obj.get('/Type') in ('/Page', '/Pages', '/Catalog', '/Annot'):
+                return(False)
+            # Annotations, whose /Type is optional but /Rect is not, and form fields are identified by their object
+            return(not any(key in obj for key in ('/Rect', '/FT', '/T', '/Kids')))
+        return(isinstance(obj, PyPDF2.generic.ArrayObject))
+
+    def _copy(self, data):
+        """
+        Returns copy of direct object data with references to source objects replaced by references to their copies
+        in output, writing those not written yet first.
+
+        """
+        if isinstance(data, PyPDF2.generic.IndirectObject):
+            number = self._writeReference(data)
+            if number is None:
+                return(PyPDF2.generic.NullObject())
+            return(PyPDF2.generic.IndirectObject(number, 0, None))
+        elif isinstance(data, PyPDF2.generic.StreamObject):
+            if isinstance(data, PyPDF2.generic.EncodedStreamObject):
+                copy = PyPDF2.generic.EncodedStreamObject()
+            else:
+                copy = PyPDF2.generic.DecodedStreamObject()
+            copy._data = data._data
+            copy.update((key, self._copy(value)) for key, value in data.items() if key != '/Length')
+            return(copy)
+        elif isinstance(data, PyPDF2.generic.DictionaryObject):
+            copy = PyPDF2.generic.DictionaryObject()
+            copy.update((key, self._copy(value)) for key, value in data.items())
+            return(copy)
+        elif isinstance(data, PyPDF2.generic.ArrayObject):
+            return(PyPDF2.generic.ArrayObject(self._copy(value) for value in data))
+        return(data)
+
+    def _writeReference(self, reference):
+        """
+        Returns object number in output of source object reference points to, writing a copy of it first if not
+        written yet, or None if it is a page not being written.
+
+        """
+        key = self._getKey(reference)
+        if key in self.written:
+            return(self.written[key])
+        elif key in self.inProgress:  # Reference cycle, numbered now and written once its copy is done
+            if self.inProgress[key] is None:
+                self.inProgress[key] = self._reserveNumber()
+            return(self.inProgress[key])
+        obj = self._getObject(reference)
+        if isinstance(obj, PyPDF2.generic.DictionaryObject) and obj.get('/Type') in ('/Page', '/Pages'):
+            self._release(reference)
+            return(None)
+        self.inProgress[key] = None
+        try:
+            data = self._serialize(self._copy(obj))
+        finally:
+            number = self.inProgress.pop(key)
+            self._release(reference)
+        if number is None and self.deduplicate and self._isMergeable(obj):
+            digest = hashlib.sha256(data).digest()
+            if digest in self.digests:
+                self.bytesSaved += len(data)
+                self.written[key] = self.digests[digest]
+                return(self.digests[digest])
+            number = self._reserveNumber()
+            self.digests[digest] = number
+        elif number is None:
+            number = self._reserveNumber()
+        self._writeObject(number, data)
+        self.written[key] = number
+        return(number)
+
+    def writePage(self, i):
+        """
+        Writes page i of pageObjects and every object it references that was not written yet.
+
+        """
+        copy = PyPDF2.generic.DictionaryObject()
+        copy.update((key, self._copy(value)) for key, value in self.pageObjects[i].items() if key != '/Parent')
+        copy[PyPDF2.generic.NameObject('/Parent')] = PyPDF2.generic.IndirectObject(self.pagesNumber, 0, None)
+        self._writeObject(self.pageNumbers[i], self._serialize(copy))
+
+    def finish(self):
+        """
+        Writes page tree, catalog, cross reference table and trailer once all pages were written.
+
+        """
+        NameObject = PyPDF2.generic.NameObject
+        pages = PyPDF2.generic.DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Count'): PyPDF2.generic.NumberObject(len(self.pageNumbers)),
+            NameObject('/Kids'): PyPDF2.generic.ArrayObject(PyPDF2.generic.IndirectObject(number, 0, None)
+                                                             for number in self.pageNumbers)})
+        self._writeObject(self.pagesNumber, self._serialize(pages))
+        root = PyPDF2.generic.DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): PyPDF2.generic.IndirectObject(self.pagesNumber, 0, None)})
+        self._writeObject(self.rootNumber, self._serialize(root))
+        infoNumber = self._reserveNumber()
+        info = PyPDF2.generic.DictionaryObject({
+            NameObject('/Producer'): PyPDF2.generic.createStringObject('PyPDF2')})
+        self._writeObject(infoNumber, self._serialize(info))
+        xrefOffset = self.stream.tell()
+        self.stream.write('xref\n0 {}\n{:010d} 65535 f \n'.format(len(self.offsets)+1, 0).encode())
+        for offset in self.offsets:
+            self.stream.write('{:010d} 00000 n \n'.format(offset).encode())
+        trailer = PyPDF2.generic.DictionaryObject({
+            NameObject('/Size'): PyPDF2.generic.NumberObject(len(self.offsets)+1),
+            NameObject('/Root'): PyPDF2.generic.IndirectObject(self.rootNumber, 0, None),
+            NameObject('/Info'): PyPDF2.generic.IndirectObject(infoNumber, 0, None)})
+        self.stream.write(b'trailer\n' + self._serialize(trailer))
+        self.stream.write('\nstartxref\n{}\n%%EOF\n'.format(xrefOffset).encode())
+
+
+class PlainPDFWriter():
+    """
+    Writer with the methods of IncrementalPDFWriter that adds pages to a PyPDF2.PdfFileWriter and writes them all
+    once finished, for versions of PyPDF2 IncrementalPDFWriter does not support.
+
+    Attributes
+    ---
+    stream : CancellableStream
+        Stream pdf file is written to.
+    pageObjects : list <PyPDF2.pdf.PageObject>
+        Pages to write, in order.
     writer : PyPDF2.PdfFileWriter
-        Object that actually extracts out pdf.
+        Writer pages are added to.
+    readers : dict
+        Tuples of private reader and dict of page numbers by id of page, by id of source reader.
+    bytesSaved : int
+        Always 0.
 
     """
-    def __init__(self, pdf):
+    def __init__(self, stream, pageObjects, deduplicate=True):
+        self.stream = stream
+        self.pageObjects = pageObjects
         self.writer = PyPDF2.PdfFileWriter()
-        for page in pdf:
-            self.writer.addPage(page.getPageObject())
+        self.readers = {}
+        self.bytesSaved = 0
+
+    def _getPrivatePage(self, pageObject):
+        """
+        Returns page of private reader of source file of pageObject that is the same page.
 
-    def extractToFilePath(self, filePath):
         """
-        Extracts PDF that is loaded in writer, into a pdf file at filePath.
+        source = pageObject.pdf
+        if id(source) not in self.readers:
+            reader = readerPool.openPrivateReader(source)
+            if reader is None:
+                with readerPool.getReadLock(source):
+                    source.stream.seek(0)
+                    reader = PyPDF2.PdfFileReader(io.BytesIO(source.stream.read()))
+            pageNumbers = {id(source.getPage(i)): i for i in range(source.getNumPages())}
+            self.readers[id(source)] = (reader, pageNumbers)
+        reader, pageNumbers = self.readers[id(source)]
+        return(reader.getPage(pageNumbers[id(pageObject)]))
+
+    def writePage(self, i):
+        self.writer.addPage(self._getPrivatePage(self.pageObjects[i]))
+
+    def finish(self):
+        self.writer.write(self.stream)
+
+
+def createPartFile(filePath):
+    """
+    Returns tuple of file descriptor and path of a new file next to filePath to write it to before renaming it there,
+    with the permissions of the file at filePath, or those open gives a new file if there is none.
+
+    """
+    directory, name = os.path.split(os.path.abspath(filePath))
+    while True:
+        partPath = os.path.join(directory, '{}.{}.part'.format(name, os.urandom(4).hex()))
+        try:
+            fileDescriptor = os.open(partPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            break
+        except(FileExistsError):
+            continue
+    try:
+        os.chmod(partPath, os.stat(filePath).st_mode & 0o7777)
+    except(FileNotFoundError):
+        pass
+    return((fileDescriptor, partPath))
+
+
+class PDF2FileConverter():
+    """
+    Object that converts a PDF object into an actual pdf file.
+
+    Attributes
+    ---
+    pdf : PDF
+        PDF to convert.
+    writer : IncrementalPDFWriter
+        Object that actually writes out pdf, created on extraction. A PlainPDFWriter if INCREMENTAL_WRITER_SUPPORTED
+        is false.
+    bufferSize : int
+        Size in bytes of write buffer of output file.
+    deduplicate : bool
+        If true, identical objects such as fonts and images shared by pages of different source files are written
+        once.
+    bytesSaved : int
+        Number of bytes deduplication saved on last extraction.
+
+    """
+    def __init__(self, pdf, bufferSize=1024*1024, deduplicate=True):
+        self.pdf = pdf
+        self.writer = None
+        self.bufferSize = bufferSize
+        self.deduplicate = deduplicate
+        self.bytesSaved = 0
+
+    def extractToFilePath(self, filePath, progressCallback=None, isCancelled=None):
+        """
+        Extracts PDF into a pdf file at filePath, writing to a temporary file that replaces filePath only once complete.
 
         Parameters
         ---
         filePath : str
             String of file path to create pdf file with.
+        progressCallback : function
+            Called with number of steps done and total steps after each page is written, and once more when file is
+            complete. There is a step per page plus one for finishing file.
+        isCancelled : function
+            Function with no arguments returning true once export should stop, checked between pages and writes.
+
+        Raises
+        ---
+        FilePathNotPDF
+            Raised if filePath does not end with a pdf extension.
+        ExportCancelled
+            Raised if isCancelled returned true before export finished.
 
         """
-        if (re.fullmatch('.*\.pdf?', filePath) is not None):
-            fileStream = open(filePath, 'wb')
-            self.writer.write(fileStream)
-            fileStream.close()
-        else:
+        if (re.fullmatch('.*\.pdf?', filePath) is None):
             raise(FilePathNotPDF('Given file path must be valid pdf file (No end slash also).'))
-
+        if progressCallback is None:
+            progressCallback = lambda done, total: None
+        if isCancelled is None:
+            isCancelled = lambda: False
+        total = self.pdf.countPages()+1
+        pageObjects = [page.getPageObject() for page in self.pdf]
+        fileDescriptor, tempPath = createPartFile(filePath)
+        try:
+            with instrumentation.span('PDF2FileConverter.write', file=filePath, pages=len(pageObjects)):
+                with os.fdopen(fileDescriptor, 'wb', buffering=self.bufferSize) as fileStream:
+                    writerClass = IncrementalPDFWriter if INCREMENTAL_WRITER_SUPPORTED else PlainPDFWriter
+                    self.writer = writerClass(CancellableStream(fileStream, isCancelled), pageObjects, self.deduplicate)
+                    for i in range(len(pageObjects)):
+                        if isCancelled():
+                            raise(ExportCancelled('Export was cancelled.'))
+                        self.writer.writePage(i)
+                        progressCallback(i+1, total)
+                    self.writer.finish()
+                    fileStream.flush()
+                    os.fsync(fileStream.fileno())
+                os.replace(tempPath, filePath)
+        except(BaseException):
+            os.remove(tempPath)
+            raise
+        self.bytesSaved = self.writer.bytesSaved
+        instrumentation.count('PDF2FileConverter.bytesSaved', self.bytesSaved)
+        progressCallback(total, total)